@@ -0,0 +1,92 @@
+"""
+bare bones blocking client speaking the Messenger framing, plus helpers for running a server under test
+"""
+import os
+import sys
+import time
+import socket
+import subprocess
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import msgpack
+
+from _api import HEADER, pack
+from _compress import FLAGS, LENGTH_MASK, inflate
+
+class Client():
+    def __init__(self, port, host='127.0.0.1', timeout=5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buf = bytearray()
+
+    def send(self, opcode, *args):
+        self.sock.sendall(pack(opcode, *args))
+
+    # block until a full message arrives. ret None if the server hung up
+    def recv(self):
+        while True:
+            if len(self._buf) >= HEADER.size:
+                word = HEADER.unpack_from(self._buf)[0]
+                end  = HEADER.size + (word & LENGTH_MASK)
+
+                if len(self._buf) >= end:
+                    payload = self._buf[HEADER.size:end]
+                    del self._buf[:end]
+
+                    # only if we asked for it, see _compress
+                    if word & FLAGS:
+                        payload = inflate(word & FLAGS, payload)
+
+                    return msgpack.unpackb(payload, raw=False)
+
+            if not (data := self.sock.recv(1 << 16)):
+                return None
+
+            self._buf += data
+
+    # send, then block for the reply
+    def call(self, opcode, *args):
+        self.send(opcode, *args)
+        return self.recv()
+
+    def close(self):
+        self.sock.close()
+
+# start main.py in the background with args, and wait until it's accepting connections. ret the Popen
+def spawn_server(port, *args):
+    proc = subprocess.Popen(
+        (sys.executable, os.path.join(SRC, 'main.py'), '-p', str(port), '-L', 'error', *map(str, args)),
+        stdout=subprocess.DEVNULL,
+    )
+
+    for _ in range(100):
+        try:
+            # hang on to the probe connection until the server goes away, so it doesn't count as a disconnect
+            proc.probe = Client(port)
+            return proc
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+
+    proc.kill()
+    raise RuntimeError(f"server on port {port} never came up")
+
+# resident memory of pid in KiB
+def rss_kib(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+def n_fds(pid):
+    return len(os.listdir(f'/proc/{pid}/fd'))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+connection setup under a burst, as after a deploy when every client reconnects at once
+
+each round, burst clients connect at the same moment and send a LIST straight away. a connection counts as set up
+once its reply comes back, which covers the backlog, accept, attach, and a first dispatch. rounds are separated by
+closing the lot, so the server also has a burst of hangups to get through before the next one
+
+run against the level triggered loop (one accept() per wakeup), the edge triggered one (accept() drained until
+EAGAIN), and the asyncio backend for reference
+"""
+import time
+import errno
+import socket
+
+from select import epoll, EPOLLIN, EPOLLOUT
+
+from _client import spawn_server, free_port, percentile
+
+from _api import OPS, pack
+
+D_OP = OPS.DIRECTORY.SERVER
+
+_LIST = pack(D_OP.LIST)
+
+# the reply to a LIST with only the startup lobby open, which is all we're waiting for
+_REPLY = len(pack(OPS.DIRECTORY.CLIENT.LOBBIES, [[0, 0, 4, False]]))
+
+# fire off burst non-blocking connects at once and drive them all from one epoll, so the client side stays cheap
+# next to the server. ret the setup time of each, and how long the whole burst took
+def _burst(port, burst):
+    ep     = epoll()
+    socks  = {}
+    began  = {}
+    setups = []
+
+    start = time.perf_counter()
+
+    for _ in range(burst):
+        sock = socket.socket()
+        sock.setblocking(False)
+
+        if (err := sock.connect_ex(('127.0.0.1', port))) not in (0, errno.EINPROGRESS):
+            raise OSError(err, errno.errorcode[err])
+
+        socks[sock.fileno()] = sock
+        began[sock.fileno()] = time.perf_counter()
+        ep.register(sock.fileno(), EPOLLOUT)
+
+    received = dict.fromkeys(socks, 0)
+
+    while len(setups) < burst:
+        for fd, event in ep.poll(5):
+            sock = socks[fd]
+
+            # connected, send the LIST and wait on the reply
+            if event & EPOLLOUT:
+                sock.send(_LIST)
+                ep.modify(fd, EPOLLIN)
+                continue
+
+            received[fd] += len(sock.recv(1 << 16))
+            if received[fd] >= _REPLY:
+                setups.append(time.perf_counter() - began[fd])
+                ep.unregister(fd)
+
+    elapsed = time.perf_counter() - start
+
+    for sock in socks.values():
+        sock.close()
+
+    ep.close()
+    return setups, elapsed
+
+def _bursts(port, burst, rounds):
+    setups  = []
+    elapsed = 0
+
+    for _ in range(rounds):
+        s, e = _burst(port, burst)
+        setups  += s
+        elapsed += e
+
+        # let the server get the hangups out of the way, they're not what's being timed
+        time.sleep(0.2)
+
+    return setups, elapsed
+
+def bench(backend, burst, rounds):
+    port = free_port()
+    proc = spawn_server(port, '-b', backend)
+
+    try:
+        setups, elapsed = _bursts(port, burst, rounds)
+
+        return {
+            'conns_per_sec':   len(setups) / elapsed,
+            'setup_usec_p50':  percentile(setups, 50) * 1e6,
+            'setup_usec_p99':  percentile(setups, 99) * 1e6,
+        }
+
+    finally:
+        proc.kill()
+        proc.wait()
+
+BENCHES = {
+    f'accept_{b}_x{n}': (lambda _b=b, _n=n: bench(_b, _n, 5))
+    for b in ('epoll', 'epoll-et', 'asyncio')
+    for n in (64, 1024)
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:24}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+epoll loop vs asyncio backend, head to head
+
+connection setup is timed from connect() until the first LIST comes back, so it covers accept, attach, and a first
+dispatch. latency is LIST round trips over already established connections
+"""
+import time
+
+from _client import Client, spawn_server, free_port, percentile
+
+from _api import OPS
+
+D_OP = OPS.DIRECTORY.SERVER
+
+def bench(backend, n_conns, rounds):
+    port = free_port()
+    proc = spawn_server(port, '-b', backend)
+
+    try:
+        start = time.perf_counter()
+
+        clients = []
+        for _ in range(n_conns):
+            c = Client(port)
+            c.call(D_OP.LIST)
+            clients.append(c)
+
+        setup = time.perf_counter() - start
+
+        rtts = []
+        for _ in range(rounds):
+            for c in clients:
+                t = time.perf_counter()
+                c.call(D_OP.LIST)
+                rtts.append(time.perf_counter() - t)
+
+        return {
+            'conns_per_sec': n_conns / setup,
+            'rtt_usec_p50':  percentile(rtts, 50) * 1e6,
+            'rtt_usec_p99':  percentile(rtts, 99) * 1e6,
+        }
+
+    finally:
+        proc.kill()
+        proc.wait()
+
+BENCHES = {
+    f'backend_{b}': (lambda _b=b: bench(_b, 200, 10))
+    for b in ('epoll', 'asyncio')
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:20}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+broadcast fan-out benchmark
+
+compares packing a message once per recipient (the old per-player send loop) against _api.broadcast, which packs
+once and hands the same frame to everyone. recipients swallow frames so only serialization and fan-out are timed
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from _api import pack, broadcast
+
+# stands in for a Messenger whose kernel buffer always has room
+class _NullMessenger():
+    def send(self, opcode, *args):
+        self.send_frame(pack(opcode, *args))
+
+    def send_frame(self, frame):
+        pass
+
+# roughly what a JOINED for a full table of long aliases looks like, scaled up to a game state sized payload
+def _payload(n_hosts):
+    return [(f"host{i}", i, -i, i & 15, i & 3) for i in range(n_hosts)]
+
+def bench(fan_out, n_recipients, n_hosts, rounds):
+    recipients = [_NullMessenger() for _ in range(n_recipients)]
+    payload = _payload(n_hosts)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fan_out(recipients, payload)
+    elapsed = time.perf_counter() - start
+
+    return {'usec_per_broadcast': elapsed / rounds * 1e6}
+
+def _per_recipient(recipients, payload):
+    for r in recipients:
+        r.send(2, payload)
+
+def _encode_once(recipients, payload):
+    broadcast(recipients, 2, payload)
+
+BENCHES = {
+    f'broadcast_{name}_r{r}_h{h}': (lambda _f=fn, _r=r, _h=h: bench(_f, _r, _h, 200))
+    for name, fn in (('per_recipient', _per_recipient), ('encode_once', _encode_once))
+    for r in (4, 64, 512)
+    for h in (10, 500)
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:36}", '  '.join(f"{k}={v:.3f}" for k, v in results.items()))
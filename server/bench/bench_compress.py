@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+bytes saved against CPU spent by frame compression, see _compress
+
+a game of random legal placements is played out on a _state.GameState, as in bench_sync, until the board's full,
+and its SNAPSHOTs at a few sizes and a SYNC are what gets compressed. each codec is timed both ways on each payload: zlib with and
+without the preset dictionary, and zstd if the zstandard package is installed
+
+the broadcast benches push one SNAPSHOT to a table's worth of recipients through _api.compress, as Messenger does,
+with and without compression negotiated. it's compressed once however many it goes to, so the cost per recipient
+falls away as they're added
+"""
+import os
+import sys
+import time
+import zlib
+import random
+import msgpack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import _compress
+
+from _api import OPS, HEADER, pack, broadcast, compress
+from _state import GameState
+from _network import Host
+
+G_C_OP = OPS.GAME.CLIENT
+
+# times each payload is compressed and inflated, to average over
+ROUNDS = 200
+
+# SNAPSHOT payloads once the board has 10 hosts, 25, and as many as it can take, by name, and a SYNC covering the
+# last 10 turns. boards fill up after a few dozen hosts, and past that nothing fits
+def _payloads(seed):
+    rng   = random.Random(seed)
+    state = GameState()
+
+    aliases = [f"player{_i}" for _i in range(4)]
+    for seat, alias in enumerate(aliases):
+        state.add_player(alias, seat=seat, away=False)
+
+    state.place(Host('origin', 0, 0, 15))
+
+    snapshots = {}
+    versions  = [state.version] # after each turn that placed anything
+
+    while True:
+        for mask in rng.sample(range(1, 16), 15):
+            if (placement := next(state.network.legal_placements(mask), None)) is not None:
+                x, y, r = placement
+                state.place(Host(f"h{len(versions)}", x, y, mask, rotation=r))
+                break
+        else:
+            break
+
+        versions.append(state.version)
+
+        if len(state.hosts) in (10, 25):
+            snapshots[f'snapshot{len(state.hosts)}'] = pack(G_C_OP.SNAPSHOT, state.version, *state.snapshot())[HEADER.size:]
+
+    snapshots['snapshot_full'] = pack(G_C_OP.SNAPSHOT, state.version, *state.snapshot())[HEADER.size:]
+
+    base = versions[-11]
+    return snapshots, pack(G_C_OP.SYNC, base, state.version, state.diff(base))[HEADER.size:]
+
+# (compress, inflate) for each codec, payload in and out
+def _codecs():
+    def zlib_plain(payload):
+        compressor = zlib.compressobj(_compress.ZLIB_LEVEL, zlib.DEFLATED, -15)
+        return compressor.compress(payload) + compressor.flush()
+
+    codecs = {
+        'zlib_nodict': (zlib_plain, lambda _p: zlib.decompress(_p, -15)),
+        'zlib':        (lambda _p: _compress.deflate(_compress.FLAG_ZLIB, _p), lambda _p: _compress.inflate(_compress.FLAG_ZLIB, _p)),
+    }
+
+    if _compress.zstandard is not None:
+        codecs['zstd'] = (lambda _p: _compress.deflate(_compress.FLAG_ZSTD, _p), lambda _p: _compress.inflate(_compress.FLAG_ZSTD, _p))
+
+    return codecs
+
+def bench_codecs(seed):
+    snapshots, sync = _payloads(seed)
+    results = {}
+
+    for name, payload in [*snapshots.items(), ('sync10', sync)]:
+        results[f'{name}_bytes'] = len(payload)
+
+        for codec, (deflate, inflate) in _codecs().items():
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                out = deflate(payload)
+            deflated = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                inflate(out)
+            inflated = time.perf_counter() - start
+
+            results[f'{name}_{codec}_bytes']        = len(out)
+            results[f'{name}_{codec}_usec']         = deflated / ROUNDS * 1e6
+            results[f'{name}_{codec}_inflate_usec'] = inflated / ROUNDS * 1e6
+
+    return results
+
+# swallows frames, after compressing them for the peer as Messenger would
+class _NullMessenger():
+    def __init__(self, codec):
+        self.codec = codec
+        self.bytes = 0
+
+    def send_frame(self, frame):
+        self.bytes += len(frame if self.codec is None else compress(frame, self.codec))
+
+# a full board's SNAPSHOT to n_recipients, which all take codec
+def bench_broadcast(n_recipients, codec, seed):
+    snapshots, _   = _payloads(seed)
+    hosts, players = msgpack.unpackb(snapshots['snapshot_full'], raw=False)[2:]
+
+    recipients = [_NullMessenger(codec) for _ in range(n_recipients)]
+
+    start = time.perf_counter()
+    for version in range(ROUNDS):
+        broadcast(recipients, G_C_OP.SNAPSHOT, version, hosts, players)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'usec_per_broadcast':  elapsed / ROUNDS * 1e6,
+        'bytes_per_recipient': recipients[0].bytes / ROUNDS,
+    }
+
+BENCHES = {
+    'compress_codecs': lambda: bench_codecs(21),
+    **{
+        f'compress_broadcast_{_c or "none"}_x{_n}': (lambda _c=_c, _n=_n: bench_broadcast(_n, _compress.negotiate([_c] if _c else None), 21))
+        for _c in (None, 'zlib')
+        for _n in (4, 100)
+    },
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:28}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
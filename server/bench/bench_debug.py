@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+cost of a dprint() call like the one Engine.process makes for every op, with debug output on and off
+
+the old _debug, which looked its caller up through inspect.stack() and always built its f-string, is kept here as the
+baseline. output goes to a StringIO either way, so this is measuring the logging and not the terminal
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from inspect import stack
+
+import _debug
+
+# _debug.dprint as it was
+def _legacy_dprint(*args, enabled=True, file=None):
+    if enabled:
+        frame = stack()[1]
+        print(f"[$][{frame.filename.rsplit('/', 1)[1][1:-3]}.{frame.function}]", *args, file=file)
+
+def _op_args():
+    return 3, 'ACK', ['alias', 'hunter2']
+
+def bench(name, n_calls):
+    out = io.StringIO()
+    sid, opcode, op_args = _op_args()
+
+    if name.startswith('legacy'):
+        enabled = name.endswith('on')
+
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            _legacy_dprint(f"[{sid}] {opcode}: {op_args}", enabled=enabled, file=out)
+        elapsed = time.perf_counter() - start
+
+    else:
+        _debug.set_sink(out, out)
+        _debug.set_level(_debug.LEVEL.DEBUG if name.endswith('on') else _debug.LEVEL.INFO)
+
+        try:
+            start = time.perf_counter()
+            for _ in range(n_calls):
+                _debug.dprint(lambda: f"[{sid}] {opcode}: {op_args}")
+            elapsed = time.perf_counter() - start
+
+        finally:
+            _debug.set_sink()
+            _debug.set_level(_debug.LEVEL.DEBUG)
+
+    return {'usec_per_call': elapsed / n_calls * 1e6}
+
+BENCHES = {
+    f'dprint_{name}': (lambda _n=name: bench(_n, 2000 if _n == 'legacy_on' else 200000))
+    for name in ('legacy_on', 'legacy_off', 'lazy_on', 'lazy_off')
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:24}", '  '.join(f"{k}={v:.3f}" for k, v in results.items()))
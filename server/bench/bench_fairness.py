@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+one client floods, another just wants to play
+
+the flooder pipelines LISTs as fast as the server will take them (and reads the replies on another thread, so it
+never trips the high water mark), while a well behaved client times LIST round trips. run once with the engine's
+queue bound, tick budget, and rate limit all effectively off, which is what draining everything every tick used to
+look like, and once with the defaults
+"""
+import time
+import socket
+import threading
+
+from _client import Client, spawn_server, free_port, percentile
+
+from _api import OPS, pack
+
+D_OP = OPS.DIRECTORY.SERVER
+
+_UNLIMITED = ('-q', 1 << 30, '-t', 1 << 30, '-r', 0)
+
+def _flood(port, stop, counts):
+    sock = socket.create_connection(('127.0.0.1', port), timeout=1)
+    burst = pack(D_OP.LIST) * 256
+
+    def drain():
+        try:
+            while (data := sock.recv(1 << 16)):
+                counts['bytes'] += len(data)
+        except OSError:
+            pass
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+
+    try:
+        while not stop.is_set():
+            sock.sendall(burst)
+            counts['sent'] += 256
+    except OSError:
+        pass
+
+    sock.close()
+
+def bench(args, rounds):
+    port = free_port()
+    proc = spawn_server(port, *args)
+
+    try:
+        victim = Client(port)
+        victim.call(D_OP.LIST)
+
+        # one reply to compare against the flooder's byte count
+        reply_size = len(pack(OPS.DIRECTORY.CLIENT.LOBBIES, [[0, 0, 4, False]]))
+
+        stop   = threading.Event()
+        counts = {'sent': 0, 'bytes': 0}
+        flooder = threading.Thread(target=_flood, args=(port, stop, counts))
+        flooder.start()
+
+        time.sleep(0.2)
+
+        start = time.perf_counter()
+        rtts  = []
+        for _ in range(rounds):
+            t = time.perf_counter()
+            victim.call(D_OP.LIST)
+            rtts.append(time.perf_counter() - t)
+
+            time.sleep(0.001)
+
+        elapsed = time.perf_counter() - start
+        served  = counts['bytes']
+
+        stop.set()
+        flooder.join()
+
+        return {
+            'victim_rtt_usec_p50':   percentile(rtts, 50) * 1e6,
+            'victim_rtt_usec_p99':   percentile(rtts, 99) * 1e6,
+            'flood_ops_per_sec':     served / reply_size / elapsed,
+        }
+
+    finally:
+        proc.kill()
+        proc.wait()
+
+BENCHES = {
+    'fairness_unlimited': lambda: bench(_UNLIMITED, 200),
+    'fairness_defaults':  lambda: bench((), 200),
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:24}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+what the host card catalog costs a game, see _hostdef
+
+decks are built and dealt as a table of players would at the start of a game. boards are played out from shuffled
+decks, each card going in one of the first few legal spots for it, and then every kind of card in the catalog is
+asked where it could go. memory is what tracemalloc sees for hosts played from the catalog's cards
+"""
+import os
+import sys
+import time
+import random
+import itertools
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from _hostdef import CATALOG, deal
+from _network import Host, Network
+
+# times each thing is done, to average over
+ROUNDS = 1000
+
+# a board of about n_hosts played out from shuffled decks, fewer if a whole deck goes by without anything fitting
+def _played(n_hosts, seed):
+    rng = random.Random(seed)
+    net = Network()
+    net.place(Host.from_def(CATALOG['Backbone'], 0, 0))
+
+    played = None
+    while len(net.hosts) < n_hosts and played != len(net.hosts):
+        played = len(net.hosts)
+
+        for card in CATALOG.deck(rng):
+            if options := list(itertools.islice(net.legal_placements(card), 32)):
+                x, y, rotation = rng.choice(options)
+                net.place(Host.from_def(card, x, y, rotation))
+
+    return net
+
+def bench_deal(n_players, hand_size, seed):
+    rng = random.Random(seed)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        deck = CATALOG.deck(rng)
+
+        for _ in range(n_players):
+            deal(deck, hand_size)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'usec_per_deal': elapsed / ROUNDS * 1e6,
+        'cards':         len(CATALOG.deck(rng)),
+    }
+
+def bench_legal(n_hosts, seed):
+    net   = _played(n_hosts, seed)
+    cards = list(CATALOG)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS // 100):
+        found = sum(len(list(net.legal_placements(_c))) for _c in cards)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'usec_per_card': elapsed / (ROUNDS // 100) / len(cards) * 1e6,
+        'hosts':         len(net.hosts),
+        'placements':    found,
+    }
+
+def bench_memory(n_hosts, seed):
+    rng   = random.Random(seed)
+    cards = [rng.choice(list(CATALOG)) for _ in range(n_hosts)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    hosts  = [Host.from_def(_c, _i, -_i, _i % 4) for _i, _c in enumerate(cards)]
+    after  = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return {
+        'bytes_per_host': (after - before) / len(hosts),
+    }
+
+BENCHES = {
+    'hostdef_deal_4x5':   lambda: bench_deal(4, 5, 25),
+    'hostdef_legal_h100': lambda: bench_legal(100, 25),
+    'hostdef_memory':     lambda: bench_memory(10000, 25),
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:20}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
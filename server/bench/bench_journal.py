@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+what journaling costs a live server, and how fast a journal replays
+
+bench_load's tables are driven through a server with and without -J, to see what recording every op does to
+throughput and latency. the journal from the recorded run is then played back through _journal.replay, which is
+the handlers on their own, with no IO or framing around them
+"""
+import os
+import time
+import tempfile
+
+from _client import spawn_server, free_port
+from bench_load import load
+
+import _debug
+import _journal
+
+def bench(backend, n_tables, concurrency, n_players, journal):
+    port = free_port()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'journal')
+        proc = spawn_server(port, '-b', backend, '-m', n_tables + 1, *(('-J', path) if journal else ()))
+
+        try:
+            results = load(port, n_tables, concurrency, n_players)
+
+            # killed as it would be in production, so only what was flushed counts
+            if journal:
+                time.sleep(_journal.FLUSH_INTERVAL * 2)
+
+        finally:
+            proc.kill()
+            proc.wait()
+
+        if not journal:
+            return results
+
+        level = _debug.get_level()
+        _debug.set_level(_debug.LEVEL.ERROR)
+
+        try:
+            _, stats = _journal.replay(path)
+        finally:
+            _debug.set_level(level)
+
+        results['journal_bytes_per_op'] = os.path.getsize(path) / stats['ops']
+        results['replay_ops_per_sec']   = stats['ops'] / stats['seconds']
+        results['diverged']             = stats['diverged']
+
+    return results
+
+BENCHES = {
+    'load_plain':    lambda: bench('epoll', 500, 50, 4, False),
+    'load_journal':  lambda: bench('epoll', 500, 50, 4, True),
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:16}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+loopback load generator
+
+drives whole tables through the lobby: one client CREATEs a lobby, every client ENTERs it and JOINs, waits for
+READY, ACKs, and waits for the game to START. many tables run at once from one asyncio loop, so the server sees
+overlapping connects and interleaved ops from lots of connections instead of one polite client at a time.
+
+reports connections and messages (both directions, as seen by the clients) per second of wall time, and round
+trip latency for every op that gets a direct reply (CREATE, ENTER, JOIN)
+
+run it as a script with a port to load a server which is already up instead of spawning one:
+
+    ./bench_load.py 1337 [tables] [concurrency] [players]
+"""
+import sys
+import time
+import asyncio
+import msgpack
+
+from _client import spawn_server, free_port, percentile
+
+from _api import OPS, HEADER, pack
+
+D_OP = OPS.DIRECTORY.SERVER
+L_OP = OPS.LOBBY.SERVER
+
+D_C_OP = OPS.DIRECTORY.CLIENT
+L_C_OP = OPS.LOBBY.CLIENT
+G_C_OP = OPS.GAME.CLIENT
+
+class _Stats():
+    def __init__(self):
+        self.conns  = 0
+        self.frames = 0
+        self.rtts   = []
+
+class _AsyncClient():
+    def __init__(self, reader, writer, stats):
+        self.reader = reader
+        self.writer = writer
+        self.stats  = stats
+
+    @classmethod
+    async def connect(cls, port, stats):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        stats.conns += 1
+
+        return cls(reader, writer, stats)
+
+    def send(self, opcode, *args):
+        self.writer.write(pack(opcode, *args))
+        self.stats.frames += 1
+
+    async def recv(self):
+        size = HEADER.unpack(await self.reader.readexactly(HEADER.size))[0]
+        self.stats.frames += 1
+
+        return msgpack.unpackb(await self.reader.readexactly(size), raw=False)
+
+    # skip messages until one with opcode shows up, ret it
+    async def expect(self, opcode):
+        while (message := await self.recv())[0] != opcode:
+            pass
+
+        return message
+
+    # send, then wait for the reply with opcode, timing the round trip
+    async def call(self, opcode, reply, *args):
+        start = time.perf_counter()
+
+        self.send(opcode, *args)
+        message = await self.expect(reply)
+
+        self.stats.rtts.append(time.perf_counter() - start)
+        return message
+
+    def close(self):
+        self.writer.close()
+
+async def _table(port, n_players, stats):
+    clients = [await _AsyncClient.connect(port, stats) for _ in range(n_players)]
+
+    try:
+        sid = (await clients[0].call(D_OP.CREATE, D_C_OP.CREATED, n_players))[1]
+
+        for c in clients:
+            await c.call(D_OP.ENTER, D_C_OP.ENTERED, sid)
+
+        # everyone in the lobby hears about every JOIN, the joiner included
+        for i, c in enumerate(clients):
+            await c.call(L_OP.JOIN, L_C_OP.JOINED, f"player{i}", None)
+
+        await asyncio.gather(*(_c.expect(L_C_OP.READY) for _c in clients))
+
+        for c in clients:
+            c.send(L_OP.ACK)
+
+        await asyncio.gather(*(_c.expect(G_C_OP.START) for _c in clients))
+
+    finally:
+        for c in clients:
+            c.close()
+
+async def _load(port, n_tables, concurrency, n_players):
+    stats = _Stats()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_table():
+        async with slots:
+            await _table(port, n_players, stats)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_table() for _ in range(n_tables)))
+
+    return stats, time.perf_counter() - start
+
+# drive n_tables tables of n_players through a server on port, at most concurrency tables at a time
+def load(port, n_tables, concurrency, n_players):
+    stats, elapsed = asyncio.run(_load(port, n_tables, concurrency, n_players))
+
+    return {
+        'conns_per_sec': stats.conns / elapsed,
+        'msgs_per_sec':  stats.frames / elapsed,
+        'rtt_usec_p50':  percentile(stats.rtts, 50) * 1e6,
+        'rtt_usec_p99':  percentile(stats.rtts, 99) * 1e6,
+    }
+
+def bench(backend, n_tables, concurrency, n_players):
+    port = free_port()
+    proc = spawn_server(port, '-b', backend, '-m', n_tables + 1)
+
+    try:
+        return load(port, n_tables, concurrency, n_players)
+
+    finally:
+        proc.kill()
+        proc.wait()
+
+BENCHES = {
+    f'load_{b}_c{c}': (lambda _b=b, _c=c: bench(_b, 200, _c, 4))
+    for b in ('epoll', 'epoll-et', 'asyncio')
+    for c in (1, 32)
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        args = [int(_a) for _a in sys.argv[1:5]]
+        port, n_tables, concurrency, n_players = args + [1337, 200, 32, 4][len(args):]
+
+        results = load(port, n_tables, concurrency, n_players)
+        print(f"load_port{port:<15}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
+        sys.exit(0)
+
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:20}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+microbenchmarks for the per-message work that isn't IO: framing a message, unframing a burst of them, and
+Engine.process dispatching them to their handlers, plus the timer wheel with a timer per connection pending.
+Host.check_connectivity lives in bench_network
+
+engine dispatch runs with fake messengers, so nothing here touches a socket
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import _debug
+import _lobby
+
+from _api import OPS, pack, unpack_frames
+from _server import Engine
+from _timers import TimerWheel
+
+D_OP = OPS.DIRECTORY.SERVER
+L_OP = OPS.LOBBY.SERVER
+
+# a JOIN, as small a message as clients send
+_MESSAGE = (L_OP.JOIN, "player0", "hunter2")
+
+# just enough of a Messenger for the engine and handlers, swallows everything sent to it
+class _FakeMessenger():
+    def __init__(self, fd):
+        self.fd   = fd
+        self.peer = ('127.0.0.1', 0)
+        self.eof  = False
+
+        self.bytes_in   = 0
+        self.bytes_out  = 0
+        self.frames_in  = 0
+        self.frames_out = 0
+
+    def fileno(self):
+        return self.fd
+
+    def send(self, opcode, *args):
+        self.send_frame(pack(opcode, *args))
+
+    def send_frame(self, frame):
+        pass
+
+def bench_pack(n_messages):
+    start = time.perf_counter()
+    for _ in range(n_messages):
+        pack(*_MESSAGE)
+    elapsed = time.perf_counter() - start
+
+    return {'usec_per_message': elapsed / n_messages * 1e6}
+
+def bench_unpack(n_messages, burst):
+    frames = pack(*_MESSAGE) * burst
+
+    start = time.perf_counter()
+    for _ in range(n_messages // burst):
+        unpack_frames(bytearray(frames))
+    elapsed = time.perf_counter() - start
+
+    return {'usec_per_message': elapsed / n_messages * 1e6}
+
+# LISTs from n_conns connections sitting in the directory, which has lobbies to list
+def bench_dispatch(n_conns, n_lobbies, n_messages):
+    level = _debug.get_level()
+    _debug.set_level(_debug.LEVEL.ERROR)
+
+    try:
+        engine = Engine()
+        for _ in range(n_lobbies):
+            engine.create_session(_lobby.init, 4, None)
+
+        for fd in range(n_conns):
+            engine.attach(_FakeMessenger(fd))
+
+        start = time.perf_counter()
+        for i in range(n_messages):
+            engine.queue(i % n_conns, D_OP.LIST, [])
+
+            # roughly what a busy loop iteration sees
+            if i % n_conns == n_conns - 1:
+                engine.process()
+                engine.state_check()
+
+        engine.process()
+        elapsed = time.perf_counter() - start
+
+    finally:
+        _debug.set_level(level)
+
+    return {'usec_per_message': elapsed / n_messages * 1e6}
+
+# schedule and cancel timers with n_pending others waiting, and ask for the next deadline as the IO loop would
+def bench_timers(n_pending, n_ops):
+    rng   = random.Random(5)
+    wheel = TimerWheel()
+
+    for _ in range(n_pending):
+        wheel.call_later(rng.uniform(1, 600), lambda: None)
+
+    delays = [rng.uniform(0, 600) for _ in range(n_ops)]
+
+    start = time.perf_counter()
+    for delay in delays:
+        wheel.call_later(delay, lambda: None).cancel()
+    scheduled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n_ops):
+        wheel.timeout()
+    polled = time.perf_counter() - start
+
+    return {'usec_per_schedule_cancel': scheduled / n_ops * 1e6, 'usec_per_timeout': polled / n_ops * 1e6}
+
+BENCHES = {
+    'pack':            lambda: bench_pack(200000),
+    'unpack_x1':       lambda: bench_unpack(200000, 1),
+    'unpack_x64':      lambda: bench_unpack(200000, 64),
+    'dispatch_list_1': lambda: bench_dispatch(64, 1, 100000),
+    'dispatch_list_8': lambda: bench_dispatch(64, 8, 100000),
+    'timers_1k':       lambda: bench_timers(1000, 100000),
+    'timers_50k':      lambda: bench_timers(50000, 100000),
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:24}", '  '.join(f"{k}={v:.3f}" for k, v in results.items()))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+game rule benchmarks for _network
+
+boards are square lattices of hosts with a little space between them, and candidates are dropped at random spots
+across the board, so most of them land on or next to something
+"""
+import os
+import sys
+import time
+import random
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from _network import Host, Network, CONN, WIDTH, HEIGHT
+
+try:
+    from _netarray import ArrayNetwork
+except ImportError:
+    ArrayNetwork = None
+
+# lattice pitch, a bit more than a card in each direction
+_PITCH = 8
+
+def _board(n_hosts, seed=0):
+    rng  = random.Random(seed)
+    side = max(1, int(n_hosts ** 0.5))
+    net  = Network()
+
+    for i in range(n_hosts):
+        net.add(Host(f"host{i}", (i % side) * _PITCH, -(i // side) * _PITCH, rng.randrange(16), rng.randrange(4)))
+
+    return net, side * _PITCH
+
+def _candidates(extent, n, seed=1):
+    rng = random.Random(seed)
+
+    return [Host("candidate", rng.randrange(-8, extent + 8), -rng.randrange(-8, extent + 8), rng.randrange(16), rng.randrange(4)) for _ in range(n)]
+
+# what validating a placement costs without an index: check against every host on the board
+def _validate_scan(net, host):
+    result = CONN.DISCONNECTED
+
+    for other in net.hosts:
+        conn = host.check_connectivity(other)
+
+        if conn == CONN.ERROR:
+            return CONN.ERROR
+
+        if conn == CONN.CONNECTED:
+            result = CONN.CONNECTED
+
+    return result
+
+def bench_validate(validate, n_hosts, n_candidates):
+    net, extent = _board(n_hosts)
+    candidates  = _candidates(extent, n_candidates)
+
+    start = time.perf_counter()
+    for host in candidates:
+        validate(net, host)
+    elapsed = time.perf_counter() - start
+
+    return {'usec_per_validate': elapsed / n_candidates * 1e6}
+
+# every candidate against the board in one batched call
+def bench_validate_batch(n_hosts, n_candidates):
+    net, extent = _board(n_hosts)
+    candidates  = _candidates(extent, n_candidates)
+    vector      = ArrayNetwork.from_network(net)
+
+    columns = (
+        [_c.origin.x for _c in candidates], [_c.origin.y for _c in candidates],
+        [_c.rotation for _c in candidates], [_c.ports for _c in candidates],
+    )
+
+    start = time.perf_counter()
+    vector.validate_many(*columns)
+    elapsed = time.perf_counter() - start
+
+    return {'usec_per_validate': elapsed / n_candidates * 1e6}
+
+# a solid block of hosts with every port open, so everything connects to its neighbours
+def _connected_board(n_hosts):
+    side = max(1, int(n_hosts ** 0.5))
+    net  = Network()
+
+    for i in range(n_hosts):
+        net.add(Host(f"host{i}", (i % side) * WIDTH, -(i // side) * HEIGHT, 15, 0))
+
+    return net
+
+# reachability and path questions a turn might ask, against a board that's only changed by one host since last turn
+def bench_paths(n_hosts, n_queries):
+    rng = random.Random(2)
+    net = _connected_board(n_hosts)
+    pairs = [(rng.choice(net.hosts), rng.choice(net.hosts)) for _ in range(n_queries)]
+
+    start = time.perf_counter()
+    for a, b in pairs:
+        net.reachable(a, b)
+    reach = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for a, b in pairs:
+        net.shortest_path(pairs[0][0], b)
+    path = time.perf_counter() - start
+
+    return {'usec_per_reachable': reach / n_queries * 1e6, 'usec_per_cached_path': path / n_queries * 1e6}
+
+# a board grown the way a game would grow it, one legal placement at a time. cards with one or two ports can
+# box a board in for good, so stick to ones with three or more
+def _grown_board(n_hosts, seed=3):
+    rng = random.Random(seed)
+    net = Network()
+    net.place(Host("host0", 0, 0, 15, 0))
+
+    while len(net.hosts) < n_hosts:
+        mask = rng.choice((7, 11, 13, 14, 15))
+
+        # the generator hands back spots oldest frontier first, so the board still sprawls rather than balls up
+        if options := list(itertools.islice(net.legal_placements(mask), 32)):
+            x, y, rotation = rng.choice(options)
+            net.place(Host(f"host{len(net.hosts)}", x, y, mask, rotation))
+
+    return net
+
+# every legal spot for a card, by trying every origin and rotation in reach of the board
+def _legal_brute(net, mask):
+    boxes  = [_h.get_hitbox() for _h in net.hosts]
+    margin = 2 * max(WIDTH, HEIGHT)
+
+    return [
+        (_x, _y, _r)
+        for _x in range(min(_b[0] for _b in boxes) - margin, max(_b[1] for _b in boxes) + margin)
+        for _y in range(min(_b[3] for _b in boxes) - margin, max(_b[2] for _b in boxes) + margin)
+        for _r in range(4)
+        if net.validate(Host("candidate", _x, _y, mask, _r)) == CONN.CONNECTED
+    ]
+
+def bench_legal(n_hosts, brute):
+    net = _grown_board(n_hosts)
+
+    start = time.perf_counter()
+    next(net.legal_placements(15), None)
+    to_first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = _legal_brute(net, 15) if brute else list(net.legal_placements(15))
+    elapsed = time.perf_counter() - start
+
+    results = {'msec_all': elapsed * 1e3, 'placements': len(found)}
+    if not brute:
+        results['msec_first'] = to_first * 1e3
+
+    return results
+
+def bench_check_connectivity(n_pairs):
+    net, extent = _board(100)
+    pairs = [(_c, net.hosts[_i % len(net.hosts)]) for _i, _c in enumerate(_candidates(extent, n_pairs))]
+
+    start = time.perf_counter()
+    for a, b in pairs:
+        a.check_connectivity(b)
+    elapsed = time.perf_counter() - start
+
+    return {'usec_per_check': elapsed / n_pairs * 1e6}
+
+BENCHES = {
+    'check_connectivity': lambda: bench_check_connectivity(20000),
+}
+for _n in (10, 100, 1000, 10000):
+    BENCHES[f'validate_scan_h{_n}']  = (lambda _n=_n: bench_validate(_validate_scan, _n, max(20, 200000 // _n)))
+    BENCHES[f'validate_index_h{_n}'] = (lambda _n=_n: bench_validate(Network.validate, _n, 2000))
+
+    BENCHES[f'paths_h{_n}'] = (lambda _n=_n: bench_paths(_n, 2000))
+
+    if _n <= 1000:
+        BENCHES[f'legal_brute_h{_n}']    = (lambda _n=_n: bench_legal(_n, True))
+        BENCHES[f'legal_frontier_h{_n}'] = (lambda _n=_n: bench_legal(_n, False))
+
+    if ArrayNetwork is not None:
+        BENCHES[f'validate_numpy_h{_n}'] = (lambda _n=_n: bench_validate_batch(_n, max(20, 2000000 // _n)))
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:24}", '  '.join(f"{k}={v:.3f}" for k, v in results.items()))
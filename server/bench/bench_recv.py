@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+pipelined receive benchmark for _api.Messenger
+
+a client writes a burst of messages back to back, then we count how many trips through recv() (read: how many
+epoll wakeups in _server.run) and how many socket syscalls it takes the server side to hand all of them back.
+the old single-step MSG_PEEK receive path is kept here as the baseline
+"""
+import os
+import sys
+import time
+import socket
+import struct
+import msgpack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from socket import MSG_PEEK
+
+from _api import Messenger
+
+# socket proxy which counts every receive syscall made through it
+class _CountingSocket():
+    def __init__(self, sock):
+        self._sock    = sock
+        self.syscalls = 0
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def setblocking(self, flag):
+        self._sock.setblocking(flag)
+
+    def recv(self, *args):
+        self.syscalls += 1
+        return self._sock.recv(*args)
+
+    def recv_into(self, *args):
+        self.syscalls += 1
+        return self._sock.recv_into(*args)
+
+# the receive path as it was before it learned to drain the socket: one step per call, at most one message
+class _LegacyMessenger():
+    def __init__(self, sock):
+        self.sock = sock
+        self._expected = 0
+        self._buffered = []
+
+    def recv(self):
+        if self._expected == 0:
+            if len(self.sock.recv(4, MSG_PEEK)) == 4:
+                self._expected = struct.unpack("!I", self.sock.recv(4))[0]
+        else:
+            data = self.sock.recv(self._expected)
+            self._expected -= len(data)
+            self._buffered.append(data)
+
+            if self._expected == 0:
+                message = msgpack.unpackb(b''.join(self._buffered), raw=False)
+                self._buffered = []
+
+                return [message]
+
+        return []
+
+def _burst(n_messages):
+    frames = []
+    for i in range(n_messages):
+        payload = msgpack.packb((i % 2, f"alias{i}", "hunter2"))
+        frames.append(struct.pack('!I', len(payload)) + payload)
+
+    return b''.join(frames)
+
+def bench(messenger_type, n_messages, rounds):
+    client, server = socket.socketpair()
+    counted = _CountingSocket(server)
+    messenger = messenger_type(counted)
+
+    burst = _burst(n_messages)
+    iterations = 0
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        client.sendall(burst)
+
+        received = 0
+        while received < n_messages:
+            iterations += 1
+            received += len(messenger.recv())
+
+    elapsed = time.perf_counter() - start
+
+    client.close()
+    server.close()
+
+    total = n_messages * rounds
+    return {
+        'syscalls_per_message':   counted.syscalls / total,
+        'iterations_per_message': iterations / total,
+        'usec_per_message':       elapsed / total * 1e6,
+    }
+
+BENCHES = {
+    f'recv_{name}_x{n}': (lambda _t=messenger_type, _n=n: bench(_t, _n, 2000))
+    for name, messenger_type in (('legacy', _LegacyMessenger), ('stream', Messenger))
+    for n in (1, 12, 64)
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:24}", '  '.join(f"{k}={v:.3f}" for k, v in results.items()))
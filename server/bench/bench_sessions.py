@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+many sessions in one process
+
+starts a server hosting a pile of idle lobbies, then has clients CREATE, ENTER, and JOIN a set of active ones and
+ping them (a repeated JOIN, answered with ALREADY_JOINED) round robin. reports what the sessions cost in memory and
+fds, how fast active ones come up, and whether round trips in active sessions notice the idle ones
+"""
+import time
+
+from _client import Client, spawn_server, free_port, rss_kib, n_fds, percentile
+
+from _api import OPS
+
+D_OP = OPS.DIRECTORY.SERVER
+L_OP = OPS.LOBBY.SERVER
+
+def bench(n_idle, n_active, rounds):
+    port = free_port()
+    proc = spawn_server(port, '-n', 2, '-l', max(n_idle, 1), '-m', n_idle + n_active + 1)
+
+    try:
+        # once this comes back, every lobby asked for at startup exists
+        proc.probe.call(D_OP.LIST)
+        idle_rss = rss_kib(proc.pid)
+
+        # bring up the active sessions
+        start = time.perf_counter()
+
+        clients = []
+        for i in range(n_active):
+            c = Client(port)
+            sid = c.call(D_OP.CREATE, 2)[1]
+            c.call(D_OP.ENTER, sid)
+            c.call(L_OP.JOIN, f"player{i}", None)
+            clients.append(c)
+
+        setup = time.perf_counter() - start
+
+        # round trips through the active sessions
+        rtts = []
+        for _ in range(rounds):
+            for c in clients:
+                t = time.perf_counter()
+                c.call(L_OP.JOIN, "again", None)
+                rtts.append(time.perf_counter() - t)
+
+        results = {
+            'rss_kib_idle':          idle_rss,
+            'rss_kib_active':        rss_kib(proc.pid),
+            'server_fds':            n_fds(proc.pid),
+            'setup_ms_per_session':  setup / max(n_active, 1) * 1e3,
+            'rtt_usec_p50':          percentile(rtts, 50) * 1e6,
+            'rtt_usec_p99':          percentile(rtts, 99) * 1e6,
+        }
+
+        for c in clients:
+            c.close()
+
+        return results
+
+    finally:
+        proc.kill()
+        proc.wait()
+
+BENCHES = {
+    f'sessions_idle{i}_active{a}': (lambda _i=i, _a=a: bench(_i, _a, 50))
+    for i, a in ((1, 10), (500, 10), (500, 200))
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:28}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+crash recovery cost: what a snapshot costs per game, and how long a restart takes to bring thousands of them back
+
+an engine is filled with games of n_hosts random legal placements each, run through lobbies as clients would with
+fake messengers. the snapshot side times encoding every session, and the fork() that's the only pause the IO loop
+sees when _snapshot.Snapshotter writes one. the restore side times _snapshot.restore into a fresh engine from a
+file written by _snapshot.write
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import _debug
+import _lobby
+import _snapshot
+
+from _api import OPS
+from _server import Engine
+from _network import Host, PORT
+
+L_OP = OPS.LOBBY.SERVER
+
+# just enough of a Messenger for the engine and handlers, swallows everything sent to it
+class _FakeMessenger():
+    def __init__(self, fd):
+        self.fd   = fd
+        self.peer = ('127.0.0.1', 0)
+        self.eof  = False
+
+        self.bytes_in   = 0
+        self.bytes_out  = 0
+        self.frames_in  = 0
+        self.frames_out = 0
+
+    def fileno(self):
+        return self.fd
+
+    def send(self, opcode, *args):
+        pass
+
+    def send_frame(self, frame):
+        pass
+
+    def pause_reading(self):
+        pass
+
+# n_games games of n_players, each with n_hosts hosts played
+def _fill(engine, n_games, n_players, n_hosts):
+    fd = 0
+
+    for _ in range(n_games):
+        session = engine.create_session(_lobby.init, n_players, None)
+        fds     = range(fd, fd + n_players)
+        fd     += n_players
+
+        for i in fds:
+            engine.attach(_FakeMessenger(i))
+            engine.route(i, session)
+            session.dispatch(L_OP.JOIN, (f"player{i}", None), session.context.get_player_by_fd(i))
+
+        session.state_check()
+
+        for i in fds:
+            session.dispatch(L_OP.ACK, (), session.context.get_player_by_fd(i))
+
+        session.state_check()
+
+        # a row of hosts, each plugged into the last. what's on the board doesn't matter here, only how much
+        for i in range(n_hosts):
+            session.context.state.place(Host(f"h{i}", 6 * i, 0, PORT.LEFT | PORT.RIGHT))
+
+def bench(n_games, n_players, n_hosts):
+    level = _debug.get_level()
+    _debug.set_level(_debug.LEVEL.ERROR)
+
+    try:
+        engine = Engine(max_sessions=n_games + 1)
+        _fill(engine, n_games, n_players, n_hosts)
+
+        start  = time.perf_counter()
+        data   = _snapshot.dump(engine)
+        dumped = time.perf_counter() - start
+
+        # the parent's side of a Snapshotter.snapshot(), the child gets straight out
+        forks = []
+        for _ in range(10):
+            start = time.perf_counter()
+            if (pid := os.fork()) == 0:
+                os._exit(0)
+            forks.append(time.perf_counter() - start)
+            os.waitpid(pid, 0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'snap')
+            _snapshot.write(engine, path)
+
+            restored = Engine(max_sessions=n_games + 1)
+            start    = time.perf_counter()
+            _snapshot.restore(restored, path)
+            elapsed  = time.perf_counter() - start
+
+        assert len(restored.sessions) == n_games
+
+    finally:
+        _debug.set_level(level)
+
+    return {
+        'dump_usec_per_game':    dumped / n_games * 1e6,
+        'bytes_per_game':        len(data) / n_games,
+        'fork_usec':             sorted(forks)[len(forks) // 2] * 1e6,
+        'restore_msec':          elapsed * 1e3,
+        'restore_usec_per_game': elapsed / n_games * 1e6,
+    }
+
+BENCHES = {
+    'snapshot_500x20':  lambda: bench(500, 4, 20),
+    'snapshot_5000x20': lambda: bench(5000, 4, 20),
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:20}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
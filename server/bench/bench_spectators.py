@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+what spectators cost the players they're watching
+
+a two player game is set up, then n_spectators WATCH it. one player hangs up and RESUMEs over and over, and each
+time the other sees the state change as an AWAY/BACK pair of SYNCs. the time to get RESUMED back, and for the other
+player to get the SYNC with them back in it, are what players would notice spectators slowing down
+
+every STALLED-th spectator never reads anything, with a small receive buffer, like a client on a bad link. the rest
+are drained from a thread, which counts what they get
+"""
+import time
+import socket
+import selectors
+import threading
+
+from _client import Client, spawn_server, free_port, percentile
+
+from _api import OPS
+
+D_OP = OPS.DIRECTORY.SERVER
+L_OP = OPS.LOBBY.SERVER
+G_OP = OPS.GAME.SERVER
+
+D_C_OP = OPS.DIRECTORY.CLIENT
+L_C_OP = OPS.LOBBY.CLIENT
+G_C_OP = OPS.GAME.CLIENT
+
+# one in this many spectators never reads
+STALLED = 10
+
+# skip messages until one with opcode shows up, ret it
+def expect(client, opcode):
+    while (message := client.recv()) is None or message[0] != opcode:
+        if message is None:
+            raise RuntimeError(f"server hung up waiting for opcode {opcode}")
+
+    return message
+
+# skip messages until a SYNC or SNAPSHOT shows up, ack it, ret it
+def sync(client):
+    while (message := client.recv())[0] not in (G_C_OP.SYNC, G_C_OP.SNAPSHOT):
+        pass
+
+    client.send(G_OP.SYNC_ACK, message[2] if message[0] == G_C_OP.SYNC else message[1])
+    return message
+
+# read everything the spectators get until stop is set, counting the bytes in received[0]
+def _drain(sockets, stop, received):
+    sel = selectors.DefaultSelector()
+    for s in sockets:
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ)
+
+    while not stop.is_set():
+        for key, _ in sel.select(0.05):
+            try:
+                data = key.fileobj.recv(1 << 16)
+            except BlockingIOError:
+                continue
+
+            received[0] += len(data)
+
+    sel.close()
+
+def bench(backend, n_spectators, n_rounds):
+    port = free_port()
+    proc = spawn_server(port, '-b', backend, '-n', 2)
+
+    players    = []
+    spectators = []
+    stop       = threading.Event()
+    reader     = None
+
+    try:
+        players = [Client(port), Client(port)]
+        sid     = players[0].call(D_OP.CREATE, 2)[1]
+
+        for i, p in enumerate(players):
+            p.call(D_OP.ENTER, sid)
+            p.send(L_OP.JOIN, f"player{i}", None)
+
+        for p in players:
+            expect(p, L_C_OP.READY)
+            p.send(L_OP.ACK)
+
+        token = expect(players[0], G_C_OP.START)[1]
+        expect(players[1], G_C_OP.START)
+
+        for p in players:
+            sync(p)
+
+        for i in range(n_spectators):
+            s = Client(port)
+
+            if i % STALLED == 0:
+                s.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+
+            assert s.call(D_OP.WATCH, sid)[0] == D_C_OP.WATCHING
+            spectators.append(s)
+
+        received = [0]
+        reader   = threading.Thread(
+            target=_drain, args=([_s.sock for _i, _s in enumerate(spectators) if _i % STALLED], stop, received)
+        )
+        reader.start()
+
+        resumes = []
+        syncs   = []
+
+        start = time.perf_counter()
+        for _ in range(n_rounds):
+            players[0].close()
+            sync(players[1])
+
+            players[0] = Client(port)
+            sent       = time.perf_counter()
+
+            assert players[0].call(D_OP.RESUME, token)[0] == D_C_OP.RESUMED
+            resumes.append(time.perf_counter() - sent)
+
+            sync(players[1])
+            syncs.append(time.perf_counter() - sent)
+
+            sync(players[0])
+
+        elapsed = time.perf_counter() - start
+
+    finally:
+        stop.set()
+        if reader is not None:
+            reader.join()
+
+        for c in players + spectators:
+            c.close()
+
+        proc.kill()
+        proc.wait()
+
+    return {
+        'rounds_per_sec':        n_rounds / elapsed,
+        'resume_usec_p50':       percentile(resumes, 50) * 1e6,
+        'resume_usec_p99':       percentile(resumes, 99) * 1e6,
+        'sync_usec_p50':         percentile(syncs, 50) * 1e6,
+        'sync_usec_p99':         percentile(syncs, 99) * 1e6,
+        'spectator_kib_per_sec': received[0] / 1024 / elapsed,
+    }
+
+BENCHES = {
+    f'spectators_{n}': (lambda _n=n: bench('epoll', _n, 500))
+    for n in (0, 100, 500)
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:16}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
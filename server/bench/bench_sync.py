@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+state sync cost per turn as a game goes on: pushing the whole state every turn vs diffing from each client's ack
+
+a game of random legal placements is played out on a _state.GameState, with a player field changing every turn
+too. each turn the state is encoded both ways for a client which acks every version, and the bytes and time spent
+are averaged over the first and last WINDOW turns. full pushes grow with the board, diffs shouldn't
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from _api import OPS, pack
+from _state import GameState
+from _network import Host
+
+G_C_OP = OPS.GAME.CLIENT
+
+# turns averaged over at each end of the game
+WINDOW = 50
+
+def bench(n_turns, n_players, seed):
+    rng   = random.Random(seed)
+    state = GameState()
+
+    aliases = [f"player{_i}" for _i in range(n_players)]
+    for seat, alias in enumerate(aliases):
+        state.add_player(alias, seat=seat, score=0)
+
+    state.place(Host('origin', 0, 0, 15))
+
+    full  = [] # (bytes, seconds) per turn
+    delta = []
+
+    for turn in range(n_turns):
+        base = state.version
+
+        # the first card in a shuffled hand that fits anywhere goes wherever it fits, and the player who made it scores
+        for mask in rng.sample(range(1, 16), 15):
+            if (placement := next(state.network.legal_placements(mask), None)) is not None:
+                x, y, r = placement
+                state.place(Host(f"h{turn}", x, y, mask, rotation=r))
+                break
+
+        alias = aliases[turn % n_players]
+        state.set_player(alias, 'score', state.players[alias]['score'] + 1)
+
+        start = time.perf_counter()
+        frame = pack(G_C_OP.SNAPSHOT, state.version, *state.snapshot())
+        full.append((len(frame), time.perf_counter() - start))
+
+        start = time.perf_counter()
+        frame = pack(G_C_OP.SYNC, base, state.version, state.diff(base))
+        delta.append((len(frame), time.perf_counter() - start))
+
+    def mean(samples, i):
+        return sum(_s[i] for _s in samples) / len(samples)
+
+    results = {'hosts': len(state.hosts)}
+    for name, samples in (('full', full), ('delta', delta)):
+        for end, window in (('early', samples[:WINDOW]), ('late', samples[-WINDOW:])):
+            results[f'{name}_bytes_per_turn_{end}'] = mean(window, 0)
+            results[f'{name}_usec_per_turn_{end}']  = mean(window, 1) * 1e6
+
+    return results
+
+BENCHES = {
+    'sync_500_turns': lambda: bench(500, 4, 21),
+}
+
+if __name__ == "__main__":
+    for name, fn in BENCHES.items():
+        results = fn()
+        print(f"{name:20}", '  '.join(f"{k}={v:.1f}" for k, v in results.items()))
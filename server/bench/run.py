@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+run the bench suite, save baselines, and check for regressions against them
+
+every bench_*.py module in this directory exposes BENCHES, a dict of name -> fn ret a dict of metric -> number.
+each bench is run repeats times and the median of each metric kept. everything runs on localhost
+
+    ./run.py [-k PATTERN] [-r REPEATS] [--save NAME] [--compare NAME] [--tolerance PCT]
+
+--save writes the results to baselines/NAME.json. --compare runs the same benches and flags every metric which got
+worse than the baseline by more than the tolerance, exiting 1 if any did. baselines are only meaningful on the
+machine they were made on
+"""
+import os
+import sys
+import json
+import getopt
+import platform
+import importlib
+
+from fnmatch import fnmatch
+from statistics import median
+
+HERE      = os.path.dirname(os.path.abspath(__file__))
+BASELINES = os.path.join(HERE, 'baselines')
+
+DEFAULT_REPEATS   = 3
+DEFAULT_TOLERANCE = 10
+
+usage = (
+    "usage: run.py [options]\n"
+    "\n"
+    "    -h  --help :: this\n"
+    "    -k  --only PATTERN :: only run benches whose module/name matches this glob, e.g. 'bench_micro/*'\n"
+    f"    -r  --repeats N :: run each bench this many times and keep the median (default {DEFAULT_REPEATS})\n"
+    "    -s  --save NAME :: save results as baseline NAME\n"
+    "    -c  --compare NAME :: compare results against baseline NAME\n"
+    f"    -t  --tolerance PCT :: how much worse than baseline a metric can get before it counts (default {DEFAULT_TOLERANCE})\n"
+)
+
+# words in a metric's name which mark it as a cost. anything that's neither a cost nor a rate (e.g. the number of
+# placements found) describes the work done rather than how well it went, and isn't compared
+_COSTS = ('usec', 'msec', 'ms', 'bytes', 'kib', 'fds', 'syscalls', 'iterations')
+
+# whether bigger numbers are better for metric, or None if it's not something to compare
+def higher_is_better(metric):
+    if metric.endswith('_per_sec'):
+        return True
+
+    if any(_w in _COSTS for _w in metric.split('_')):
+        return False
+
+    return None
+
+# every bench in every module, as '<module>/<bench>' -> fn
+def discover():
+    sys.path.insert(0, HERE)
+
+    benches = {}
+    for filename in sorted(os.listdir(HERE)):
+        if filename.startswith('bench_') and filename.endswith('.py'):
+            module = importlib.import_module(filename[:-3])
+
+            for name, fn in module.BENCHES.items():
+                benches[f"{module.__name__}/{name}"] = fn
+
+    return benches
+
+def run(benches, repeats):
+    results = {}
+
+    for name, fn in benches.items():
+        samples = [fn() for _ in range(repeats)]
+        results[name] = {_k: median(_s[_k] for _s in samples) for _k in samples[0]}
+
+        print(f"{name:40}", '  '.join(f"{k}={v:.3f}" for k, v in results[name].items()), flush=True)
+
+    return results
+
+# ret a list of (bench, metric, baseline, now, pct change for the worse) for every metric outside tolerance
+def compare(baseline, results, tolerance):
+    regressions = []
+
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+
+        for metric, now in metrics.items():
+            if (higher := higher_is_better(metric)) is None:
+                continue
+
+            if (then := baseline[name].get(metric)) is None or then == 0:
+                continue
+
+            worse = (then - now if higher else now - then) / abs(then) * 100
+            if worse > tolerance:
+                regressions.append((name, metric, then, now, worse))
+
+    return regressions
+
+def _baseline_path(name):
+    return os.path.join(BASELINES, f"{name}.json")
+
+def main():
+    pattern   = '*'
+    repeats   = DEFAULT_REPEATS
+    save      = None
+    against   = None
+    tolerance = DEFAULT_TOLERANCE
+
+    try:
+        optarg, argv = getopt.getopt(sys.argv[1:], 'hk:r:s:c:t:', ("help", "only=", "repeats=", "save=", "compare=", "tolerance="))
+    except getopt.GetoptError as e:
+        print(f'{e}\n{usage}', file=sys.stderr)
+        return 1
+
+    for opt, arg in optarg:
+        if opt in ('-h', '--help'):
+            print(usage)
+            return 0
+
+        elif opt in ('-k', '--only'):
+            pattern = arg
+
+        elif opt in ('-r', '--repeats'):
+            repeats = int(arg)
+
+        elif opt in ('-s', '--save'):
+            save = arg
+
+        elif opt in ('-c', '--compare'):
+            against = arg
+
+        elif opt in ('-t', '--tolerance'):
+            tolerance = float(arg)
+
+    # load the baseline up front, no sense running everything just to find out it doesn't exist
+    if against is not None:
+        with open(_baseline_path(against)) as f:
+            baseline = json.load(f)['results']
+
+    benches = {_n: _fn for _n, _fn in discover().items() if fnmatch(_n, pattern)}
+    results = run(benches, repeats)
+
+    if save is not None:
+        os.makedirs(BASELINES, exist_ok=True)
+
+        with open(_baseline_path(save), 'w') as f:
+            json.dump({'machine': platform.node(), 'python': platform.python_version(), 'results': results}, f, indent=4)
+
+        print(f"\nsaved baseline {save}")
+
+    if against is not None:
+        missing = sorted(set(results) - set(baseline))
+        if missing:
+            print(f"\nnot in baseline {against}: {', '.join(missing)}")
+
+        if not (regressions := compare(baseline, results, tolerance)):
+            print(f"\nno regressions against {against} beyond {tolerance:g}%")
+            return 0
+
+        print(f"\n{len(regressions)} regressions against {against} beyond {tolerance:g}%:")
+        for name, metric, then, now, worse in regressions:
+            print(f"    {name} {metric}: {then:.3f} -> {now:.3f} ({worse:+.1f}%)")
+
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+asyncio flavoured alternative to the raw epoll loop in _server.run, running on uvloop if it's installed
+
+each connection is an asyncio.Protocol doing the framing Messenger does, and looks enough like a Messenger that
+Engine and the lobby/game handlers can't tell the difference. ops are queued as data arrives, and one tick of
+process()/state_check() runs per event loop iteration which saw any
+"""
+import os
+import time
+import signal
+import asyncio
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from _api import HIGH_WATER, pack, compress, unpack_frames
+from _server import Engine, MAX_SESSIONS, MAX_QUEUED, OPS_PER_TICK, IDLE_TIMEOUT, ACCEPT_BACKLOG, STATS_INTERVAL, report_stats, start_sessions, _stop
+from _metrics import Exporter, EXPORT_INTERVAL
+
+import _journal
+import _snapshot
+from _debug import *
+
+class _Connection(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+        self.eof    = False # the peer is done sending, by shutting down its end or talking garbage. errors are dealt with by connection_lost()
+        self.codec  = None # what frames to the peer are compressed with, if anything, see _compress
+
+        self.sock      = None # set on connect
+        self.peer      = None # likewise, the address it connected from
+        self.transport = None
+
+        self._fd      = None
+        self._pending = bytearray()
+
+        # running io totals for _metrics, same as Messenger
+        self.bytes_in   = 0
+        self.bytes_out  = 0
+        self.frames_in  = 0
+        self.frames_out = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.sock      = transport.get_extra_info('socket')
+        self.peer      = transport.get_extra_info('peername')
+        self._fd       = self.sock.fileno()
+
+        self.server.engine.attach(self)
+        self.server.wake()
+
+    def data_received(self, data):
+        self._pending += data
+        self.bytes_in += len(data)
+
+        # a single read can carry any number of pipelined messages, queue as many as there's room for
+        self.server.engine.pull(self._fd)
+        self.server.wake()
+
+    # the peer may only have shut down its end, and still be waiting on answers. keep the transport open for them,
+    # the engine hangs up once it's dealt with everything sent before this, as it does for Messenger
+    def eof_received(self):
+        self.eof = True
+
+        self.server.engine.pull(self._fd)
+        self.server.wake()
+
+        return True
+
+    def connection_lost(self, exc):
+        self.closed = True
+
+        if self.server.engine.conns.get(self._fd) is self:
+            self.server.engine.detach(self._fd)
+            self.server.wake()
+
+    """
+    the Messenger interface
+    """
+    def fileno(self):
+        return self._fd
+
+    def send(self, opcode, *args):
+        self.send_frame(pack(opcode, *args))
+
+    def send_frame(self, frame):
+        # the transport gives up on a peer that's gone before connection_lost() gets to tell us, and complains about
+        # every write after that
+        if self.closed or self.transport.is_closing():
+            return
+
+        if self.codec is not None:
+            frame = compress(frame, self.codec)
+
+        self.bytes_out  += len(frame)
+        self.frames_out += 1
+
+        self.transport.write(frame)
+
+        # peer has stopped reading. don't let them hold memory or the rest of the table hostage
+        if (pending := self.transport.get_write_buffer_size()) > self.server.high_water:
+            eprint(f"fd {self._fd}: {pending} bytes pending exceeds high water mark of {self.server.high_water}, disconnecting")
+            self.close()
+
+    def pending(self):
+        return 0 if self.closed else self.transport.get_write_buffer_size()
+
+    # complete messages received so far, or at most limit of them
+    def recv(self, limit=None):
+        try:
+            messages = unpack_frames(self._pending, limit)
+        except ValueError as e:
+            dprint(lambda: f"fd {self._fd}: garbage from peer, {type(e).__name__}: {e}")
+            self.eof = True
+            return []
+
+        self.frames_in += len(messages)
+
+        return messages
+
+    def pause_reading(self):
+        if not self.closed:
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        if not self.closed:
+            self.transport.resume_reading()
+
+    # the transport flushes on its own
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.transport.abort()
+
+class _Server():
+    def __init__(self, engine, high_water):
+        self.engine     = engine
+        self.high_water = high_water
+
+        self._loop       = asyncio.get_running_loop()
+        self._tick_armed = False
+        self._timer      = None # wakes us for ops held back by the engine
+
+    # make sure a tick runs once the loop is done with the IO at hand
+    def wake(self):
+        if not self._tick_armed:
+            self._tick_armed = True
+            self._loop.call_soon(self._tick)
+
+    def _tick(self):
+        self._tick_armed = False
+        start = time.perf_counter()
+
+        # process all waiting operations, then run state-based checks
+        self.engine.process()
+        self.engine.state_check()
+
+        # the closest thing to an iteration of the epoll loop we get to see
+        self.engine.metrics.loop.observe(time.perf_counter() - start)
+
+        # a timer is coming up, or some ops are still waiting on their turn or their rate limit
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if (wait := self.engine.timeout()) is not None:
+            self._timer = self._loop.call_later(wait, self.wake)
+
+    def _report(self, stats_fd):
+        report_stats(stats_fd, self.engine.stats())
+        self._loop.call_later(STATS_INTERVAL, self._report, stats_fd)
+
+    def _export(self, exporter):
+        exporter.write()
+        self._loop.call_later(EXPORT_INTERVAL, self._export, exporter)
+
+    def _snapshot(self, snapshotter):
+        snapshotter.snapshot()
+        self._loop.call_later(_snapshot.SNAPSHOT_INTERVAL, self._snapshot, snapshotter)
+
+    def _flush(self):
+        self.engine.journal.flush()
+        self._loop.call_later(_journal.FLUSH_INTERVAL, self._flush)
+
+async def _serve(engine, sockaddr, high_water, metrics_file, admin_sock, snapshot, stats_fd, worker):
+    server = _Server(engine, high_water)
+
+    if stats_fd is not None:
+        os.set_blocking(stats_fd, False)
+        asyncio.get_running_loop().call_later(STATS_INTERVAL, server._report, stats_fd)
+
+    if snapshot is not None:
+        snapshotter = _snapshot.Snapshotter(engine, snapshot)
+        asyncio.get_running_loop().call_later(_snapshot.SNAPSHOT_INTERVAL, server._snapshot, snapshotter)
+
+    if engine.journal is not None:
+        asyncio.get_running_loop().call_later(_journal.FLUSH_INTERVAL, server._flush)
+
+    loop     = asyncio.get_running_loop()
+    exporter = Exporter(
+        engine.render_metrics,
+        _snapshot.worker_path(metrics_file, worker) if metrics_file is not None else None,
+        _snapshot.worker_path(admin_sock, worker) if admin_sock is not None else None,
+        lambda fd: loop.add_writer(fd, exporter.send, fd),
+        loop.remove_writer,
+    )
+
+    if exporter.fileno() is not None:
+        asyncio.get_running_loop().add_reader(exporter.fileno(), exporter.serve)
+
+    if metrics_file is not None:
+        asyncio.get_running_loop().call_later(EXPORT_INTERVAL, server._export, exporter)
+
+    listener = await asyncio.get_running_loop().create_server(
+        lambda: _Connection(server), *sockaddr, backlog=ACCEPT_BACKLOG, reuse_port=True
+    )
+
+    async with listener:
+        await listener.serve_forever()
+
+# same arguments and behaviour as _server.run
+def run(players, password, sockaddr, high_water=HIGH_WATER, lobbies=1, max_sessions=MAX_SESSIONS, metrics_file=None,
+        admin_sock=None, max_queued=MAX_QUEUED, ops_per_tick=OPS_PER_TICK, rate=None, burst=None,
+        idle_timeout=IDLE_TIMEOUT, snapshot=None, journal=None, stats_fd=None, worker=None):
+    iiprint(f"starting asyncio server on {sockaddr}{' with uvloop' if uvloop is not None else ''}")
+
+    signal.signal(signal.SIGTERM, _stop)
+
+    if snapshot is not None:
+        snapshot = _snapshot.worker_path(snapshot, worker)
+
+    engine = Engine(max_sessions, max_queued, ops_per_tick, rate, burst, idle_timeout)
+    start_sessions(engine, players, password, lobbies, snapshot)
+
+    if journal is not None:
+        engine.journal = _journal.Journal(engine, _snapshot.worker_path(journal, worker))
+
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    # see _server.run
+    try:
+        asyncio.run(_serve(engine, sockaddr, high_water, metrics_file, admin_sock, snapshot, stats_fd, worker))
+    finally:
+        if engine.journal is not None:
+            engine.journal.close()
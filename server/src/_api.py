@@ -2,9 +2,14 @@ import socket
 import msgpack
 import struct
 
-from socket import MSG_PEEK
+from socket import MSG_DONTWAIT
+from select import EPOLLIN, EPOLLOUT, EPOLLERR, EPOLLET, EPOLLRDHUP
 
 from _enum import Enum
+from _debug import *
+
+import _compress
+from _compress import COMPRESS_MIN, FLAGS, LENGTH_MASK
 
 """
 serverside abstr over app layer for sending/recving game events
@@ -27,16 +32,36 @@ class _OpEnum():
 def and name ALL the ops and error codes our entire API uses
 """
 OPS = _OpEnum(
+    DIRECTORY=_OpEnum(
+        CLIENT=Enum(
+            'ERROR',
+            'LOBBIES',
+            'CREATED',
+            'ENTERED',
+            'RESUMED',
+            'WATCHING',
+        ),
+
+        SERVER=Enum(
+            'LIST',
+            'CREATE',
+            'ENTER',
+            'RESUME', # token, and optionally the codecs the client takes, as for JOIN
+            'WATCH', # spectate a game in progress, see _gallery. takes codecs too
+        )
+    ),
+
     LOBBY=_OpEnum(
         CLIENT=Enum(
             'ERROR',
             'KICK',
             'JOINED',
             'READY',
+            'UNREADY',
         ),
 
         SERVER=Enum(
-            'JOIN',
+            'JOIN', # alias, password, and optionally a list of the codecs the client takes, see _compress
             'ACK',
         )
     ),
@@ -44,15 +69,32 @@ OPS = _OpEnum(
     GAME=_OpEnum(
         CLIENT=Enum(
             'START',
+            'ERROR',
+            'AWAY', # a player lost their connection, and may yet come back
+            'BACK',
+            'GONE', # a player who was away for too long
+            'SYNC', # changes to the game state since the version the client last acked, see _state
+            'SNAPSHOT', # the whole game state, for clients too far behind to diff
         ),
 
         SERVER=Enum(
-
+            'SYNC_ACK',
         )
     )
 )
 
 ERR = _OpEnum(
+    DIRECTORY=_OpEnum(
+        CLIENT=Enum(
+            'INVALID',
+            'NO_SUCH_LOBBY',
+            'LOBBY_CLOSED',
+            'TOO_MANY_LOBBIES',
+            'BAD_TOKEN',
+            'NOT_STARTED',
+        )
+    ),
+
     LOBBY=_OpEnum(
         CLIENT=Enum(
             'DENY',
@@ -61,12 +103,14 @@ ERR = _OpEnum(
             'INVALID_PASSWORD',
             'ALIAS_EMPTY',
             'ALIAS_IN_USE',
+            'INVALID',
         )
     ),
 
     GAME=_OpEnum(
         CLIENT=Enum(
-
+            'INVALID',
+            'SPECTATING', # spectators can't do that
         )
     )
 )
@@ -75,39 +119,302 @@ ERR = _OpEnum(
 socket wrapper to read and write packed "messages" in the format (opcode, *op_args)
 use nearly identically to socket obj
 """
+# size of the reusable buffer each read from the socket lands in
+RECV_SIZE = 1 << 16
+
+# default number of bytes we'll hold for a peer that isn't reading before we cut them loose
+HIGH_WATER = 1 << 20
+
+# every message on the wire is a 4 byte big endian payload length followed by the msgpack'd payload. the top bits
+# of the length flag a payload that's been compressed, see _compress
+HEADER = struct.Struct('!I')
+
+# most payload a peer may say a frame of theirs carries. clients only ever send small ops, and anything claiming to
+# be bigger is garbage, rather than something to buffer up to a gigabyte of while we wait for the rest
+MAX_FRAME = 1 << 16
+
+# a frame big enough to be worth compressing, which keeps what it compressed to. every connection it's sent to
+# taking the same codec gets the same compressed frame
+class Frame(bytes):
+    def __init__(self, data):
+        self.compressed = {} # codec flag -> frame compressed with it, or the frame itself if that didn't help
+
+# pack a message into a complete frame, length header and all, ready to go out on the wire
+def pack(opcode, *args):
+    payload = msgpack.packb((opcode,) + args)
+    frame   = HEADER.pack(len(payload)) + payload
+
+    return frame if len(payload) < COMPRESS_MIN else Frame(frame)
+
+# frame as it goes out to a peer taking codec (a flag from _compress, or None)
+def compress(frame, codec):
+    if codec is None or len(frame) < HEADER.size + COMPRESS_MIN:
+        return frame
+
+    try:
+        out = frame.compressed[codec]
+    except KeyError:
+        out = frame.compressed[codec] = _deflate(frame, codec)
+    except AttributeError:
+        # that big and not from pack(), so there's nowhere to keep what it compresses to
+        out = _deflate(frame, codec)
+
+    _compress.stats.saved += len(frame) - len(out)
+
+    return out
+
+# frame compressed with codec, or frame itself if that didn't make it any smaller
+def _deflate(frame, codec):
+    payload = _compress.deflate(codec, memoryview(frame)[HEADER.size:])
+
+    return frame if HEADER.size + len(payload) >= len(frame) else HEADER.pack(codec | len(payload)) + payload
+
+# serialize a message once and hand the same frame to every messenger not in exclude. returns the frame
+def broadcast(messengers, opcode, *args, exclude=()):
+    frame = pack(opcode, *args)
+
+    for messenger in messengers:
+        if messenger not in exclude:
+            messenger.send_frame(frame)
+
+    return frame
+
+# unpack every complete message at the head of pending (a bytearray), or at most limit of them, and drop the
+# consumed bytes from it. raises ValueError on garbage, including any header saying more than MAX_FRAME is coming
+def unpack_frames(pending, limit=None):
+    messages = []
+    offset   = 0
+
+    with memoryview(pending) as view:
+        while len(pending) - offset >= HEADER.size and (limit is None or len(messages) < limit):
+            word  = HEADER.unpack_from(pending, offset)[0]
+            start = offset + HEADER.size
+            end   = start + (word & LENGTH_MASK)
+
+            # checked before waiting on the payload, so nobody gets to make us hold on to it
+            if end - start > MAX_FRAME:
+                raise ValueError(f"frame of {end - start} bytes exceeds MAX_FRAME of {MAX_FRAME}")
+
+            # rest of the payload hasn't arrived yet
+            if end > len(pending):
+                break
+
+            # no slice of view can outlive the loop, or pending couldn't be trimmed after
+            if word & FLAGS:
+                messages.append(msgpack.unpackb(_compress.inflate(word & FLAGS, view[start:end]), raw=False))
+            else:
+                messages.append(msgpack.unpackb(view[start:end], raw=False))
+            offset = end
+
+    if offset:
+        del pending[:offset]
+
+    return messages
+
 class Messenger():
-    def __init__(self, sock):
+    # if epoll is supplied, the socket must be registered on it. we'll flip EPOLLOUT on it while output is pending.
+    # with edge set, it must be registered edge triggered (EPOLLET|EPOLLRDHUP), and we keep it that way. peer is the
+    # address accept() gave us, so nobody has to ask the kernel for it again
+    def __init__(self, sock, epoll=None, high_water=HIGH_WATER, peer=None, edge=False):
         self.sock = sock
-        self._expected = 0
-        self._buffered = []
+        self.sock.setblocking(False)
+
+        self.epoll      = epoll
+        self.high_water = high_water
+        self.peer       = peer
+        self.closed     = False
+        self.codec      = None # what frames to the peer are compressed with, if anything, see _compress
+        self.drained    = True # nothing's waiting in the kernel that epoll won't tell us about again, see recv()
+        self.eof        = False # the peer is done sending, be it by hanging up, erroring out, or talking garbage
+        self.rdhup      = False # epoll says the peer's shut down its end, so there's an EOF to read to, see recv()
+
+        # called with no args once we close, whoever asked for it. lets the engine hear about closes it didn't do
+        self.on_close = None
+
+        # what we currently want epoll to tell us about, see _update_events()
+        self._reading = True
+        self._writing = False
+        self._mode    = EPOLLET|EPOLLRDHUP if edge else 0
+
+        # recv_into() lands data in _rbuf, whatever hasn't formed a complete message yet waits in _pending
+        self._rbuf    = bytearray(RECV_SIZE)
+        self._rview   = memoryview(self._rbuf)
+        self._pending = bytearray()
+
+        # whatever the kernel wouldn't take yet, waiting on EPOLLOUT
+        self._wbuf = bytearray()
+
+        # running io totals for _metrics. outbound counts what was handed to us, whether or not it's left yet
+        self.bytes_in   = 0
+        self.bytes_out  = 0
+        self.frames_in  = 0
+        self.frames_out = 0
 
     def fileno(self):
         return self.sock.fileno()
 
     def send(self, opcode, *args):
-        payload = msgpack.packb((opcode,) + args)
+        self.send_frame(pack(opcode, *args))
+
+    # ship a frame which has already been through pack(). used to fan out one encoding to many recipients
+    def send_frame(self, frame):
+        self._write(frame if self.codec is None else compress(frame, self.codec))
+
+    # number of bytes still waiting to go out
+    def pending(self):
+        return len(self._wbuf)
+
+    # write as much waiting output as the kernel will take. call on EPOLLOUT
+    def flush(self):
+        if self.closed or not self._wbuf:
+            return
+
+        try:
+            n = self.sock.send(self._wbuf)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            dprint(lambda: f"fd {self.sock.fileno()}: send failed with {type(e).__name__}, closing")
+            self.close()
+            return
+
+        del self._wbuf[:n]
+
+        if not self._wbuf:
+            self._want_write(False)
+
+    # shut the connection down for good, dropping any unsent output
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self._wbuf  = bytearray()
+
+        if self.epoll is not None:
+            try:
+                self.epoll.unregister(self.sock.fileno())
+            except (OSError, ValueError):
+                pass
+
+        self.sock.close()
+
+        if self.on_close is not None:
+            self.on_close()
+
+    # try to ship data right away. if the kernel won't take all of it, queue the rest and wait for EPOLLOUT
+    def _write(self, data):
+        if self.closed:
+            return
+
+        self.bytes_out  += len(data)
+        self.frames_out += 1
+
+        # anything already queued has to go out first, or we'd interleave frames
+        if not self._wbuf:
+            try:
+                n = self.sock.send(data)
+            except BlockingIOError:
+                n = 0
+            except OSError as e:
+                dprint(lambda: f"fd {self.sock.fileno()}: send failed with {type(e).__name__}, closing")
+                self.close()
+                return
+
+            if n == len(data):
+                return
+
+            data = memoryview(data)[n:]
+            self._want_write(True)
+
+        self._wbuf += data
+
+        # peer has stopped reading. don't let them hold memory or the rest of the table hostage
+        if len(self._wbuf) > self.high_water:
+            eprint(f"fd {self.sock.fileno()}: {len(self._wbuf)} bytes pending exceeds high water mark of {self.high_water}, disconnecting")
+            self.close()
+
+    def _want_write(self, enable):
+        self._writing = enable
+        self._update_events()
+
+    def _update_events(self):
+        if self.epoll is not None and not self.closed:
+            self.epoll.modify(
+                self.sock.fileno(),
+                EPOLLERR|self._mode|(EPOLLIN if self._reading else 0)|(EPOLLOUT if self._writing else 0)
+            )
+
+    # stop epoll reporting input for us, leaving whatever the peer sends in the kernel's buffer (and eventually
+    # theirs). for when they've sent more than we're willing to hold
+    def pause_reading(self):
+        if self._reading:
+            self._reading = False
+            self._update_events()
+
+        # resuming re-arms epoll, which reports whatever's left then, edge triggered or not
+        self.drained = True
+
+    def resume_reading(self):
+        if not self._reading:
+            self._reading = True
+            self._update_events()
+
+    # drain all waiting data and return a list of every complete message received, which may be empty. with a limit,
+    # at most that many are returned, and the rest wait here for the next call
+    #
+    # if we stopped reading with data still in the kernel (we had a buffer's worth of messages waiting already),
+    # drained is cleared. edge triggered, epoll won't mention that data again, so it's on the caller to come back
+    def recv(self, limit=None):
+        if self.closed or limit == 0:
+            return []
+
+        # with a buffer's worth of complete frames already waiting here, leave the rest in the kernel
+        backlogged   = len(self._pending) >= RECV_SIZE and self._head_complete()
+        self.drained = False
+
+        while not backlogged:
+            try:
+                n = self.sock.recv_into(self._rview, RECV_SIZE, MSG_DONTWAIT)
+            except BlockingIOError:
+                self.drained = True
+                break
+            except OSError as e:
+                dprint(lambda: f"fd {self.sock.fileno()}: recv failed with {type(e).__name__}")
+                self.eof = self.drained = True
+                break
+
+            # nothing more to read, peer has closed its end
+            if n == 0:
+                self.eof = self.drained = True
+                break
+
+            self._pending += self._rview[:n]
+            self.bytes_in += n
 
-        # prepend length header and ship
-        self.sock.send(struct.pack('!I', len(payload)) + payload)
+            # a short read means the kernel buffer is empty, no need to spend a syscall finding out. that holds for
+            # edge triggered too, since anything arriving after it sets off a fresh edge. unless it was the peer
+            # shutting down its end, which sets off no more edges, so that's read all the way to the EOF
+            if n < RECV_SIZE and not self.rdhup:
+                self.drained = True
+                break
 
-    # receive any waiting data and return complete message if any, None otherwise
-    def recv(self):
-        if self._expected == 0:
-            # peek for length header. if present, consume it and set expected payload size
-            if len(self.sock.recv(4, MSG_PEEK)) == 4:
-                self._expected = struct.unpack("!I", self.sock.recv(4))[0]
-        else:
-            # receive up to expected waiting data and decrement expected by amount received.
-            # if expected is decremented to zero in this way, flush the internal buffer and return the unpacked message
-            data = self.sock.recv(self._expected)
-            self._expected -= len(data)
-            self._buffered.append(data)
+            # a client that never stops sending would keep us here forever. frames bigger than a buffer still make
+            # it in, a buffer per call
+            backlogged = len(self._pending) >= RECV_SIZE
 
-            if self._expected == 0:
-                message = msgpack.unpackb(b''.join(self._buffered), raw=False)
-                self._buffered = []
+        try:
+            messages = unpack_frames(self._pending, limit)
+        except ValueError as e:
+            dprint(lambda: f"fd {self.sock.fileno()}: garbage from peer, {type(e).__name__}: {e}")
+            self.eof = True
+            return []
 
-                return message
+        self.frames_in += len(messages)
 
-        return None
+        return messages
 
+    # whether the frame at the head of what we've read has arrived in full
+    def _head_complete(self):
+        pending = self._pending
+        return len(pending) >= HEADER.size and HEADER.size + (HEADER.unpack_from(pending)[0] & LENGTH_MASK) <= len(pending)
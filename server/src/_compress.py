@@ -0,0 +1,215 @@
+"""
+optional compression of big frames, negotiated per connection
+
+clients list the codecs they can take when they JOIN a lobby (or RESUME, or WATCH a game), and from then on every
+frame going their way with at least COMPRESS_MIN bytes of payload is compressed with the best of those we have too.
+a flag in the top bits of the frame's length header says which codec went over the payload, if any (see _api):
+
+    FLAG_ZLIB :: raw deflate, primed with DICTIONARY
+    FLAG_ZSTD :: zstd, with DICTIONARY as raw content. only offered if the zstandard package is installed
+
+so a client doesn't have to be told what was picked, only to take whatever it offered. frames which don't get any
+smaller go out as they were, unflagged
+
+this is the codec side only, payload in and payload out. _api decides what gets compressed, and makes sure it only
+happens once per frame however many connections it goes to
+"""
+import time
+import zlib
+import msgpack
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from _debug import *
+
+# payloads smaller than this go out as they are. under a few hundred bytes, it's more CPU than it saves on the wire
+COMPRESS_MIN = 256
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# most we'll inflate a compressed frame from a peer to, so a few bytes can't turn into a few gigabytes
+MAX_INFLATED = 1 << 20
+
+# length header bits flagging the codec a payload went through. the rest are the length of the payload as sent
+FLAG_ZLIB   = 1 << 31
+FLAG_ZSTD   = 1 << 30
+FLAGS       = FLAG_ZLIB | FLAG_ZSTD
+LENGTH_MASK = FLAG_ZSTD - 1
+
+# what game state messages are mostly made of, for both codecs to start from: host records as they come in
+# SNAPSHOTs and SYNCs, and a full table of players in the fields _game keeps for them. built, not trained, since
+# there's no corpus of real games to train on. deflate matches the most recent bytes of its window more cheaply, so
+# what's in every message goes last
+def _dictionary():
+    hosts = [[_i, f"h{_i}", (_i * 6) % 48 - 24, (_i // 8) * 4 - 16, _i % 15 + 1, _i % 4] for _i in range(64)]
+    changes = [[0, _i, f"h{_i}", (_i * 6) % 48 - 24, (_i // 8) * 4 - 16, _i % 15 + 1, _i % 4] for _i in range(16)]
+    players = {f"player{_i}": {'seat': _i, 'away': False} for _i in range(4)}
+
+    return b''.join(msgpack.packb(_p) for _p in (hosts, changes, players))
+
+DICTIONARY = _dictionary()
+
+# codec flag -> name, best first. only what we can actually do is here
+CODECS = {FLAG_ZLIB: 'zlib'}
+
+if zstandard is not None:
+    _ZSTD_DICT = zstandard.ZstdCompressionDict(DICTIONARY, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+    _zstd_compressor   = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_ZSTD_DICT)
+    _zstd_decompressor = zstandard.ZstdDecompressor(dict_data=_ZSTD_DICT)
+
+    CODECS = {FLAG_ZSTD: 'zstd', **CODECS}
+
+# running totals, for _metrics
+class _Stats():
+    def __init__(self):
+        self.frames    = 0 # payloads compressed
+        self.bytes_in  = 0 # their size before
+        self.bytes_out = 0 # and after
+        self.seconds   = 0 # spent compressing them
+        self.saved     = 0 # bytes that didn't go out on the wire, counting every send of a compressed frame
+
+stats = _Stats()
+
+# the codec flag to compress frames for a peer which can take codecs (a list of names) with, or None if we can't
+# do any of them. raises ValueError if codecs isn't a list of names
+def negotiate(codecs):
+    if codecs is None:
+        return None
+
+    if not isinstance(codecs, list) or not all(isinstance(_c, str) for _c in codecs):
+        raise ValueError(f"bad codecs {codecs!r}")
+
+    for flag, name in CODECS.items():
+        if name in codecs:
+            return flag
+
+    return None
+
+# payload compressed with codec, a flag from CODECS
+def deflate(codec, payload):
+    start = time.perf_counter()
+
+    if codec == FLAG_ZLIB:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15, zdict=DICTIONARY)
+        out = compressor.compress(payload) + compressor.flush()
+    else:
+        out = _zstd_compressor.compress(payload)
+
+    stats.frames    += 1
+    stats.bytes_in  += len(payload)
+    stats.bytes_out += len(out)
+    stats.seconds   += time.perf_counter() - start
+
+    return out
+
+# payload as it was before it was compressed with codec (any combination of FLAGS from the length header). raises
+# ValueError if it's garbage, was compressed with something we can't do, or comes to more than MAX_INFLATED
+def inflate(codec, payload):
+    if codec not in CODECS:
+        raise ValueError(f"frame compressed with unsupported codec {codec:#x}")
+
+    try:
+        if codec == FLAG_ZLIB:
+            decompressor = zlib.decompressobj(-15, zdict=DICTIONARY)
+            out = decompressor.decompress(payload, MAX_INFLATED)
+
+            if decompressor.unconsumed_tail or not decompressor.eof:
+                raise ValueError(f"compressed frame truncated, or inflates to more than {MAX_INFLATED} bytes")
+
+            return out
+
+        # zstd frames carry their size, and it'd take them at their word
+        if zstandard.frame_content_size(payload) > MAX_INFLATED:
+            raise ValueError(f"compressed frame inflates to more than {MAX_INFLATED} bytes")
+
+        return _zstd_decompressor.decompress(payload, max_output_size=MAX_INFLATED)
+
+    except (zlib.error, getattr(zstandard, 'ZstdError', zlib.error)) as e:
+        raise ValueError(f"bad compressed frame: {e}") from None
+
+"""
+unit tests, through _api's framing
+"""
+if __name__ == "__main__":
+    import os
+
+    # _api's copy of this module, not the one running as __main__, is the one keeping stats
+    import _compress
+    from _api import pack, broadcast, compress, unpack_frames, HEADER, MAX_FRAME
+
+    class _FakeMessenger():
+        def __init__(self, codec):
+            self.codec  = codec
+            self.frames = []
+
+        def send_frame(self, frame):
+            self.frames.append(compress(frame, self.codec))
+
+    # roughly a SNAPSHOT of a board with n hosts on it
+    def snapshot(n):
+        return ([[_i, f"h{_i}", _i % 13, _i // 13, _i % 15 + 1, _i % 4] for _i in range(n)], {'a': {'seat': 0, 'away': False}})
+
+    print("test 1: big frames round trip compressed, and come out smaller")
+    for codec in CODECS:
+        frame = compress(pack(6, 100, *snapshot(100)), codec)
+        word  = HEADER.unpack_from(frame)[0]
+
+        assert word & FLAGS == codec and len(frame) < len(pack(6, 100, *snapshot(100))) / 2
+        assert unpack_frames(bytearray(frame + pack(5, 1) + frame)) == [[6, 100, *snapshot(100)], [5, 1], [6, 100, *snapshot(100)]]
+
+    print("\ntest 2: small frames, incompressible ones, and peers which didn't ask go out as they are")
+    small = pack(5, 1, 2, [])
+    noise = pack(5, os.urandom(COMPRESS_MIN * 4))
+
+    assert compress(small, FLAG_ZLIB) is small and compress(noise, FLAG_ZLIB) is noise
+    assert compress(pack(6, *snapshot(100)), None) == pack(6, *snapshot(100))
+
+    print("\ntest 3: a broadcast compresses once per codec, however many it goes to")
+    before     = _compress.stats.frames
+    messengers = [_FakeMessenger(FLAG_ZLIB) for _ in range(10)] + [_FakeMessenger(None) for _ in range(10)]
+
+    frame = broadcast(messengers, 6, 100, *snapshot(100))
+    assert _compress.stats.frames == before + 1 and all(_m.frames[0] is messengers[0].frames[0] for _m in messengers[:10])
+    assert all(_m.frames[0] is frame for _m in messengers[10:])
+
+    print("\ntest 4: negotiation picks the best codec offered that we have, if any")
+    assert negotiate(None) is None and negotiate([]) is None and negotiate(['lz4']) is None
+    assert negotiate(['lz4', 'zlib']) == FLAG_ZLIB
+    assert negotiate(['zlib', 'zstd']) == (FLAG_ZSTD if zstandard is not None else FLAG_ZLIB)
+
+    for bad in ('zlib', [1], {'zlib': 1}):
+        try:
+            negotiate(bad)
+            assert False, f"{bad!r} accepted"
+        except ValueError:
+            pass
+
+    print("\ntest 5: garbage, bombs and unknown codecs from peers are refused")
+    payload = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=DICTIONARY)
+    bomb    = payload.compress(msgpack.packb([0, b'\0' * (MAX_INFLATED * 2)])) + payload.flush()
+
+    for word, payload in (
+        (FLAG_ZLIB, b'garbage'),
+        (FLAG_ZLIB, bomb),
+        (FLAG_ZLIB, deflate(FLAG_ZLIB, msgpack.packb([0, 'x' * 1000]))[:-4]),
+        (FLAGS, deflate(FLAG_ZLIB, msgpack.packb([0]))),
+    ):
+        try:
+            unpack_frames(bytearray(HEADER.pack(word | len(payload)) + payload))
+            assert False, "accepted"
+        except ValueError:
+            pass
+
+    # nor are frames claiming to be bigger than MAX_FRAME, however little of them has arrived
+    try:
+        unpack_frames(bytearray(HEADER.pack(MAX_FRAME + 1) + b'\x90'))
+        assert False, "accepted"
+    except ValueError:
+        pass
+
+    print("\nall tests successful!")
@@ -1,28 +1,194 @@
 """
 various debug shits
+
+the level can be changed at runtime with set_level(). anything below it costs a single comparison: no caller lookup,
+no formatting, no IO. for messages that are expensive to build, pass a callable (e.g. a lambda returning an f-string)
+as the only arg, and it'll only be called if the message is actually going out
+"""
+import os
+import sys
+import time
+import atexit
+import weakref
+import threading
+
+from collections import deque
+
+from _enum import Enum
+
+LEVEL = Enum(
+    'DEBUG',
+    'INFO',
+    'ERROR',
+    'NONE', # silence everything
+)
+
 """
-from sys import stderr
-from inspect import stack, getmodule
+where lines end up. the plain sink writes straight through, the buffered one queues lines and has a background thread
+write them out every so often, so the thread doing the logging never waits on IO
+"""
+class _Sink():
+    def __init__(self, out, err):
+        self.out = out
+        self.err = err
+
+    def write(self, line, error):
+        print(line, file=self.err if error else self.out)
+
+    def flush(self):
+        self.out.flush()
+        self.err.flush()
+
+    # being replaced, see set_sink()
+    def stop(self):
+        self.flush()
+
+class _BufferedSink(_Sink):
+    def __init__(self, out, err, interval):
+        super().__init__(out, err)
+
+        self.interval = interval
+        self._lines   = deque()
+        self._lock    = threading.Lock()
+        self._stopped = False
+
+        self._start()
+
+        # threads don't survive fork, so a forked child needs its own flusher. hooks can't be taken back, so this one
+        # lets go of us once we're stopped and forgotten
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: (sink := ref()) is not None and sink._forked())
+
+    def write(self, line, error):
+        self._lines.append((line, error))
+
+    def flush(self):
+        with self._lock:
+            self._write_out()
+
+    # flush one last time, and have the flusher thread finish up
+    def stop(self):
+        with self._lock:
+            self._write_out()
+            self._stopped = True
+
+    # with the lock held
+    def _write_out(self):
+        while self._lines:
+            line, error = self._lines.popleft()
+            print(line, file=self.err if error else self.out)
+
+        super().flush()
+
+    def _start(self):
+        threading.Thread(target=self._run, name="log flusher", daemon=True).start()
+
+    # in a freshly forked child. whatever was waiting is the parent's to print, and whichever thread held the lock
+    # didn't come along to let go of it
+    def _forked(self):
+        if self._stopped:
+            return
+
+        self._lines = deque()
+        self._lock  = threading.Lock()
+        self._start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
 
-DEBUG = True
+            with self._lock:
+                if self._stopped:
+                    return
+
+                self._write_out()
+
+_level = LEVEL.DEBUG
+_sink  = _Sink(sys.stdout, sys.stderr)
+
+atexit.register(lambda: _sink.flush())
+
+def set_level(level):
+    global _level
+    _level = level
+
+def get_level():
+    return _level
+
+# whether messages at level are going out. for guarding work that's more than building the message itself
+def enabled(level):
+    return level >= _level
+
+# send output to out/err (default stdout/stderr). buffered sinks write from a background thread every interval seconds
+def set_sink(out=None, err=None, buffered=False, interval=0.1):
+    global _sink
+
+    _sink.stop()
+
+    out = out if out is not None else sys.stdout
+    err = err if err is not None else sys.stderr
+    _sink = _BufferedSink(out, err, interval) if buffered else _Sink(out, err)
+
+def flush():
+    _sink.flush()
 
 def _caller_info():
-    frame = stack()[2]
-    caller_name = frame.function
-    module_name = frame.filename.rsplit('/', 1)[1][1:-3]
+    frame = sys._getframe(3)
+    module_name = frame.f_code.co_filename.rsplit('/', 1)[-1][1:-3]
+
+    return f"[{module_name}.{frame.f_code.co_name}]"
 
-    return f"[{module_name}.{caller_name}]"
+def _emit(prefix, args, error=False):
+    if len(args) == 1 and callable(args[0]):
+        args = (args[0](),)
+
+    _sink.write(' '.join((f"{prefix}{_caller_info()}", *map(str, args))), error)
 
 def dprint(*args):
-    if DEBUG:
-        print(f"[$]{_caller_info()}", *args)
+    if _level <= LEVEL.DEBUG:
+        _emit("[$]", args)
 
 def eprint(*args):
-    print(f"[!]{_caller_info()}", *args, file=stderr)
+    if _level <= LEVEL.ERROR:
+        _emit("[!]", args, error=True)
 
 def iprint(*args):
-    print(f"[*]{_caller_info()}", *args)
+    if _level <= LEVEL.INFO:
+        _emit("[*]", args)
 
 def iiprint(*args):
-    print(f"\n[***]{_caller_info()}", *args)
+    if _level <= LEVEL.INFO:
+        _emit("\n[***]", args)
+
+"""
+unit tests
+"""
+if __name__ == "__main__":
+    import tempfile
+
+    print("test 1: a forked child doesn't print what the parent had waiting")
+    with tempfile.TemporaryFile('w+') as f:
+        set_sink(out=f, buffered=True, interval=0.05)
+        iprint("before the fork")
+
+        if (pid := os.fork()) == 0:
+            time.sleep(0.3)
+            os._exit(0)
+
+        os.waitpid(pid, 0)
+        flush()
+
+        set_sink()
+
+        f.seek(0)
+        assert f.read().count("before the fork") == 1
+
+    print("\ntest 2: replaced sinks stop flushing")
+    for _ in range(3):
+        set_sink(buffered=True, interval=0.05)
+
+    set_sink()
+    time.sleep(0.2)
+    assert not any(_t.name == "log flusher" for _t in threading.enumerate())
 
+    print("\nall tests successful!")
@@ -0,0 +1,135 @@
+"""
+the first stop for every connection: list the lobbies this process is hosting, create new ones, and enter one, or
+watch a game that's already going
+"""
+
+import _lobby
+import _server
+
+from _compress import negotiate
+
+from _api import OPS as _api_OPS, ERR as _api_ERR
+C_OP  = _api_OPS.DIRECTORY.CLIENT
+C_ERR = _api_ERR.DIRECTORY.CLIENT
+S_OP  = _api_OPS.DIRECTORY.SERVER
+
+from _debug import *
+
+# biggest table a client may CREATE
+MAX_PLAYERS = 8
+
+# a connection which hasn't entered any lobby yet
+class _Visitor():
+    def __init__(self, messenger):
+        self.messenger = messenger
+        self.fd        = messenger.fileno()
+
+    # wrapper over messenger send()
+    def send(self, *args):
+        self.messenger.send(*args)
+
+class _DirectoryContext():
+    def __init__(self, engine):
+        self.engine   = engine
+        self.visitors = {} # fd -> _Visitor
+
+    # get visitor by file descriptor of the connection they own
+    def get_player_by_fd(self, fd):
+        try:
+            return self.visitors[fd]
+        except KeyError:
+            raise ValueError(f"no visitor owning fd {fd} exists") from None
+
+    # anyone is welcome here, and anyone a lobby is done with comes back here
+    def handle_inbound(self, messenger):
+        self.visitors[messenger.fileno()] = _Visitor(messenger)
+        return True
+
+    def handle_disconnect(self, fd):
+        self.visitors.pop(fd, None)
+
+def init(session):
+    session.context = _DirectoryContext(session.engine)
+    session.catch   = _server.client_catch(session, C_OP.ERROR, C_ERR.INVALID)
+
+    for i, fn in enumerate((
+        _op_list,
+        _op_create,
+        _op_enter,
+        _op_resume,
+        _op_watch,
+    )):
+        name = S_OP[i]
+        session.register(name, fn)
+
+        dprint(f"registered: {name}/{fn}")
+
+# list every lobby that's still taking players as (session id, joined, players, password required)
+def _op_list(directory, visitor):
+    visitor.send(C_OP.LOBBIES, [
+        (_s.id, *_s.context.summary()) for _s in directory.engine.sessions.values() if _s.context.is_open()
+    ])
+
+# open a new lobby. the creator still has to ENTER and JOIN it like anyone else
+def _op_create(directory, visitor, n_players, password=None):
+    if not isinstance(n_players, int) or not 1 <= n_players <= MAX_PLAYERS:
+        dprint(lambda: f"denied create from fd {visitor.fd}: bad player count {n_players}")
+        visitor.send(C_OP.ERROR, C_ERR.INVALID)
+        return
+
+    try:
+        session = directory.engine.create_session(_lobby.init, n_players, password)
+    except ValueError as e:
+        dprint(lambda: f"denied create from fd {visitor.fd}: {e}")
+        visitor.send(C_OP.ERROR, C_ERR.TOO_MANY_LOBBIES)
+        return
+
+    iprint(lambda: f"fd {visitor.fd} created lobby {session.id} for {n_players} players")
+    visitor.send(C_OP.CREATED, session.id)
+
+# move into a lobby. from here on, the connection speaks that lobby's ops
+def _op_enter(directory, visitor, sid):
+    if (session := directory.engine.sessions.get(sid)) is None:
+        visitor.send(C_OP.ERROR, C_ERR.NO_SUCH_LOBBY)
+        return
+
+    if not session.context.is_open():
+        visitor.send(C_OP.ERROR, C_ERR.LOBBY_CLOSED)
+        return
+
+    # lobby may still turn them away, in which case they stay here
+    if directory.engine.route(visitor.fd, session):
+        del directory.visitors[visitor.fd]
+        visitor.send(C_OP.ENTERED, sid)
+
+# pick up a game where we left off, with the token it handed us at START. a new connection, so the compression it
+# takes is asked all over again, as for JOIN
+def _op_resume(directory, visitor, token, codecs=None):
+    codec = negotiate(codecs)
+
+    if not directory.engine.resume(visitor.fd, token):
+        dprint(lambda: f"denied resume from fd {visitor.fd}: bad or expired token")
+        visitor.send(C_OP.ERROR, C_ERR.BAD_TOKEN)
+        return
+
+    del directory.visitors[visitor.fd]
+    visitor.messenger.codec = codec
+    visitor.send(C_OP.RESUMED, directory.engine.routes[visitor.fd].id)
+
+# spectate a game in progress. from here on, the connection gets the game's updates, and can't do anything else.
+# codecs as for JOIN
+def _op_watch(directory, visitor, sid, codecs=None):
+    codec = negotiate(codecs)
+
+    if (session := directory.engine.sessions.get(sid)) is None:
+        visitor.send(C_OP.ERROR, C_ERR.NO_SUCH_LOBBY)
+        return
+
+    if (gallery := session.context.gallery()) is None:
+        visitor.send(C_OP.ERROR, C_ERR.NOT_STARTED)
+        return
+
+    if directory.engine.route(visitor.fd, gallery):
+        del directory.visitors[visitor.fd]
+        visitor.messenger.codec = codec
+        visitor.send(C_OP.WATCHING, sid)
@@ -0,0 +1,315 @@
+"""
+spectators: read-only connections watching a game, in any number, without the players paying for it
+
+a game's spectators get a session of their own (sharing the game's id), set up the first time anyone asks to
+watch it through the directory's WATCH. they speak the game's protocol, but every op a player could send is
+refused, bar SYNC_ACK, which is accepted and ignored
+
+players hear about every change as soon as the tick it happened on is over (see _game). spectators are a tier
+down: every SPECTATOR_INTERVAL, whatever changed since last time is folded into one SYNC, encoded once, and the
+same frame goes out to every spectator. newcomers get a SNAPSHOT to start from, likewise encoded once however many
+turn up at a time
+
+a spectator with more than SPECTATOR_BACKLOG bytes waiting to go out is skipped, rather than queueing up more it
+can't take. once it drains it's brought back up to date with a SNAPSHOT, so whatever it missed costs one frame,
+however much it was. spectators which stay behind for longer than SPECTATOR_PATIENCE are dropped
+"""
+import _server
+
+from _api import pack
+from _api import OPS as _api_OPS, ERR as _api_ERR
+C_OP  = _api_OPS.GAME.CLIENT
+C_ERR = _api_ERR.GAME.CLIENT
+S_OP  = _api_OPS.GAME.SERVER
+
+from _debug import *
+
+# seconds between updates to spectators
+SPECTATOR_INTERVAL = 0.1
+
+# bytes a spectator can have waiting to go out before it's skipped
+SPECTATOR_BACKLOG = 1 << 16
+
+# seconds a spectator can stay behind before it's dropped
+SPECTATOR_PATIENCE = 10
+
+class _Spectator():
+    def __init__(self, messenger):
+        self.messenger = messenger
+        self.fd        = messenger.fileno()
+
+        self.behind = None # when it last fell behind, while it's still behind
+
+    # wrapper over messenger send()
+    def send(self, *args):
+        self.messenger.send(*args)
+
+class _GalleryContext():
+    def __init__(self, game, session):
+        self.game    = game # the _GameContext being watched
+        self.session = session
+
+        self.spectators = {} # fd -> _Spectator
+        self.stale      = set() # spectators who need a SNAPSHOT before anything else
+
+        self.version = game.state.version # version every spectator not in stale is on
+        self._timer  = None # running while anyone's watching
+
+    def get_player_by_fd(self, fd):
+        try:
+            return self.spectators[fd]
+        except KeyError:
+            raise ValueError(f"no spectator owning fd {fd} exists") from None
+
+    def handle_inbound(self, messenger):
+        spectator = self.spectators[messenger.fileno()] = _Spectator(messenger)
+        self.stale.add(spectator)
+
+        if self._timer is None:
+            self._timer = self.session.engine.timers.call_later(SPECTATOR_INTERVAL, self._update)
+
+        return True
+
+    def handle_disconnect(self, fd):
+        self.stale.discard(self.spectators.pop(fd))
+
+        if not self.spectators:
+            self._timer.cancel()
+            self._timer = None
+
+    # the game's over. there's nothing left to watch
+    def close(self):
+        engine = self.session.engine
+
+        for fd in list(self.spectators):
+            engine.drop(fd)
+
+    # bring every spectator that can take it up to date, and check back in SPECTATOR_INTERVAL
+    def _update(self):
+        engine = self.session.engine
+        self._timer = engine.timers.call_later(SPECTATOR_INTERVAL, self._update)
+
+        state   = self.game.state
+        version = state.version
+
+        if version == self.version and not self.stale:
+            return
+
+        frame    = None # everything since self.version, for everyone up to date
+        snapshot = None # the whole thing, for everyone stale
+
+        if version != self.version:
+            if (changes := state.diff(self.version)) is not None:
+                frame = pack(C_OP.SYNC, self.version, version, changes)
+            else:
+                frame = snapshot = pack(C_OP.SNAPSHOT, version, *state.snapshot())
+
+            self.version = version
+
+        now = engine.clock()
+
+        for spectator in list(self.spectators.values()):
+            messenger = spectator.messenger
+
+            if messenger.pending() > SPECTATOR_BACKLOG:
+                if spectator.behind is None:
+                    spectator.behind = now
+                    self.stale.add(spectator)
+
+                elif now - spectator.behind > SPECTATOR_PATIENCE:
+                    iprint(lambda: f"game {self.session.id}: spectator on fd {spectator.fd} can't keep up, dropping")
+                    engine.drop(spectator.fd)
+
+                continue
+
+            spectator.behind = None
+
+            if spectator in self.stale:
+                if snapshot is None:
+                    snapshot = pack(C_OP.SNAPSHOT, version, *state.snapshot())
+
+                messenger.send_frame(snapshot)
+                self.stale.discard(spectator)
+
+            elif frame is not None:
+                messenger.send_frame(frame)
+
+# set up the spectators' session for game, a _GameContext. ret the session
+def create(game):
+    session = _server.Session(game.session.id, game.session.engine)
+    session.context = _GalleryContext(game, session)
+    session.catch   = _server.client_catch(session, C_OP.ERROR, C_ERR.INVALID)
+
+    for i, name in enumerate(S_OP._keys):
+        session.register(name, _op_sync_ack if name == 'SYNC_ACK' else _op_refuse)
+
+    return session
+
+# spectators don't ack anything, everything they get is shared. clients may send it anyway, as players do
+def _op_sync_ack(gallery, spectator, *args):
+    pass
+
+def _op_refuse(gallery, spectator, *args):
+    spectator.send(C_OP.ERROR, C_ERR.SPECTATING)
+
+"""
+unit tests, on a fake clock with fake messengers
+"""
+if __name__ == "__main__":
+    import msgpack
+
+    import _game
+    import _debug
+
+    from _api import OPS, ERR, HEADER
+    from _network import Host, PORT
+
+    _debug.set_level(_debug.LEVEL.ERROR)
+
+    D_OP   = OPS.DIRECTORY.SERVER
+    D_C_OP = OPS.DIRECTORY.CLIENT
+    L_OP   = OPS.LOBBY.SERVER
+
+    class _Clock():
+        def __init__(self):
+            self.now = 1000.0
+
+        def __call__(self):
+            return self.now
+
+    class _FakeMessenger():
+        def __init__(self, fd):
+            self.fd      = fd
+            self.peer    = ('127.0.0.1', 0)
+            self.frames  = [] # every frame sent, as the objects handed over
+            self.backlog = 0 # what pending() says
+            self.eof     = False
+
+            self.bytes_in = self.bytes_out = self.frames_in = self.frames_out = 0
+
+        def fileno(self):
+            return self.fd
+
+        def send(self, opcode, *args):
+            self.send_frame(pack(opcode, *args))
+
+        def send_frame(self, frame):
+            self.frames.append(frame)
+
+        def pending(self):
+            return self.backlog
+
+        def close(self):
+            pass
+
+        # every message sent, unpacked, and forgotten
+        def take(self):
+            messages = [msgpack.unpackb(bytes(_f[HEADER.size:]), raw=False) for _f in self.frames]
+            self.frames = []
+            return messages
+
+    clock  = _Clock()
+    engine = _server.Engine(clock=clock)
+
+    # a little over SPECTATOR_INTERVAL, so each step fires exactly one update, rounding and all
+    STEP = SPECTATOR_INTERVAL * 1.1
+
+    def tick(*ops, dt=0):
+        clock.now += dt
+
+        for fd, opcode, *args in ops:
+            engine.queue(fd, opcode, args)
+
+        engine.process()
+        engine.state_check()
+
+    messengers = {}
+    def connect(fd):
+        engine.attach(messengers.setdefault(fd, _FakeMessenger(fd)))
+
+    for fd in (10, 11, 20, 21, 22):
+        connect(fd)
+
+    tick((10, D_OP.CREATE, 2, None))
+    sid = max(engine.sessions)
+
+    print("test 1: lobbies can't be watched, games can")
+    tick((20, D_OP.WATCH, sid))
+    assert messengers[20].take() == [[D_C_OP.ERROR, ERR.DIRECTORY.CLIENT.NOT_STARTED]]
+
+    tick((10, D_OP.ENTER, sid), (11, D_OP.ENTER, sid))
+    tick((10, L_OP.JOIN, 'a', None), (11, L_OP.JOIN, 'b', None))
+    tick((10, L_OP.ACK), (11, L_OP.ACK))
+    tick()
+
+    game = engine.sessions[sid].context
+    tick((20, D_OP.WATCH, sid), (21, D_OP.WATCH, sid), (22, D_OP.WATCH, sid))
+    assert messengers[20].take() == [[D_C_OP.WATCHING, sid]] and engine.routes[20] is game.gallery()
+    messengers[21].take(), messengers[22].take()
+
+    print("\ntest 2: newcomers all get the same snapshot, on the next update")
+    tick(dt=STEP)
+    assert messengers[20].frames[0] is messengers[21].frames[0] is messengers[22].frames[0]
+    assert messengers[20].take() == [[C_OP.SNAPSHOT, game.state.version, [], game.state.players]]
+
+    print("\ntest 3: changes between updates go out folded into one shared frame, players get them right away")
+    for fd in (10, 21, 22):
+        messengers[fd].take()
+
+    base = game.state.version
+    game.state.place(Host('x', 0, 0, PORT.RIGHT))
+    tick((10, S_OP.SYNC_ACK, base))
+    game.state.place(Host('y', 6, 0, PORT.LEFT | PORT.RIGHT))
+    tick((10, S_OP.SYNC_ACK, base + 1))
+
+    assert [_m[0] for _m in messengers[10].take()] == [C_OP.SYNC, C_OP.SYNC] and not messengers[21].frames
+
+    tick(dt=STEP)
+    assert messengers[21].frames[0] is messengers[22].frames[0]
+    assert messengers[21].take() == [[C_OP.SYNC, base, base + 2, [[0, 0, 'x', 0, 0, PORT.RIGHT, 0], [0, 1, 'y', 6, 0, PORT.LEFT | PORT.RIGHT, 0]]]]
+
+    # nothing's changed, nothing's sent
+    messengers[22].take()
+    tick(dt=STEP)
+    assert not messengers[22].frames
+
+    print("\ntest 4: spectators can only ack")
+    messengers[20].take()
+    tick((20, S_OP.SYNC_ACK, base + 2), (21, 99))
+    assert not messengers[20].frames and messengers[21].take() == [[C_OP.ERROR, C_ERR.INVALID]]
+
+    # negative opcodes don't index from the end of the op table
+    tick((21, -1))
+    assert messengers[21].take() == [[C_OP.ERROR, C_ERR.INVALID]]
+
+    print("\ntest 5: slow spectators are skipped, brought back with a snapshot, and dropped if they never catch up")
+    messengers[21].backlog = messengers[22].backlog = SPECTATOR_BACKLOG + 1
+
+    game.state.place(Host('z', 12, 0, PORT.LEFT | PORT.RIGHT))
+    tick(dt=STEP)
+    assert [_m[0] for _m in messengers[20].take()] == [C_OP.SYNC] and not messengers[21].frames
+
+    messengers[21].backlog = 0
+    game.state.place(Host('w', 18, 0, PORT.LEFT))
+    tick(dt=STEP)
+    assert messengers[21].take() == [[C_OP.SNAPSHOT, game.state.version, *game.state.snapshot()]]
+
+    tick(dt=SPECTATOR_PATIENCE)
+    tick(dt=STEP)
+    assert 22 not in engine.conns and 21 in engine.conns
+
+    print("\ntest 6: players and spectators can sit quiet for as long as they like, the directory can't")
+    connect(30)
+    for _ in range(3):
+        tick(dt=_server.IDLE_TIMEOUT / 2)
+
+    assert all(_fd in engine.conns for _fd in (10, 11, 20, 21)) and 30 not in engine.conns
+
+    print("\ntest 7: spectators are dropped once the game's abandoned")
+    engine.drop(10)
+    engine.drop(11)
+    tick(dt=_game.RESUME_TIMEOUT + STEP)
+
+    assert sid not in engine.sessions and 20 not in engine.conns and 21 not in engine.conns
+
+    print("\nall tests successful!")
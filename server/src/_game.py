@@ -1,7 +1,12 @@
 """
 construct game from lobby and run until completion
 """
+import _server
+import _gallery
 
+from _api import broadcast, pack
+from _state import GameState
+from _registry import Registry
 from _api import OPS as _api_OPS, ERR as _api_ERR
 C_OP  = _api_OPS.GAME.CLIENT
 C_ERR = _api_ERR.GAME.CLIENT
@@ -9,39 +14,195 @@ S_OP  = _api_OPS.GAME.SERVER
 
 from _debug import *
 
+# seconds a player who lost their connection has to come back with their token before their seat is given up
+RESUME_TIMEOUT = 120
+
 class _GameContext():
-    def __init__(self, lobbycontext):
-        self.players = lobbycontext.players
-        self.epoll   = lobbycontext.epoll
+    # players is the lobby's Registry, which carries straight over, indexes and all. state is None for a new game
+    def __init__(self, players, session, state=None):
+        self.players = players
+        self.session = session # for scheduling things on, see Session.call_later
+
+        # players whose connection dropped, by resume token. they keep their seat, alias, and whatever else the game
+        # knows about them, only the messenger is swapped out when they come back
+        self.tokens = {} # player -> their resume token
+        self.away   = {} # token -> (player, Timer giving up on them)
+
+        # the board and everyone's public fields, and how far along each player's copy of it is
+        self.state = state
+        self.acked = {} # player -> last version they acked. missing until they ack anything
+        self.sent  = {} # player -> version we last brought them up to
+
+        self._gallery = None # session for spectators, see _gallery. set up once anyone wants to watch
+
+        if state is None:
+            self.state = GameState()
+
+            for seat, player in enumerate(self.players):
+                self.state.add_player(player.alias, seat=seat, away=False)
+
+    # get player by file descriptor of the connection they own
+    def get_player_by_fd(self, fd):
+        return self.players.by_fd(fd)
+
+    # broadcast message to all players, less any in exclude. the message is only encoded once
+    def broadcast(self, opcode, *args, exclude=()):
+        broadcast((_p.messenger for _p in self.players), opcode, *args, exclude={_p.messenger for _p in exclude})
+
+    # no joining a game in progress
+    def is_open(self):
+        return False
+
+    # the session spectators go to
+    def gallery(self):
+        if self._gallery is None:
+            self._gallery = _gallery.create(self)
+
+        return self._gallery
+
+    def handle_inbound(self, messenger):
+        return False
+
+    # connection owning fd is gone. hold their seat for RESUME_TIMEOUT, and let everyone else know
+    def handle_disconnect(self, fd):
+        player = self.players.by_fd(fd)
+        self.players.remove(player)
+
+        self._hold(player)
+
+        iprint(lambda: f"game {self.session.id}: {player.alias} lost their connection")
+        self.broadcast(C_OP.AWAY, player.alias)
+        self.state.set_player(player.alias, 'away', True)
+
+    # keep player's seat for them until they resume with their token, or RESUME_TIMEOUT is up
+    def _hold(self, player):
+        token = self.tokens[player]
+
+        self.away[token] = (player, self.session.call_later(RESUME_TIMEOUT, self._give_up, token))
+        self.session.engine.resumable[token] = self.session
+
+    # someone came back with token (the engine's already checked it's ours). put them back in their seat
+    def handle_resume(self, messenger, token):
+        player, timer = self.away.pop(token)
+        timer.cancel()
+
+        player.messenger = messenger
+        player.fd        = messenger.fileno()
+
+        self.players.add(player)
+
+        # whatever we sent since their last ack may not have made it. next sync() picks up from the ack
+        self.sent.pop(player, None)
+
+        iprint(lambda: f"game {self.session.id}: {player.alias} is back")
+        self.broadcast(C_OP.BACK, player.alias, exclude=(player,))
+        self.state.set_player(player.alias, 'away', False)
+
+    def _give_up(self, token):
+        if (away := self.away.pop(token, None)) is None:
+            return
+
+        player = away[0]
+        del self.tokens[player]
+        self.session.engine.resumable.pop(token, None)
+
+        self.acked.pop(player, None)
+        self.sent.pop(player, None)
+
+        iprint(lambda: f"game {self.session.id}: {player.alias} never came back")
+        self.broadcast(C_OP.GONE, player.alias)
+
+        # nobody left to play it. free up the slot for another lobby
+        if not self.players and not self.away:
+            iiprint(f"game {self.session.id} abandoned")
+            self.session.engine.sessions.pop(self.session.id, None)
+
+            if self._gallery is not None:
+                self._gallery.context.close()
+
+    # what to bring this game back with, see _snapshot. anyone who's given up on is gone for good
+    def dump(self):
+        return ('game', [(_p.alias, _t) for _p, _t in self.tokens.items()], self.state.dump())
+
+    # bring every player's copy of the state up to date, diffing from whatever version they last acked. players
+    # on the same version share one encoded frame
+    def sync(self):
+        state   = self.state
+        version = state.version
+        frames  = {} # base version -> frame
 
-    def broadcast(self, opcode, *args):
         for player in self.players:
-            player.send(opcode, *args)
+            if self.sent.get(player) == version:
+                continue
+
+            base = self.acked.get(player)
+
+            if (frame := frames.get(base)) is None:
+                if base is None or (changes := state.diff(base)) is None:
+                    frame = pack(C_OP.SNAPSHOT, version, *state.snapshot())
+                else:
+                    frame = pack(C_OP.SYNC, base, version, changes)
+
+                frames[base] = frame
 
+            player.messenger.send_frame(frame)
+            self.sent[player] = version
 
+# push state changes out after anything that might have made some
+def _game_statecheck(session):
+    session.context.sync()
 
 """
 init game
 """
-def init(engine):
-    iiprint("initing game")
+def init(session):
+    iiprint(f"initing game {session.id}")
 
-    # clear old engine vals and assign new context object
-    engine.statecheck = None
-    engine.catch      = None
-    engine.ops        = []
-    engine.context    = _GameContext(engine.context)
+    _setup(session, _GameContext(session.context.players, session))
 
-    for i, fn in enumerate((
+    # everyone gets their own token, to get back in with if they drop
+    iprint("sending game state to players")
+    for player in session.context.players:
+        session.context.tokens[player] = token = session.engine.new_token()
+        player.send(C_OP.START, token)
+
+    session.context.sync()
+
+    iiprint(f"game {session.id} has started")
+
+# clear old session vals and assign new context object
+def _setup(session, context):
+    session.statecheck = _game_statecheck
+    session.catch      = _server.client_catch(session, C_OP.ERROR, C_ERR.INVALID)
+    session.ops        = []
+    session.context    = context
 
+    for i, fn in enumerate((
+        _op_sync_ack,
     )):
         name = S_OP[i]
-        engine.register(name, fn)
+        session.register(name, fn)
 
         dprint(f"registered: {name}/{fn}")
 
-    iprint("sending game state to players")
-    lobby.broadcast(C_OP.START)
+# bring a game back from a snapshot, see _lobby.restore. players are (player, token), none of them connected, so
+# everyone's away until they resume
+def restore(players, state, session):
+    iiprint(f"restoring game {session.id}")
+
+    _setup(session, _GameContext(Registry(), session, GameState.load(state)))
+
+    for player, token in players:
+        session.context.tokens[player] = token
+        session.context._hold(player)
+        session.context.state.set_player(player.alias, 'away', True)
+
+# the client has applied everything up to version. diffs from here on start there
+def _op_sync_ack(game, player, version):
+    if not isinstance(version, int) or not 0 <= version <= game.state.version:
+        raise ValueError(f"bad version {version!r}")
 
-    iiprint("game has started")
+    # acks for versions older than one already acked are stale, and take the client nowhere
+    if version > game.acked.get(player, -1):
+        game.acked[player] = version
 
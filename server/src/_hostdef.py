@@ -1,6 +1,155 @@
 """
 the pre-built definitions for each host in the game
+
+every kind of host card is listed in a data file, PATH, one per line: its name, which ports it has open, and how
+many copies of it go in a deck. blank lines and anything after a # are ignored. the list shipped there now is
+placeholder data, standing in until the real cards are written down
+
+each kind is loaded once into a _network.HostDef, which is shared by everything that refers to it: the catalog,
+every deck built from it, every hand dealt from those, and every Host played from a hand. decks and hands are only
+lists of defs, so building and dealing them costs the lists and nothing else
+"""
+import os
+import random
+
+from _network import PORT, hostdef
+
+from _debug import *
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hosts.txt')
+
+# port letters in the data file
+_LETTERS = {'T': PORT.TOP, 'R': PORT.RIGHT, 'B': PORT.BOTTOM, 'L': PORT.LEFT}
+
+# the port mask for letters, e.g. 'TB'. raises ValueError if they aren't port letters, or repeat one
+def _ports(letters):
+    if letters == '-':
+        return 0
+
+    if len(set(letters)) != len(letters) or not all(_l in _LETTERS for _l in letters):
+        raise ValueError(f"bad ports {letters!r}")
+
+    return sum(_LETTERS[_l] for _l in letters)
+
+class Catalog():
+    # cards is a list of (HostDef, copies)
+    def __init__(self, cards):
+        self.cards  = {} # name -> HostDef
+        self.copies = {} # HostDef -> copies of it in a deck
+
+        for card, copies in cards:
+            if card.name in self.cards:
+                raise ValueError(f"host {card.name!r} defined twice")
+
+            self.cards[card.name] = card
+            self.copies[card]     = copies
+
+        # a whole deck in catalog order, for deck() to copy and shuffle
+        self._deck = tuple(_c for _c, _n in self.copies.items() for _ in range(_n))
+
+    def __getitem__(self, name):
+        return self.cards[name]
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __iter__(self):
+        return iter(self.cards.values())
+
+    # a freshly shuffled deck, a list of HostDefs, top card last
+    def deck(self, rng=random):
+        deck = list(self._deck)
+        rng.shuffle(deck)
+
+        return deck
+
+# take n cards off the top of deck, fewer if it runs out. ret them as a list, top card first
+def deal(deck, n):
+    hand = deck[:-n - 1:-1] if n > 0 else []
+    del deck[len(deck) - len(hand):]
+
+    return hand
+
+# read the Catalog in the data file at path. raises ValueError, naming the line, on anything malformed
+def load(path=PATH):
+    cards = []
+
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            if not (fields := line.split('#', 1)[0].split()):
+                continue
+
+            try:
+                if len(fields) != 3:
+                    raise ValueError(f"expected name, ports and copies, got {len(fields)} fields")
+
+                name, letters, copies = fields
+
+                if not copies.isdigit() or int(copies) < 1:
+                    raise ValueError(f"bad copies {copies!r}")
+
+                cards.append((hostdef(name, _ports(letters)), int(copies)))
+
+            except ValueError as e:
+                raise ValueError(f"{path}:{lineno}: {e}") from None
+
+    try:
+        return Catalog(cards)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+CATALOG = load()
+
+"""
+unit tests
 """
+if __name__ == "__main__":
+    import tempfile
+
+    from _network import Host, Network, CONN
+
+    print("test 1: the catalog loads, and its defs are the shared ones")
+    assert len(CATALOG) > 0 and all(_n == CATALOG[_n].name for _n in CATALOG.cards)
+    assert CATALOG['Firewall'] is hostdef('Firewall', PORT.TOP | PORT.BOTTOM)
+    assert Host('Firewall', 0, 0, PORT.TOP | PORT.BOTTOM).hostdef is CATALOG['Firewall']
+
+    print("\ntest 2: decks hold every copy of every card, and nothing but the catalog's defs")
+    deck = CATALOG.deck(random.Random(1))
+    assert len(deck) == sum(CATALOG.copies.values())
+    assert all(deck.count(_c) == _n for _c, _n in CATALOG.copies.items())
+    assert deck != CATALOG.deck(random.Random(2)) and deck == CATALOG.deck(random.Random(1))
+
+    print("\ntest 3: dealing takes off the top, until the deck runs out")
+    top  = deck[-5:]
+    hand = deal(deck, 5)
+    assert hand == top[::-1] and len(deck) == sum(CATALOG.copies.values()) - 5
+
+    assert deal(deck, 0) == [] and len(deal(deck, len(deck) + 10)) == sum(CATALOG.copies.values()) - 5
+    assert deck == [] and deal(deck, 3) == []
+
+    print("\ntest 4: cards in hand can be played without copying them")
+    net  = Network()
+    card = CATALOG['Backbone']
+    net.place(Host.from_def(card, 0, 0))
+
+    for card in hand:
+        if (placement := next(net.legal_placements(card), None)) is not None:
+            x, y, rotation = placement
+            assert net.validate(Host.from_def(card, x, y, rotation)) == CONN.CONNECTED
+
+            net.place(Host.from_def(card, x, y, rotation))
+            assert net.hosts[-1].hostdef is card
 
+    print("\ntest 5: malformed data files are refused, naming the line")
+    for text in ('Hub TRBL', 'Hub TRBX 1', 'Hub TT 1', 'Hub TB 0', 'Hub TB x', 'Hub TB 1\nHub RL 1'):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as f:
+            f.write(f"# comment\n\n{text}\n")
+            f.flush()
 
+            try:
+                load(f.name)
+                assert False, f"{text!r} accepted"
+            except ValueError as e:
+                assert f.name in str(e)
 
+    print("\nall tests successful!")
@@ -0,0 +1,444 @@
+"""
+append-only journal of everything handed to an Engine, and deterministic replay of it without any sockets
+
+handlers only ever see what comes in through the engine's entry points, so recording those is enough to play a
+run back through another engine and end up in the same place: connections coming and going, every op as it's
+dispatched (not as it's queued, so rate limits and round robin needn't be reproduced), which ticks timers fired
+on, which points state checks ran at, and the resume tokens handed out, the one thing that's random. the journal
+opens with a snapshot of every session (see _snapshot) to start from
+
+records are packed into a buffer, so the IO loop only pays for packing them. the buffer is handed to a writer
+thread, which is the only thing to touch the disk, when it fills up, every FLUSH_INTERVAL, and on the way out,
+even if that's an exception. a journal cut off mid record by a harder crash still reads up to the last whole one.
+the loop only ever waits on the writer if it falls MAX_PENDING buffers behind
+
+format, integers and floats big endian:
+    header :: magic, u16 format version, f64 wall clock at start, f64 engine clock at start, f64 engine clock its
+        timers count from, u32 session limit, u32 snapshot length
+    snapshot :: see _snapshot
+    records :: msgpack arrays led by their RECORD, back to back:
+        [TICK, now] :: process() ran at engine clock now, and timers fired or ops were dispatched. anything after
+            it happened on that tick
+        [ATTACH, fd, peer] :: a connection came in
+        [DETACH, fd] :: a connection went away, or was dropped
+        [OP, fd, sid, opcode, args] :: the connection's op was dispatched to session sid (None for the directory)
+        [CHECK] :: state checks ran for whichever sessions had seen activity
+        [TOKEN, token] :: a resume token was handed out
+
+replay is as fast as handlers go. the engine's clock is faked, and moved along to each tick's time as it comes,
+so timers fire exactly where they did. idle hangups are replayed from the journal rather than timed again, and
+come after anything else that fired on the same tick
+"""
+import os
+import time
+import queue
+import struct
+import secrets
+import msgpack
+import threading
+
+from collections import deque
+
+import _server
+import _snapshot
+
+from _enum import Enum
+from _api import pack
+from _debug import *
+
+# seconds between flushes of whatever's buffered
+FLUSH_INTERVAL = 1
+
+# bytes buffered before they're handed to the writer regardless
+BUFFER_SIZE = 1 << 16
+
+# buffers handed to the writer and not yet written before handing it another blocks
+MAX_PENDING = 64
+
+MAGIC   = b'SHJN'
+VERSION = 1
+
+HEADER = struct.Struct('!4sHdddII')
+
+RECORD = Enum(
+    'TICK',
+    'ATTACH',
+    'DETACH',
+    'OP',
+    'CHECK',
+    'TOKEN',
+)
+
+"""
+writes an engine's journal. set one as engine.journal once the engine's sessions are set up, and the engine takes
+it from there
+"""
+class Journal():
+    def __init__(self, engine, path):
+        self.path = path
+
+        # never clobber the journal leading up to whatever had us restarted. it's kept under when it was last written
+        if os.path.exists(path):
+            os.replace(path, f"{path}.{os.stat(path).st_mtime_ns}")
+
+        self._file    = open(path, 'wb')
+        self._packer  = msgpack.Packer()
+        self._tick    = None # time of the current tick, until anything happens on it
+        self._buffer  = bytearray() # packed records not yet handed to the writer
+        self._pending = queue.Queue(MAX_PENDING) # buffers for the writer, then None once we're closing
+
+        snapshot = _snapshot.dump(engine)
+
+        self._file.write(HEADER.pack(
+            MAGIC, VERSION, time.time(), engine.clock(), engine.timers._start, engine.max_sessions,
+            len(snapshot),
+        ))
+        self._file.write(snapshot)
+        self._file.flush()
+
+        self.n_records = 0
+
+        self._writer = threading.Thread(target=self._run, name="journal writer", daemon=True)
+        self._writer.start()
+
+    def _write(self, record):
+        if self._tick is not None:
+            self._write_tick()
+
+        self._buffer += self._packer.pack(record)
+        self.n_records += 1
+
+        if len(self._buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def _write_tick(self):
+        self._buffer += self._packer.pack((RECORD.TICK, self._tick))
+        self._tick = None
+        self.n_records += 1
+
+    # the writer thread. puts whatever it's handed on disk, in order, until it's handed None
+    def _run(self):
+        while (data := self._pending.get()) is not None:
+            try:
+                self._file.write(data)
+                self._file.flush()
+            except OSError as e:
+                eprint(f"couldn't write to journal {self.path}: {e}")
+
+    # process() is running at now. only written out once something happens on it
+    def tick(self, now):
+        self._tick = now
+
+    # timers fired on the current tick
+    def fired(self):
+        if self._tick is not None:
+            self._write_tick()
+
+    def attach(self, fd, peer):
+        self._write((RECORD.ATTACH, fd, peer))
+
+    def detach(self, fd):
+        self._write((RECORD.DETACH, fd))
+
+    def op(self, fd, sid, opcode, op_args):
+        self._write((RECORD.OP, fd, sid, opcode, op_args))
+
+    def check(self):
+        self._write((RECORD.CHECK,))
+
+    def token(self, token):
+        self._write((RECORD.TOKEN, token))
+
+    # hand whatever's buffered to the writer
+    def flush(self):
+        if self._buffer:
+            self._pending.put(bytes(self._buffer))
+            self._buffer.clear()
+
+    # flush, and wait for the writer to put everything on disk
+    def close(self):
+        if self._file.closed:
+            return
+
+        self.flush()
+        self._pending.put(None)
+        self._writer.join()
+
+        self._file.close()
+
+# (header, snapshot, records) from the journal at path. header is a dict of its fields, snapshot the bytes of the
+# snapshot it starts from, and records a list of every whole record
+def read(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} isn't a journal")
+
+    magic, version, wall, started, timers_start, max_sessions, length = HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise ValueError(f"{path} isn't a journal")
+
+    if version != VERSION:
+        raise ValueError(f"{path} is a version {version} journal, we only read version {VERSION}")
+
+    header = {
+        'wall':         wall,
+        'started':      started,
+        'timers_start': timers_start,
+        'max_sessions': max_sessions,
+    }
+
+    snapshot = data[HEADER.size:HEADER.size + length]
+
+    # stops at the end of the last whole record
+    unpacker = msgpack.Unpacker(raw=False, max_buffer_size=len(data))
+    unpacker.feed(memoryview(data)[HEADER.size + length:])
+
+    return header, snapshot, list(unpacker)
+
+# the engine's clock during replay, wherever the journal says it is
+class _Clock():
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+# a connection as it was recorded. does everything a Messenger would with what's sent to it, short of sending it
+class _ReplayMessenger():
+    def __init__(self, fd, peer):
+        self.fd       = fd
+        self.peer     = peer
+        self.eof      = False
+        self.on_close = None
+
+        self.bytes_in   = 0
+        self.bytes_out  = 0
+        self.frames_in  = 0
+        self.frames_out = 0
+
+    def fileno(self):
+        return self.fd
+
+    def send(self, opcode, *args):
+        self.send_frame(pack(opcode, *args))
+
+    def send_frame(self, frame):
+        self.bytes_out  += len(frame)
+        self.frames_out += 1
+
+    def pending(self):
+        return 0
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def close(self):
+        pass
+
+# play the journal at path back through a fresh engine, as fast as it goes. ret the engine, and a dict of how many
+# records and ops there were, how many didn't line up with how they went the first time around, and how long
+# playing them back took, reading the journal aside. handlers raising anything they did the first time raise it
+# here too
+def replay(path):
+    header, snapshot, records = read(path)
+
+    clock  = _Clock(header['timers_start'])
+    engine = _server.Engine(header['max_sessions'], idle_timeout=None, clock=clock)
+
+    clock.now = header['started']
+    _snapshot.load(engine, snapshot)
+
+    # tokens are journaled as they're handed out, after whatever asked for them
+    tokens = deque(_r[1] for _r in records if _r[0] == RECORD.TOKEN)
+    engine.new_token = lambda: tokens.popleft() if tokens else secrets.token_urlsafe(16)
+
+    n_ops    = 0
+    diverged = 0
+
+    start = time.perf_counter()
+
+    for record in records:
+        kind = record[0]
+
+        if kind == RECORD.OP:
+            _, fd, sid, opcode, op_args = record
+            n_ops += 1
+
+            if (session := engine.routes.get(fd)) is None or session.id != sid:
+                diverged += 1
+                dprint(lambda: f"fd {fd}: op {opcode} went to session {sid}, now it'd go to {session and session.id}")
+
+                if session is None:
+                    continue
+
+            engine._dispatch(session, fd, opcode, op_args)
+
+        elif kind == RECORD.TICK:
+            clock.now = record[1]
+            engine.timers.poll()
+
+        elif kind == RECORD.CHECK:
+            engine.state_check()
+
+        elif kind == RECORD.ATTACH:
+            engine.attach(_ReplayMessenger(record[1], record[2]))
+
+        elif kind == RECORD.DETACH:
+            if record[1] not in engine.conns:
+                diverged += 1
+                continue
+
+            engine.detach(record[1])
+
+    elapsed = time.perf_counter() - start
+
+    return engine, {'records': len(records), 'ops': n_ops, 'diverged': diverged, 'seconds': elapsed}
+
+"""
+unit tests, which record a game being played through an engine and check replaying it ends up in the same place
+"""
+if __name__ == "__main__":
+    import tempfile
+
+    import _game
+    import _lobby
+    import _debug
+
+    from _api import OPS
+
+    _debug.set_level(_debug.LEVEL.ERROR)
+
+    D_OP = OPS.DIRECTORY.SERVER
+    L_OP = OPS.LOBBY.SERVER
+    G_OP = OPS.GAME.SERVER
+
+    class _FakeMessenger(_ReplayMessenger):
+        def __init__(self, fd):
+            super().__init__(fd, ('127.0.0.1', 1000 + fd))
+            self.sent = []
+
+        def send(self, opcode, *args):
+            self.sent.append((opcode, *args))
+
+    # one iteration of an IO loop, with ops from whoever
+    def tick(engine, *ops):
+        for fd, opcode, *args in ops:
+            engine.queue(fd, opcode, args)
+
+        engine.process()
+        engine.state_check()
+
+    # what replay has to get the same: every session's state, where every connection is, and who can resume
+    def summary(engine):
+        sessions = {}
+
+        for sid, session in engine.sessions.items():
+            context = session.context
+            sessions[sid] = (type(context).__name__, context.dump())
+
+        return sessions, {_fd: _s.id for _fd, _s in engine.routes.items()}, sorted(engine.resumable)
+
+    def play(engine):
+        messengers = {}
+
+        for fd in (10, 11, 12):
+            engine.attach(messengers.setdefault(fd, _FakeMessenger(fd)))
+
+        tick(engine, (10, D_OP.CREATE, 2, None))
+        sid = max(engine.sessions)
+
+        tick(engine, (10, D_OP.ENTER, sid), (11, D_OP.ENTER, sid), (12, D_OP.LIST))
+        tick(engine, (10, L_OP.JOIN, 'a', None), (11, L_OP.JOIN, 'b', None))
+        tick(engine, (10, L_OP.ACK), (11, L_OP.ACK))
+        tick(engine)
+
+        # b drops mid game, and comes back on another connection with their token
+        token = next(_m[1] for _m in messengers[11].sent if _m[0] == OPS.GAME.CLIENT.START)
+
+        engine.drop(11)
+        tick(engine, (10, G_OP.SYNC_ACK, 1))
+
+        engine.attach(_FakeMessenger(13))
+        tick(engine, (13, D_OP.RESUME, token), (12, 99))
+        tick(engine, (13, G_OP.SYNC_ACK, engine.sessions[sid].context.state.version))
+
+        return sid
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'journal')
+
+        print("test 1: replaying a journal ends up where the recording did")
+        engine = _server.Engine()
+        engine.create_session(_lobby.init, 4, None)
+        engine.journal = Journal(engine, path)
+
+        sid = play(engine)
+        engine.journal.close()
+
+        assert isinstance(engine.sessions[sid].context, _game._GameContext)
+
+        replayed, stats = replay(path)
+        assert stats['diverged'] == 0 and stats['ops'] == engine.n_dispatched, stats
+        assert summary(replayed) == summary(engine)
+
+        print("\ntest 2: timers fire on the same ticks when replayed")
+        clock  = _Clock(1000.0)
+        engine = _server.Engine(clock=clock)
+        engine.journal = Journal(engine, path)
+
+        for fd in (10, 11):
+            engine.attach(_FakeMessenger(fd))
+
+        tick(engine, (10, D_OP.CREATE, 2, None))
+        sid = max(engine.sessions)
+
+        tick(engine, (10, D_OP.ENTER, sid), (11, D_OP.ENTER, sid))
+        tick(engine, (10, L_OP.JOIN, 'a', None), (11, L_OP.JOIN, 'b', None))
+        tick(engine, (10, L_OP.ACK), (11, L_OP.ACK))
+        tick(engine)
+
+        # a drops, and is given up on right before b's next op
+        engine.drop(10)
+        clock.now += _game.RESUME_TIMEOUT
+        tick(engine, (11, G_OP.SYNC_ACK, 1))
+
+        engine.journal.close()
+        assert engine.sessions[sid].context.state.players.keys() == {'a', 'b'} and len(engine.resumable) == 0
+
+        replayed, stats = replay(path)
+        assert stats['diverged'] == 0 and summary(replayed) == summary(engine)
+        assert len(replayed.sessions[sid].context.tokens) == 1
+
+        print("\ntest 3: a journal cut off mid record replays up to the last whole one")
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        with open(path, 'wb') as f:
+            f.write(data[:-3])
+
+        _, _, records = read(path)
+        assert 0 < len(records) < engine.journal.n_records
+
+        print("\ntest 4: an existing journal is moved aside rather than overwritten")
+        before = set(os.listdir(tmp))
+        Journal(_server.Engine(), path).close()
+        assert len(os.listdir(tmp)) == len(before) + 1
+
+        print("\ntest 5: buffers handed to the writer as they fill all land, in order, by the time it's closed")
+        journal = Journal(_server.Engine(), path)
+
+        for token in range(4 * BUFFER_SIZE // 8):
+            journal.token(token)
+
+        journal.close()
+
+        _, _, records = read(path)
+        assert records == [[RECORD.TOKEN, _t] for _t in range(4 * BUFFER_SIZE // 8)]
+
+    print("\nall tests successful!")
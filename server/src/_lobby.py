@@ -1,10 +1,12 @@
-from select import EPOLLIN, EPOLLERR
+import _server
 
 from _enum import Enum
 
-from _game import init as init_game
+from _game import init as init_game, restore as restore_game
+from _registry import Registry
 
-from _api import Messenger
+from _api import broadcast
+from _compress import negotiate
 from _api import OPS as _api_OPS, ERR as _api_ERR
 C_OP  = _api_OPS.LOBBY.CLIENT
 C_ERR = _api_ERR.LOBBY.CLIENT
@@ -16,6 +18,9 @@ from _debug import *
 wait for requested number of players to join and become ready, then init primary game construct
 """
 
+# seconds players get to ACK once the lobby fills. whoever hasn't by then gets kicked and the rest wait for more
+ACK_TIMEOUT = 30
+
 # construct new lobby entity
 PLAYER_STATE = Enum(
     'NOT_JOINED', # connection exists but has not joined lobby
@@ -24,9 +29,13 @@ PLAYER_STATE = Enum(
 )
 
 class _LobbyPlayer():
-    def __init__(self, sock):
+    # messenger is None for players restored from a snapshot, who haven't reconnected yet
+    def __init__(self, messenger=None):
         self.state     = PLAYER_STATE.NOT_JOINED
-        self.messenger = Messenger(sock)
+        self.messenger = messenger
+
+        # kept, since the messenger's fileno() goes to -1 once it's closed
+        self.fd = messenger.fileno() if messenger is not None else None
 
         self.alias     = None # set to str on JOIN
 
@@ -40,111 +49,181 @@ LOBBY_STATE = Enum(
 )
 
 class _LobbyContext():
-    def __init__(self, n_players, password, epoll):
+    def __init__(self, n_players, password, session):
         self.n_players = n_players
         self.password  = password
-        self.epoll     = epoll
+        self.session   = session # for scheduling things on, see Session.call_later
 
-        self.players   = []
+        self.players   = Registry()
         self.state     = LOBBY_STATE.WAITING_JOIN
+        self.ack_timer = None # running while in WAITING_ACK
 
     # get players who are in particular state
     def get_p_state(self, state):
-        return [_p for _p in self.players if _p.state == state]
+        return self.players.in_state(state)
 
     # get player by file descriptor of the connection they own
     def get_player_by_fd(self, fd):
-        for player in self.players:
-            if fd == player.messenger.sock.fileno():
-                return player
-        raise ValueErrorf("no player owning fd {fd} exists")
+        return self.players.by_fd(fd)
+
+    # still taking players?
+    def is_open(self):
+        return self.state == LOBBY_STATE.WAITING_JOIN and self.players.count(PLAYER_STATE.JOINED) < self.n_players
+
+    # nothing to watch until it's a game
+    def gallery(self):
+        return None
 
-    # handle inbound connections, creating unready player if there are any open slots
-    def handle_inbound(self, ep, sock):
-        dprint(f"{sock.getpeername()[0]} requested connect")
+    # (joined, players, password required) for the directory listing
+    def summary(self):
+        return (self.players.count(PLAYER_STATE.JOINED), self.n_players, self.password is not None)
+
+    # what to bring this lobby back with, see _snapshot. whoever's in it now will have to come back on their own
+    def dump(self):
+        return ('lobby', self.n_players, self.password)
+
+    # handle inbound connections, creating unready player if there are any open slots. ret whether we took them
+    def handle_inbound(self, messenger):
+        dprint(lambda: f"{messenger.peer[0]} requested connect")
 
         # if lobby is full, tell them to piss off
-        if self.state != LOBBY_STATE.WAITING_JOIN or len(self.get_p_state(PLAYER_STATE.JOINED)) >= self.n_players:
+        if not self.is_open():
             dprint("denied: lobby full")
-            Messenger(sock).send(C_OP.ERROR, C_ERR.FULL)
-            sock.close()
-            return
+            messenger.send(C_OP.ERROR, C_ERR.FULL)
+            return False
 
         # if it's not full, add an un-joined player and await JOIN op
         dprint("accepted")
-        self.players.append(_LobbyPlayer(sock))
-        ep.register(sock.fileno(), EPOLLIN|EPOLLERR)
+        self.players.add(_LobbyPlayer(messenger))
 
-    # broadcast message to all players
-    def broadcast(self, opcode, *args):
-        for player in self.players:
-            player.send(opcode, *args)
+        return True
 
-    # wrapper over internal epoll struct
-    def poll(self):
-        return self.epoll.poll()
+    # connection owning fd is gone
+    def handle_disconnect(self, fd):
+        self.players.remove(self.players.by_fd(fd))
 
-# TODO catch the fker and return True if we can fix it
-# we should use this to deal with malformed requests, as well as socket errors from client disconnects
-def _lobby_catch(*args):
-    return False
+    # broadcast message to all players, less any in exclude. the message is only encoded once
+    def broadcast(self, opcode, *args, exclude=()):
+        broadcast((_p.messenger for _p in self.players), opcode, *args, exclude={_p.messenger for _p in exclude})
+
+    # send player back to the directory, telling them why
+    def kick(self, player, reason):
+        player.send(C_OP.KICK, reason)
+        self.players.remove(player)
+        self.session.engine.route(player.fd, self.session.engine.directory)
 
 # check state of lobby and transition as appropriate
-def _lobby_statecheck(engine):
+def _lobby_statecheck(session):
     # if waiting for player to join, and all players have joined, broadcast game start and await client ACKs
-    lobby = engine.context
+    lobby = session.context
 
     if lobby.state == LOBBY_STATE.WAITING_JOIN:
-        joined = lobby.get_p_state(PLAYER_STATE.JOINED)
-
-        if len(joined) >= lobby.n_players:
+        if lobby.players.count(PLAYER_STATE.JOINED) >= lobby.n_players:
             iprint("all players have joined, waiting for clients to ack")
 
-            # boot any waiting connections which haven't joined
-            for p in lobby.get_p_state(PLAYER_STATE.NOT_JOINED):
-                p.send(C_OP.KICK, "game is starting")
-                p.messenger.sock.close()
+            # boot any waiting connections which haven't joined back to the directory
+            for p in list(lobby.get_p_state(PLAYER_STATE.NOT_JOINED)):
+                lobby.kick(p, "game is starting")
 
-            lobby.players = joined
-            lobby.state   = LOBBY_STATE.WAITING_ACK
+            lobby.state     = LOBBY_STATE.WAITING_ACK
+            lobby.ack_timer = session.call_later(ACK_TIMEOUT, _ack_timeout, lobby)
             lobby.broadcast(C_OP.READY)
 
         return
 
+    if lobby.state != LOBBY_STATE.WAITING_ACK:
+        return
+
+    # someone left while we were waiting on acks. the table's not full anymore, so back to waiting for players
+    if lobby.players.count(PLAYER_STATE.JOINED) + lobby.players.count(PLAYER_STATE.ACK) < lobby.n_players:
+        iprint(lambda: f"lobby {session.id}: lost a player before the game started")
+        _unready(lobby)
+        return
+
     # if waiting for ack, and all players are ack, start game and send game state
-    if lobby.state == LOBBY_STATE.WAITING_ACK and len(lobby.get_p_state(PLAYER_STATE.ACK)) >= lobby.n_players:
+    if lobby.players.count(PLAYER_STATE.ACK) >= lobby.n_players:
         dprint("all clients ack")
-        game_init(engine)
 
+        lobby.ack_timer.cancel()
+        init_game(session)
+
+# not everyone ACKed in time. kick whoever didn't, and go back to waiting for players
+def _ack_timeout(lobby):
+    if lobby.state != LOBBY_STATE.WAITING_ACK:
+        return
+
+    iprint(lambda: f"lobby {lobby.session.id}: {lobby.players.count(PLAYER_STATE.JOINED)} players didn't ack in time")
 
-def init(players, password, epoll, engine):
-    iiprint("initing lobby")
+    for p in list(lobby.get_p_state(PLAYER_STATE.JOINED)):
+        lobby.kick(p, "took too long to ack")
+
+    lobby.ack_timer = None
+    _unready(lobby)
+
+# call off the game start. everyone still here goes back to plain JOINED and has to ACK again next time
+def _unready(lobby):
+    if lobby.ack_timer is not None:
+        lobby.ack_timer.cancel()
+        lobby.ack_timer = None
+
+    for p in list(lobby.get_p_state(PLAYER_STATE.ACK)):
+        lobby.players.set_state(p, PLAYER_STATE.JOINED)
+
+    lobby.state = LOBBY_STATE.WAITING_JOIN
+    lobby.broadcast(C_OP.UNREADY, list(lobby.players.aliases()))
+
+
+# bring a session back from what its context's dump() returned, see _snapshot. lobbies come back empty, and games
+# come back with everyone away
+def restore(dump, session):
+    kind, *data = dump
+
+    if kind == 'lobby':
+        init(*data, session)
+        return
+
+    players, state = data
+
+    restored = []
+    for alias, token in players:
+        player = _LobbyPlayer()
+        player.state = PLAYER_STATE.ACK
+        player.alias = alias
+
+        restored.append((player, token))
+
+    restore_game(restored, state, session)
+
+def init(players, password, session):
+    iiprint(f"initing lobby {session.id}")
 
     # init the lobby's state
-    context = _LobbyContext(players, password, epoll)
+    context = _LobbyContext(players, password, session)
 
-    engine.context    = context
-    engine.statecheck = _lobby_statecheck
-    engine.catch      = _lobby_catch
+    session.context    = context
+    session.statecheck = _lobby_statecheck
+    session.catch      = _server.client_catch(session, C_OP.ERROR, C_ERR.INVALID)
 
     for i, fn in enumerate((
         _op_join,
         _op_ack,
     )):
         name = S_OP[i]
-        engine.register(name, fn)
+        session.register(name, fn)
 
         dprint(f"registered: {name}/{fn}")
 
-    iiprint("waiting for players to join...")
+    iiprint(f"lobby {session.id} waiting for players to join...")
+
+# join lobby. codecs are the compression the client can take, if any, see _compress
+def _op_join(lobby, player, alias, password, codecs=None):
+    dprint(lambda: f"{player.messenger.peer[0]} requested join game")
 
-# join lobby
-def _op_join(lobby, player, alias, password):
-    dprint(f"{player.messenger.sock.getpeername()[0]} requested join game")
+    codec = negotiate(codecs)
 
     # deny if they're already in
     if player.state == 1:
-        dprint(f"denied: already joined as {player.alias}")
+        dprint(lambda: f"denied: already joined as {player.alias}")
         player.send(C_OP.ERROR, C_ERR.ALREADY_JOINED)
         return
 
@@ -159,24 +238,25 @@ def _op_join(lobby, player, alias, password):
         player.send(C_OP.ERROR, C_ERR.ALIAS_EMPTY)
         return
 
-    if alias in [_p.alias for _p in lobby.get_p_state(PLAYER_STATE.JOINED)]:
+    if lobby.players.by_alias(alias) is not None:
         dprint("denied: alias already in use")
         player.send(C_OP.ERROR, C_ERR.ALIAS_IN_USE)
         return
 
-    iprint(f"{player.messenger.sock.getpeername()[0]} joined as {alias}")
-    lobby.broadcast(C_OP.JOINED, f"{alias}", [_p.alias for _p in lobby.get_p_state(PLAYER_STATE.JOINED)])
+    iprint(lambda: f"{player.messenger.peer[0]} joined as {alias}")
+    player.messenger.codec = codec
+    lobby.broadcast(C_OP.JOINED, f"{alias}", list(lobby.players.aliases()))
 
-    player.state = PLAYER_STATE.JOINED
-    player.alias = alias
+    lobby.players.set_state(player, PLAYER_STATE.JOINED)
+    lobby.players.set_alias(player, alias)
 
 # acknowledge that game is starting and client will avoid sending more ops until game has begun
 def _op_ack(lobby, player):
     if player.state != PLAYER_STATE.JOINED:
-        dprint(f"denied ack from {player.messenger.sock.getpeername()[0]}: state is {PLAYER_STATE[player.state]}")
+        dprint(lambda: f"denied ack from {player.messenger.peer[0]}: state is {PLAYER_STATE[player.state]}")
         player.send(C_OP.ERROR, C_ERR.DENY)
         return
 
-    dprint(f"accepted ack from {player.alias}")
-    player.state = PLAYER_STATE.ACK
+    dprint(lambda: f"accepted ack from {player.alias}")
+    lobby.players.set_state(player, PLAYER_STATE.ACK)
 
@@ -0,0 +1,423 @@
+"""
+instrumentation for the engine and whichever IO loop is driving it
+
+everything here is a plain counter or a fixed-bucket histogram, so recording costs an add or a bisect and nothing
+is allocated per event. snapshots are rendered in the prometheus text format and either written out to a file
+(e.g. for node_exporter's textfile collector) or dumped to whoever connects to a local admin unix socket:
+
+    socat - UNIX-CONNECT:/path/to/admin.sock
+"""
+import os
+import time
+import socket
+
+from bisect import bisect_left
+
+import _compress
+from _debug import *
+
+# seconds between writes of the metrics file
+EXPORT_INTERVAL = 5
+
+# upper bounds for timings, in seconds: 1us doubling up to ~1s
+TIME_BUCKETS = tuple(1e-6 * (1 << _i) for _i in range(21))
+
+# upper bounds for queue depths, in ops: 0, then 1 doubling up to 64k
+DEPTH_BUCKETS = (0,) + tuple(1 << _i for _i in range(17))
+
+# seconds an admin client gets to take its snapshot before we give up on it
+ADMIN_TIMEOUT = 5
+
+# most admin connections taken per call to serve(), and most being sent snapshots at once. anyone past the first
+# waits in the backlog for the next call, and anyone past the second bumps the oldest
+ADMIN_ACCEPTS = 16
+MAX_ADMIN     = 16
+
+class Histogram():
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # last one catches everything past the largest bound
+        self.sum    = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def count(self):
+        return sum(self.counts)
+
+    # prometheus lines for this histogram. labels is an already formatted 'k="v",' prefix, or empty
+    def render(self, name, labels=''):
+        lines = []
+        total = 0
+
+        for bound, n in zip(self.bounds, self.counts):
+            total += n
+            lines.append(f'{name}_bucket{{{labels}le="{bound:g}"}} {total}')
+
+        total += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {total}')
+
+        labels = labels.rstrip(',')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:g}' if labels else f'{name}_sum {self.sum:g}')
+        lines.append(f'{name}_count{{{labels}}} {total}' if labels else f'{name}_count {total}')
+
+        return lines
+
+# the io counts every messenger keeps, in the order sessions' totals keep them
+_IO = ('bytes_in', 'bytes_out', 'frames_in', 'frames_out')
+
+def _io(messenger):
+    return (messenger.bytes_in, messenger.bytes_out, messenger.frames_in, messenger.frames_out)
+
+"""
+everything one engine records. messengers count their own bytes and frames (see _api.Messenger), and the engine
+folds a connection's counts into the totals here when it goes away
+
+io is also broken down by session, counting only what a connection did while it was in that session. the engine
+calls leave() whenever one moves on, which credits the session it's leaving with everything since it came in.
+spectators count towards the game they're watching, since the gallery shares its id
+"""
+class Metrics():
+    def __init__(self):
+        self.ops   = {} # op name -> Histogram of handler latency
+        self.queue = Histogram(DEPTH_BUCKETS) # ops waiting at each process()
+        self.loop  = Histogram(TIME_BUCKETS)  # time spent working per IO loop iteration, waiting excluded
+
+        self.accepted = 0
+        self.closed   = 0
+        self.paused   = 0 # times a connection's queue filled up and we stopped reading from it
+
+        # io of connections which have since closed
+        self.bytes_in   = 0
+        self.bytes_out  = 0
+        self.frames_in  = 0
+        self.frames_out = 0
+
+        self.sessions = {} # session id (None for the directory) -> io of connections since they left it, see _IO
+        self._marks   = {} # fd -> io of the connection when it came into the session it's in now
+
+    def observe_op(self, name, seconds):
+        if (histogram := self.ops.get(name)) is None:
+            histogram = self.ops[name] = Histogram(TIME_BUCKETS)
+
+        histogram.observe(seconds)
+
+    # the connection owning fd is leaving session sid, be it for another one or for good. credit sid with what it
+    # did there
+    def leave(self, sid, fd, messenger):
+        now  = _io(messenger)
+        mark = self._marks.get(fd, (0, 0, 0, 0))
+
+        totals = self.sessions.setdefault(sid, [0, 0, 0, 0])
+        for i in range(len(_IO)):
+            totals[i] += now[i] - mark[i]
+
+        self._marks[fd] = now
+
+    # connection owning fd is going away, keep its counts
+    def retire(self, fd, messenger):
+        self._marks.pop(fd, None)
+
+        self.closed     += 1
+        self.bytes_in   += messenger.bytes_in
+        self.bytes_out  += messenger.bytes_out
+        self.frames_in  += messenger.frames_in
+        self.frames_out += messenger.frames_out
+
+    # prometheus text snapshot. conns are the live messengers (fd -> messenger), routes the session each is in
+    # (fd -> Session), and sessions the live ones, bar the directory (sid -> Session)
+    def render(self, conns, routes, sessions):
+        lines = []
+
+        # sessions which are gone are done counting
+        for sid in [_s for _s in self.sessions if _s is not None and _s not in sessions]:
+            del self.sessions[sid]
+
+        # per session io: whatever left each, plus what's in it now has done since it came in
+        by_session = {_sid: list(_t) for _sid, _t in self.sessions.items()}
+        for fd, messenger in conns.items():
+            totals = by_session.setdefault(routes[fd].id, [0, 0, 0, 0])
+            mark   = self._marks.get(fd, (0, 0, 0, 0))
+
+            for i, value in enumerate(_io(messenger)):
+                totals[i] += value - mark[i]
+
+        def metric(name, kind, doc):
+            lines.append(f'# HELP {name} {doc}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        metric('shells_op_seconds', 'histogram', "time spent in each op's handler")
+        for name, histogram in sorted(self.ops.items()):
+            lines += histogram.render('shells_op_seconds', f'op="{name}",')
+
+        metric('shells_queue_depth', 'histogram', "ops waiting to be dispatched at each tick")
+        lines += self.queue.render('shells_queue_depth')
+
+        metric('shells_loop_seconds', 'histogram', "time spent working per IO loop iteration")
+        lines += self.loop.render('shells_loop_seconds')
+
+        metric('shells_connections_accepted_total', 'counter', "connections accepted")
+        lines.append(f'shells_connections_accepted_total {self.accepted}')
+
+        metric('shells_connections_closed_total', 'counter', "connections closed")
+        lines.append(f'shells_connections_closed_total {self.closed}')
+
+        metric('shells_reads_paused_total', 'counter', "times a connection sent more ops than it could queue")
+        lines.append(f'shells_reads_paused_total {self.paused}')
+
+        metric('shells_connections', 'gauge', "connections open right now")
+        lines.append(f'shells_connections {len(conns)}')
+
+        metric('shells_sessions', 'gauge', "lobbies and games open right now")
+        lines.append(f'shells_sessions {len(sessions)}')
+
+        # totals over every connection ever, then the breakdown by session, for the live ones and the directory.
+        # sessions are capped at max_sessions, so unlike connections, they can't run away with the label count
+        for i, (field, name, doc) in enumerate((
+            ('bytes_in',   'shells_received_bytes',  "bytes read from clients"),
+            ('bytes_out',  'shells_sent_bytes',      "bytes queued for clients"),
+            ('frames_in',  'shells_received_frames', "messages read from clients"),
+            ('frames_out', 'shells_sent_frames',     "messages queued for clients"),
+        )):
+            metric(f'{name}_total', 'counter', doc)
+            lines.append(f'{name}_total {getattr(self, field) + sum(getattr(_m, field) for _m in conns.values())}')
+
+            metric(f'shells_session_{name[7:]}_total', 'counter', f"{doc}, per live session")
+            for sid, totals in by_session.items():
+                lines.append(f'shells_session_{name[7:]}_total{{session="{"directory" if sid is None else sid}"}} {totals[i]}')
+
+        # compression, see _compress. frames are counted once however many connections they went to, saved bytes
+        # once per connection
+        stats = _compress.stats
+        for value, name, doc in (
+            (stats.frames,    'shells_compressed_frames_total',     "frames compressed"),
+            (stats.bytes_in,  'shells_compress_input_bytes_total',  "bytes of payload compressed"),
+            (stats.bytes_out, 'shells_compress_output_bytes_total', "bytes they compressed to"),
+            (stats.seconds,   'shells_compress_seconds_total',      "time spent compressing"),
+            (stats.saved,     'shells_compress_saved_bytes_total',  "bytes compression kept off the wire"),
+        ):
+            metric(name, 'counter', doc)
+            lines.append(f'{name} {value}')
+
+        lines.append('')
+        return '\n'.join(lines)
+
+"""
+ships snapshots from render() (any function ret the text) out of the process. the IO loop calls serve() when the
+admin socket is readable, and write() every EXPORT_INTERVAL
+
+admin connections never block the loop. each is sent as much of its snapshot as its socket buffer takes, and if
+that isn't all of it, handed to watch(fd) for the loop to call send(fd) whenever it's writable. unwatch(fd) is
+called before one's closed. clients which haven't taken everything within ADMIN_TIMEOUT get hung up on
+"""
+class Exporter():
+    def __init__(self, render, path=None, sock_path=None, watch=None, unwatch=None):
+        self.render  = render
+        self.path    = path
+        self.sock    = None
+        self.watch   = watch
+        self.unwatch = unwatch
+
+        self.clients = {} # fd -> [socket, memoryview of what it's still owed, whether it's watched, deadline]
+
+        if sock_path is not None:
+            # left over from a previous run
+            if os.path.exists(sock_path):
+                os.unlink(sock_path)
+
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(sock_path)
+            self.sock.listen()
+            self.sock.setblocking(False)
+
+    # fd to watch for admin connections, or None without an admin socket
+    def fileno(self):
+        return self.sock.fileno() if self.sock is not None else None
+
+    # hand a snapshot to up to ADMIN_ACCEPTS waiting admin connections
+    def serve(self):
+        snapshot = None
+        now      = time.monotonic()
+
+        for fd in [_fd for _fd, _c in self.clients.items() if _c[3] <= now]:
+            dprint(lambda: f"admin client on fd {fd} too slow, hanging up")
+            self._close(fd)
+
+        for _ in range(ADMIN_ACCEPTS):
+            try:
+                conn = self.sock.accept()[0]
+            except BlockingIOError:
+                return
+
+            if len(self.clients) >= MAX_ADMIN:
+                self._close(next(iter(self.clients)))
+
+            if snapshot is None:
+                snapshot = memoryview(self.render().encode())
+
+            conn.setblocking(False)
+            self.clients[conn.fileno()] = [conn, snapshot, False, now + ADMIN_TIMEOUT]
+            self.send(conn.fileno())
+
+    # send the admin client on fd as much of what it's owed as it'll take. call when it's writable
+    def send(self, fd):
+        client = self.clients[fd]
+
+        try:
+            client[1] = client[1][client[0].send(client[1]):]
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            dprint(lambda: f"admin client went away with {type(e).__name__}")
+            self._close(fd)
+            return
+
+        if not client[1]:
+            self._close(fd)
+
+        elif not client[2] and self.watch is not None:
+            client[2] = True
+            self.watch(fd)
+
+    def _close(self, fd):
+        conn, _, watched, _ = self.clients.pop(fd)
+
+        if watched and self.unwatch is not None:
+            self.unwatch(fd)
+
+        conn.close()
+
+    # replace the metrics file with a fresh snapshot. readers never see a half written file
+    def write(self):
+        if self.path is None:
+            return
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+
+        os.replace(tmp, self.path)
+
+if __name__ == "__main__":
+    print("test 1: histogram buckets are cumulative and bounds are inclusive")
+    h = Histogram((1, 2, 4))
+    for v in (0, 1, 2, 3, 5, 100):
+        h.observe(v)
+
+    lines = h.render('x', 'op="A",')
+    assert lines == [
+        'x_bucket{op="A",le="1"} 2',
+        'x_bucket{op="A",le="2"} 3',
+        'x_bucket{op="A",le="4"} 4',
+        'x_bucket{op="A",le="+Inf"} 6',
+        'x_sum{op="A"} 111',
+        'x_count{op="A"} 6',
+    ], lines
+    assert h.count() == 6
+
+    print("\ntest 2: closed connections still count towards the totals")
+    class _FakeMessenger():
+        def __init__(self, n):
+            self.bytes_in, self.bytes_out, self.frames_in, self.frames_out = n, 2 * n, 3 * n, 4 * n
+
+    class _FakeSession():
+        def __init__(self, sid):
+            self.id = sid
+
+    m = Metrics()
+    m.retire(6, _FakeMessenger(1))
+    m.observe_op('JOIN', 3e-6)
+    text = m.render({7: _FakeMessenger(10)}, {7: _FakeSession(3)}, {3: _FakeSession(3)})
+
+    assert 'shells_received_bytes_total 11' in text
+    assert 'shells_sent_frames_total 44' in text
+    assert 'shells_session_sent_bytes_total{session="3"} 20' in text
+    assert 'shells_op_seconds_count{op="JOIN"} 1' in text
+    assert 'shells_connections_closed_total 1' in text
+
+    print("\ntest 3: sessions are credited with what connections did while they were in them, and only that")
+    messenger = _FakeMessenger(5)
+    directory, lobby = _FakeSession(None), _FakeSession(3)
+
+    m = Metrics()
+    m.leave(None, 7, messenger)
+    messenger.bytes_in += 100
+    text = m.render({7: messenger}, {7: lobby}, {3: lobby})
+
+    assert 'shells_session_received_bytes_total{session="directory"} 5' in text
+    assert 'shells_session_received_bytes_total{session="3"} 100' in text
+
+    # back in the directory, which keeps counting from where it was
+    m.leave(3, 7, messenger)
+    messenger.bytes_in += 1
+    text = m.render({7: messenger}, {7: directory}, {3: lobby})
+
+    assert 'shells_session_received_bytes_total{session="directory"} 6' in text
+    assert 'shells_session_received_bytes_total{session="3"} 100' in text
+
+    # sessions which have ended drop out
+    assert 'session="3"' not in m.render({7: messenger}, {7: directory}, {})
+
+    print("\ntest 4: admin socket and file export")
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        exporter = Exporter(lambda: text, os.path.join(tmp, 'metrics.prom'), os.path.join(tmp, 'admin.sock'))
+        exporter.write()
+
+        with open(os.path.join(tmp, 'metrics.prom')) as f:
+            assert f.read() == text
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(os.path.join(tmp, 'admin.sock'))
+        exporter.serve()
+
+        received = b''
+        while (data := client.recv(1 << 16)):
+            received += data
+
+        assert received.decode() == text
+
+        print("\ntest 5: admin clients which don't read never hold up the loop, and are hung up on")
+        watched = set()
+        exporter.render = lambda: 'x' * (1 << 24)
+        exporter.watch, exporter.unwatch = watched.add, watched.remove
+
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect(os.path.join(tmp, 'admin.sock'))
+
+        start = time.monotonic()
+        exporter.serve()
+        assert time.monotonic() - start < ADMIN_TIMEOUT and len(watched) == 1 and len(exporter.clients) == 1
+
+        # reading some makes room for more, reading it all closes it
+        fd, = watched
+        received = len(stalled.recv(1 << 16))
+        exporter.send(fd)
+
+        stalled.setblocking(False)
+        while fd in exporter.clients:
+            try:
+                received += len(stalled.recv(1 << 20))
+            except BlockingIOError:
+                exporter.send(fd)
+
+        stalled.setblocking(True)
+        while (data := stalled.recv(1 << 20)):
+            received += len(data)
+
+        assert received == 1 << 24 and not watched
+
+        # and one that never reads gives way once it's out of time
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect(os.path.join(tmp, 'admin.sock'))
+        exporter.serve()
+
+        for client in exporter.clients.values():
+            client[3] = 0
+
+        exporter.serve()
+        assert not exporter.clients and not watched
+
+    print("\nall tests successful!")
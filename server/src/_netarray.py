@@ -0,0 +1,229 @@
+"""
+optional numpy backed take on _network.Network, for board-wide validation and AI move evaluation
+
+hosts are kept struct-of-arrays style (origin x, origin y, rotation, port mask) and the connectivity rules from
+Host.check_connectivity are vectorized over them, so one candidate can be classified against every host on the
+board, or a whole batch of candidates against it, in a single call. results are the exact same CONN values the
+scalar path gives, see the differential tests below
+
+an ArrayNetwork is a copy of where hosts were when they were added, not a view of a Network. to keep one in step
+with a board as it changes, give it the same add() and remove() calls the Network gets, in the same order. a host
+which is turned has to be removed before and added back after, as _state does with the Network anyway
+
+needs numpy. nothing else imports this, so the rest of the server runs fine without it
+"""
+import numpy as np
+
+from _network import CONN, Host, _HITBOX_TRANSFORM, _CORNER_TRANSFORM, _PORT_TRANSFORM, _WALL, _CORNER
+
+# the transform tables as arrays, indexed by rotation first just like the originals
+_HITBOX = np.array(_HITBOX_TRANSFORM, dtype=np.int64)
+_CORNERS = np.array([[(_p.x, _p.y) for _p in _row] for _row in _CORNER_TRANSFORM], dtype=np.int64)
+_PORTS = np.array([[(_p.x, _p.y) for _p in _row] for _row in _PORT_TRANSFORM], dtype=np.int64)
+
+# bit for each port, in the same order as the port transforms
+_PORT_BITS = (1 << 0, 1 << 1, 1 << 2, 1 << 3)
+
+# the CONN of each candidate (mine) against each host (other). every argument is an int array, and mine and other
+# just have to broadcast against each other
+def classify(my_x, my_y, my_rot, my_ports, other_x, other_y, other_rot, other_ports):
+    my_box    = _HITBOX[my_rot]
+    other_box = _HITBOX[other_rot]
+
+    my_left,    my_right    = my_x + my_box[..., _WALL.LEFT],       my_x + my_box[..., _WALL.RIGHT]
+    my_top,     my_bottom   = my_y + my_box[..., _WALL.TOP],        my_y + my_box[..., _WALL.BOTTOM]
+    other_left, other_right = other_x + other_box[..., _WALL.LEFT], other_x + other_box[..., _WALL.RIGHT]
+    other_top, other_bottom = other_y + other_box[..., _WALL.TOP],  other_y + other_box[..., _WALL.BOTTOM]
+
+    # any overlap is immediately illegal
+    overlap = (my_left < other_right) & (my_right > other_left) & (my_bottom < other_top) & (my_top > other_bottom)
+
+    # touching, edges included
+    adjacent = (other_bottom <= my_top) & (other_left <= my_right) & (other_top >= my_bottom) & (other_right >= my_left)
+
+    # sharing exactly one corner doesn't count as adjacent
+    def corner(rot, x, y, which):
+        c = _CORNERS[rot, which]
+        return x + c[..., 0], y + c[..., 1]
+
+    def same(a, b):
+        return (a[0] == b[0]) & (a[1] == b[1])
+
+    corners = (
+        same(corner(other_rot, other_x, other_y, _CORNER.BOTTOM_RIGHT), corner(my_rot, my_x, my_y, _CORNER.TOP_LEFT))     |
+        same(corner(other_rot, other_x, other_y, _CORNER.BOTTOM_LEFT),  corner(my_rot, my_x, my_y, _CORNER.TOP_RIGHT))    |
+        same(corner(other_rot, other_x, other_y, _CORNER.TOP_RIGHT),    corner(my_rot, my_x, my_y, _CORNER.BOTTOM_LEFT))  |
+        same(corner(other_rot, other_x, other_y, _CORNER.TOP_LEFT),     corner(my_rot, my_x, my_y, _CORNER.BOTTOM_RIGHT))
+    )
+
+    # adjacent hosts are an error unless the first coinciding port of ours that's on meets one of theirs that's on.
+    # walk the port pairs backwards so the first pair in scalar loop order has the last word
+    shape  = np.broadcast(my_x, other_x).shape
+    result = np.full(shape, CONN.ERROR, dtype=np.int8)
+
+    for i in reversed(range(4)):
+        my_on = (my_ports & _PORT_BITS[i]) != 0
+        my_px = my_x + _PORTS[my_rot, i, 0]
+        my_py = my_y + _PORTS[my_rot, i, 1]
+
+        for j in reversed(range(4)):
+            hit = my_on & (my_px == other_x + _PORTS[other_rot, j, 0]) & (my_py == other_y + _PORTS[other_rot, j, 1])
+            other_on = (other_ports & _PORT_BITS[j]) != 0
+
+            result = np.where(hit, np.where(other_on, CONN.CONNECTED, CONN.ERROR), result).astype(np.int8)
+
+    result[~adjacent | corners] = CONN.DISCONNECTED
+    result[overlap] = CONN.ERROR
+
+    return result
+
+# fold a row of per-host CONNs into the CONN of the placement as a whole, same as Network.validate
+def _fold(conns, axis=-1):
+    return np.where(
+        (conns == CONN.ERROR).any(axis=axis), CONN.ERROR,
+        np.where((conns == CONN.CONNECTED).any(axis=axis), CONN.CONNECTED, CONN.DISCONNECTED)
+    )
+
+class ArrayNetwork():
+    def __init__(self, capacity=64):
+        self.n     = 0
+        self.hosts = [] # the Host each row was added from, in row order
+
+        self.x     = np.empty(capacity, dtype=np.int64)
+        self.y     = np.empty(capacity, dtype=np.int64)
+        self.rot   = np.empty(capacity, dtype=np.int64)
+        self.ports = np.empty(capacity, dtype=np.int64)
+
+    # build from the hosts of a _network.Network
+    @classmethod
+    def from_network(cls, network):
+        net = cls(max(64, len(network.hosts)))
+
+        for host in network.hosts:
+            net.add(host)
+
+        return net
+
+    def add(self, host):
+        if self.n == len(self.x):
+            for name in ('x', 'y', 'rot', 'ports'):
+                setattr(self, name, np.resize(getattr(self, name), max(1, 2 * self.n)))
+
+        self.x[self.n]     = host.origin.x
+        self.y[self.n]     = host.origin.y
+        self.rot[self.n]   = host.rotation
+        self.ports[self.n] = host.ports
+        self.hosts.append(host)
+        self.n += 1
+
+    # take host off the board. rows after it move up one, so everything stays in the order it was added. raises
+    # ValueError if host isn't on it
+    def remove(self, host):
+        i = self.hosts.index(host)
+        del self.hosts[i]
+
+        for column in (self.x, self.y, self.rot, self.ports):
+            column[i:self.n - 1] = column[i + 1:self.n]
+
+        self.n -= 1
+
+    # views of the live part of each array
+    def _columns(self):
+        return self.x[:self.n], self.y[:self.n], self.rot[:self.n], self.ports[:self.n]
+
+    # CONN of host against every host on the board, in the order they were added
+    def check_connectivity(self, host):
+        return classify(host.origin.x, host.origin.y, host.rotation, host.ports, *self._columns())
+
+    # CONN of every candidate against every host, as a (candidates, hosts) array. candidates are parallel int
+    # sequences of origin x, origin y, rotation, and ports
+    def check_connectivity_many(self, xs, ys, rots, ports):
+        column = lambda a: np.asarray(a, dtype=np.int64)[:, None]
+
+        return classify(column(xs), column(ys), column(rots), column(ports), *self._columns())
+
+    # CONN of putting host on the board, see Network.validate
+    def validate(self, host):
+        return int(_fold(self.check_connectivity(host))) if self.n else CONN.DISCONNECTED
+
+    # validate() for a whole batch of candidates at once, ret an array of CONN
+    def validate_many(self, xs, ys, rots, ports):
+        if not self.n:
+            return np.full(len(xs), CONN.DISCONNECTED, dtype=np.int8)
+
+        return _fold(self.check_connectivity_many(xs, ys, rots, ports))
+
+"""
+differential tests against the scalar path
+"""
+if __name__ == "__main__":
+    import random
+    from _network import Network
+
+    rng = random.Random(1337)
+
+    print("test 1: every rotation pair, offset, and port mask pair against Host.check_connectivity")
+    net = ArrayNetwork()
+    for rot in range(4):
+        for ports in range(16):
+            net.add(Host('', 0, 0, ports, rotation=rot))
+
+    others = [(_r, _p) for _r in range(4) for _p in range(16)]
+    for my_rot in range(4):
+        for my_ports in range(16):
+            xs, ys = np.meshgrid(np.arange(-13, 14), np.arange(-13, 14))
+            xs, ys = xs.ravel(), ys.ravel()
+
+            got = net.check_connectivity_many(xs, ys, [my_rot] * len(xs), [my_ports] * len(xs))
+
+            for k, (x, y) in enumerate(zip(xs, ys)):
+                me = Host('', int(x), int(y), my_ports, rotation=my_rot)
+
+                for h, (rot, ports) in enumerate(others):
+                    assert got[k, h] == me.check_connectivity(Host('', 0, 0, ports, rotation=rot)), (my_rot, my_ports, x, y, rot, ports)
+
+    print("\ntest 2: random crowded boards, validate vs Network.validate")
+    for _ in range(20):
+        scalar = Network()
+        for i in range(200):
+            scalar.add(Host('', rng.randrange(-30, 30), rng.randrange(-30, 30), rng.randrange(16), rng.randrange(4)))
+
+        vector = ArrayNetwork.from_network(scalar)
+
+        candidates = [Host('', rng.randrange(-35, 35), rng.randrange(-35, 35), rng.randrange(16), rng.randrange(4)) for _ in range(200)]
+        batch = vector.validate_many(
+            [_c.origin.x for _c in candidates], [_c.origin.y for _c in candidates],
+            [_c.rotation for _c in candidates], [_c.ports for _c in candidates],
+        )
+
+        for candidate, conn in zip(candidates, batch):
+            assert conn == vector.validate(candidate) == scalar.validate(candidate)
+
+    print("\ntest 3: boards kept in step through adds, removes and turns still agree with Network.validate")
+    scalar, vector = Network(), ArrayNetwork(capacity=0)
+    for i in range(300):
+        if scalar.hosts and rng.random() < 0.4:
+            host = rng.choice(scalar.hosts)
+            scalar.remove(host)
+            vector.remove(host)
+
+            # put some back turned, like _state.rotate does
+            if rng.random() < 0.5:
+                host.rotation = rng.randrange(4)
+                scalar.add(host)
+                vector.add(host)
+        else:
+            host = Host('', rng.randrange(-20, 20), rng.randrange(-20, 20), rng.randrange(16), rng.randrange(4))
+            scalar.add(host)
+            vector.add(host)
+
+        candidate = Host('', rng.randrange(-25, 25), rng.randrange(-25, 25), rng.randrange(16), rng.randrange(4))
+        assert vector.n == len(scalar.hosts) and vector.validate(candidate) == scalar.validate(candidate)
+
+    try:
+        vector.remove(candidate)
+        assert False, "removed a host that was never added"
+    except ValueError:
+        pass
+
+    print("\nall tests successful!")
@@ -1,5 +1,7 @@
 from _enum import Enum
 from enum import IntEnum
+from weakref import WeakValueDictionary
+from collections import deque
 
 from _debug import *
 
@@ -13,6 +15,8 @@ HEIGHT = 4
 
 # obvious
 class Point():
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -86,52 +90,149 @@ _PORT_TRANSFORM = [
     [Point(HEIGHT // 2, WIDTH),      Point(HEIGHT, WIDTH // 2),      Point(HEIGHT // 2, 0),               Point(0, WIDTH // 2)]
 ]
 
-# initialize a host by calling the constructor on a HostInfo, which confs the host's name, ports, etc and other properties of the card as it appears in one's hand
+# index w/ rotation, then port index, to receive the _WALL that port sits on
+_PORT_FACING = [
+    [
+        _WALL.LEFT   if _p.x == _HITBOX_TRANSFORM[_r][_WALL.LEFT]  else
+        _WALL.RIGHT  if _p.x == _HITBOX_TRANSFORM[_r][_WALL.RIGHT] else
+        _WALL.TOP    if _p.y == _HITBOX_TRANSFORM[_r][_WALL.TOP]   else
+        _WALL.BOTTOM for _p in _PORT_TRANSFORM[_r]
+    ] for _r in range(4)
+]
+
+# the wall facing each wall
+_OPPOSITE = {_WALL.LEFT: _WALL.RIGHT, _WALL.RIGHT: _WALL.LEFT, _WALL.TOP: _WALL.BOTTOM, _WALL.BOTTOM: _WALL.TOP}
+
+# index w/ ports, then rotation, to receive ((dx, dy), on) for the top, right, bottom and left ports, in that order
+_PORTBOX = [
+    [tuple(((_p.x, _p.y), bool(_m & (1 << _i))) for _i, _p in enumerate(_PORT_TRANSFORM[_r])) for _r in range(4)]
+    for _m in range(16)
+]
+
+# index w/ rotation to receive the hitbox deltas from origin, as _HITBOX_TRANSFORM, and the corner deltas, as
+# _CORNER_TRANSFORM but ((dx, dy), ...) rather than Points
+_HITBOX  = [tuple(_HITBOX_TRANSFORM[_r]) for _r in range(4)]
+_CORNERS = [tuple((_p.x, _p.y) for _p in _CORNER_TRANSFORM[_r]) for _r in range(4)]
+
+# index w/ ports, then rotation, to receive _WALL -> (dx, dy) of the open port facing that wall, for every wall which
+# has one
+_FACING = [
+    [{_PORT_FACING[_r][_i]: (_p.x, _p.y) for _i, _p in enumerate(_PORT_TRANSFORM[_r]) if _m & (1 << _i)} for _r in range(4)]
+    for _m in range(16)
+]
+
+"""
+what's printed on a card, as opposed to where it's been put: its name and which ports it has open. there's only
+ever one HostDef for each (name, ports) made by hostdef(), shared by every Host played from it (and every deck and
+hand holding it, see _hostdef). a Host made from a name nothing has asked hostdef() for gets a def of its own,
+which isn't kept track of, so one-off names don't pay for a place in the shared table. they never change once made
+
+where the card's ports end up turned each way round, and which wall each open one faces, only depends on the ports,
+so it's worked out for every port mask at import and defs just point at theirs. its hitbox and corners don't even
+depend on those, so every def shares the one table of each
+"""
+class HostDef():
+    __slots__ = ('name', 'ports', 'portbox', 'facing', '__weakref__')
+
+    hitbox  = _HITBOX # see _HITBOX
+    corners = _CORNERS # see _CORNERS
+
+    def __init__(self, name, ports):
+        if not isinstance(ports, int) or not 0 <= ports < 16:
+            raise ValueError(f"bad ports {ports!r} for host {name!r}")
+
+        put = super().__setattr__
+        put('name', name)
+        put('ports', ports) # which ports this card has open, see PORT above
+
+        put('portbox', _PORTBOX[ports]) # see _PORTBOX
+        put('facing', _FACING[ports]) # see _FACING
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"HostDef is immutable, can't set {name}")
+
+    def __repr__(self):
+        return f"HostDef({self.name!r}, {self.ports})"
+
+# (name, ports) -> HostDef, for as long as anything holds on to it
+_defs = WeakValueDictionary()
+
+# the one HostDef there is for name and ports. raises ValueError if ports isn't a port mask
+def hostdef(name, ports):
+    if (d := _defs.get((name, ports))) is None:
+        d = _defs[(name, ports)] = HostDef(name, ports)
+
+    return d
+
+# a card on the board. everything but where it is and which way round is its HostDef's
 class Host():
+    __slots__ = ('hostdef', 'origin', 'rotation', 'connections')
+
     def __init__(self, name, origin_x, origin_y, ports, rotation=0):
+        self.hostdef = _defs.get((name, ports)) or HostDef(name, ports)
+
         # (x,y) of top left point
         self.origin = Point(origin_x, origin_y)
 
-        # which ports this card has open, see PORT above
-        self.ports = ports
-
         # rotation from 0 to 3, 90d clockwise increments
         self.rotation = rotation
 
         # other hosts this host is immediately connected to
         self.connections = []
 
-    # return card's hitbox data as [left x, right x, top y, bottom y]
+    # a host played from the card d, a HostDef, without looking it up again
+    @classmethod
+    def from_def(cls, d, origin_x, origin_y, rotation=0):
+        host = cls.__new__(cls)
+
+        host.hostdef     = d
+        host.origin      = Point(origin_x, origin_y)
+        host.rotation    = rotation
+        host.connections = []
+
+        return host
+
+    @property
+    def name(self):
+        return self.hostdef.name
+
+    @property
+    def ports(self):
+        return self.hostdef.ports
+
+    # return card's hitbox data as (left x, right x, top y, bottom y)
     def get_hitbox(self):
-        deltas = _HITBOX_TRANSFORM[self.rotation]
+        x, y = self.origin.x, self.origin.y
+        left, right, top, bottom = self.hostdef.hitbox[self.rotation]
 
-        return [self.origin.x + deltas[0], self.origin.x + deltas[1], self.origin.y + deltas[2], self.origin.y + deltas[3]]
+        return (x + left, x + right, y + top, y + bottom)
 
-    # return card's corners as [top left, top right, bottom left, bottom right]
+    # return card's corners as ((x, y), ...) for top left, top right, bottom left, bottom right
     def get_corners(self):
-        deltas = _CORNER_TRANSFORM[self.rotation]
+        x, y = self.origin.x, self.origin.y
 
-        return [
-            self.origin + deltas[_CORNER.TOP_LEFT],
-            self.origin + deltas[_CORNER.TOP_RIGHT],
-            self.origin + deltas[_CORNER.BOTTOM_LEFT],
-            self.origin + deltas[_CORNER.BOTTOM_RIGHT]
-        ]
+        return tuple((x + _dx, y + _dy) for _dx, _dy in self.hostdef.corners[self.rotation])
 
-    # return a list of (point, state) for card's ports, where point is the space occupied and state is whether that port is on
+    # return a list of ((x, y), state) for card's ports, where (x, y) is the space occupied and state is whether that
+    # port is on
     def get_portbox(self):
-        return [
-            (self.origin + _PORT_TRANSFORM[self.rotation][_i], bool(self.ports & _port)) for _i, _port in enumerate((
-                PORT.TOP,
-                PORT.RIGHT,
-                PORT.BOTTOM,
-                PORT.LEFT
-            ))
-        ]
+        x, y = self.origin.x, self.origin.y
 
+        return [((x + _dx, y + _dy), _on) for (_dx, _dy), _on in self.hostdef.portbox[self.rotation]]
 
-    # determine connectivity status w/ target, see CONN
+    # determine connectivity status w/ target, see CONN. one lookup into the precomputed _CONN_TABLE
     def check_connectivity(self, other):
+        dx = other.origin.x - self.origin.x + _REACH
+        dy = other.origin.y - self.origin.y + _REACH
+
+        # too far apart for anything to happen
+        if not (0 <= dx < _SPAN and 0 <= dy < _SPAN):
+            return CONN.DISCONNECTED
+
+        return _CONN_TABLE[((self.rotation << 2 | other.rotation) * _SPAN + dx) * _SPAN + dy][self.hostdef.ports << 4 | other.hostdef.ports]
+
+    # the rules check_connectivity's table is built from, worked out the long way
+    def _check_connectivity_scalar(self, other):
         # first, we have to check for overlap. any overlap is immediately illegal
         my_hitbox    = self.get_hitbox()
         other_hitbox = other.get_hitbox()
@@ -188,10 +289,326 @@ class Host():
         # if no adjacency and no overlap, there's no connection here and no error: move on
         return CONN.DISCONNECTED
 
+"""
+connectivity only depends on both rotations, both port masks, and the offset between origins, all of which are small
+integers. so work out every case once at import, and check_connectivity becomes a single lookup
+"""
+# no hitbox reaches further than max(WIDTH, HEIGHT) from its origin, so hosts whose origins are further apart than
+# twice that on either axis can't even touch
+_REACH = 2 * max(WIDTH, HEIGHT)
+_SPAN  = 2 * _REACH + 1
+
+# index w/ ((my rotation << 2 | other rotation) * _SPAN + dx + _REACH) * _SPAN + dy + _REACH to receive a 256 byte
+# table, which you index w/ (my ports << 4 | other ports) to receive the CONN
+def _build_conn_table():
+    uniform = {_c: bytes([_c]) * 256 for _c in range(len(CONN))}
+    table   = []
+
+    for my_rotation in range(4):
+        for other_rotation in range(4):
+            for dx in range(-_REACH, _REACH + 1):
+                for dy in range(-_REACH, _REACH + 1):
+                    conn = lambda my_ports, other_ports: Host('', 0, 0, my_ports, my_rotation)._check_connectivity_scalar(
+                        Host('', dx, dy, other_ports, other_rotation)
+                    )
+
+                    # with every port off or every port on, results only agree if ports don't come into it at all
+                    if (none := conn(0, 0)) == conn(15, 15):
+                        table.append(uniform[none])
+                        continue
+
+                    # otherwise it's down to the ports. the first coinciding pair (in check order) where our port is
+                    # on decides it, and if there's no such pair it's an error
+                    me    = Host('', 0, 0, 0, my_rotation).get_portbox()
+                    other = Host('', dx, dy, 0, other_rotation).get_portbox()
+                    pairs = [(_i, _j) for _i, (_mp, _) in enumerate(me) for _j, (_op, _) in enumerate(other) if _mp == _op]
+
+                    def by_ports(my_ports, other_ports):
+                        for i, j in pairs:
+                            if my_ports & (1 << i):
+                                return CONN.CONNECTED if other_ports & (1 << j) else CONN.ERROR
+
+                        return CONN.ERROR
+
+                    table.append(bytes(by_ports(_mp, _op) for _mp in range(16) for _op in range(16)))
+
+    return table
+
+_CONN_TABLE = _build_conn_table()
+
+# side length of a spatial index cell. card sized, so any host only ever covers a handful of cells
+CELL = max(WIDTH, HEIGHT)
+
+# every cell a hitbox covers, edges included, so that hosts which merely touch still share a cell
+def _cells(hitbox):
+    left, right, top, bottom = hitbox
+
+    return [(_cx, _cy) for _cx in range(left // CELL, right // CELL + 1) for _cy in range(bottom // CELL, top // CELL + 1)]
+
+"""
+the board. besides the hosts themselves, keeps
+  - a spatial index, so placement checks only look at hosts close by
+  - the connection graph (Host.connections), plus a union-find over it so reachability is near O(1)
+  - shortest path trees, cached per component and thrown out only when that component changes
+  - the frontier: every port which is on, but which no other host has a port up against yet
+"""
 class Network():
     def __init__(self):
         self.hosts = []
 
+        # uniform grid: (cell x, cell y) -> hosts covering that cell. dicts are used as insertion ordered sets
+        self._grid = {}
+
+        # union-find. every component is keyed by its root, which maps to its members
+        self._parent  = {}
+        self._members = {}
+
+        # root -> {source host -> BFS parent pointers out of source}
+        self._paths = {}
+
+        # (x, y) -> {host: port index} for every host with a port, on or off, at that point
+        self._ports = {}
+
+        # (x, y) -> (host, port index) for every open port on the frontier
+        self._frontier = {}
+
+    # put host on the board without checking legality, and connect it up to whatever it connects to. see place()
+    def add(self, host):
+        self.hosts.append(host)
+
+        for cell in _cells(host.get_hitbox()):
+            self._grid.setdefault(cell, {})[host] = None
+
+        # any port we're up against is off the frontier now, and ours are on it unless someone's up against them
+        for i, (point, on) in enumerate(host.get_portbox()):
+            facing = self._ports.setdefault(point, {})
+            facing[host] = i
+
+            if on and len(facing) == 1:
+                self._frontier[point] = (host, i)
+            else:
+                self._frontier.pop(point, None)
+
+        self._parent[host]  = host
+        self._members[host] = {host: None}
+
+        for other in self.neighbours(host):
+            if host.check_connectivity(other) == CONN.CONNECTED:
+                host.connections.append(other)
+                other.connections.append(host)
+
+                self._union(host, other)
+
+    def remove(self, host):
+        self.hosts.remove(host)
+
+        for cell in _cells(host.get_hitbox()):
+            del self._grid[cell][host]
+
+            if not self._grid[cell]:
+                del self._grid[cell]
+
+        # whoever we were up against may have an open port again
+        for point, _ in host.get_portbox():
+            facing = self._ports[point]
+            del facing[host]
+
+            self._frontier.pop(point, None)
+
+            if not facing:
+                del self._ports[point]
+
+            elif len(facing) == 1:
+                other, i = next(iter(facing.items()))
+
+                if other.hostdef.ports & (1 << i):
+                    self._frontier[point] = (other, i)
+
+        root    = self._find(host)
+        members = self._members.pop(root)
+        self._paths.pop(root, None)
+
+        del members[host]
+        del self._parent[host]
+
+        for other in host.connections:
+            other.connections.remove(host)
+        host.connections = []
+
+        # taking host out may have split its component. regroup whatever's left of it from scratch
+        regrouped = set()
+
+        for start in members:
+            if start in regrouped:
+                continue
+
+            component = self._walk(start)
+            for member in component:
+                self._parent[member] = start
+
+            self._members[start] = component
+            regrouped.update(component)
+
+    # open ports as ((x, y), host, port index)
+    def frontier(self):
+        return [(_point, *_port) for _point, _port in self._frontier.items()]
+
+    # every legal (origin x, origin y, rotation) for card, a HostDef or just a port mask. any legal placement has to
+    # connect through an open port on the frontier, so only spots which put one of the card's ports up against one are
+    # tried, and only with ports facing the right way. a generator, so stop pulling once you've seen enough. an empty
+    # board has no frontier, and so yields nothing, even though anything goes there
+    def legal_placements(self, card):
+        if not isinstance(card, HostDef):
+            card = hostdef('', card)
+
+        ports = card.ports
+        tried = set()
+
+        # snapshot, so the caller may change the board between pulls
+        for (x, y), host, i in self.frontier():
+            facing = _OPPOSITE[_PORT_FACING[host.rotation][i]]
+
+            for rotation, walls in enumerate(card.facing):
+                if (delta := walls.get(facing)) is None:
+                    continue
+
+                placement = (x - delta[0], y - delta[1], rotation)
+
+                if placement in tried:
+                    continue
+                tried.add(placement)
+
+                if self._validate(placement[0], placement[1], rotation, ports) == CONN.CONNECTED:
+                    yield placement
+
+    # every host joined to host by some path of connections, host included
+    def component(self, host):
+        return self._members[self._find(host)].keys()
+
+    # is there some path of connections between a and b
+    def reachable(self, a, b):
+        return self._find(a) is self._find(b)
+
+    # fewest hops path from a to b as a list of hosts, ends included, or None if there's no path at all
+    def shortest_path(self, a, b):
+        root = self._find(a)
+
+        if self._find(b) is not root:
+            return None
+
+        trees = self._paths.setdefault(root, {})
+        if (tree := trees.get(a)) is None:
+            tree = trees[a] = self._bfs(a)
+
+        path = [b]
+        while path[-1] is not a:
+            path.append(tree[path[-1]])
+
+        path.reverse()
+        return path
+
+    def _find(self, host):
+        parent = self._parent
+
+        # path halving
+        while parent[host] is not host:
+            parent[host] = parent[parent[host]]
+            host = parent[host]
+
+        return host
+
+    # merge the components of a and b, throwing out the cached paths of both
+    def _union(self, a, b):
+        a = self._find(a)
+        b = self._find(b)
+
+        self._paths.pop(a, None)
+        self._paths.pop(b, None)
+
+        if a is b:
+            return
+
+        # fold the smaller component into the bigger one
+        if len(self._members[a]) < len(self._members[b]):
+            a, b = b, a
+
+        self._parent[b] = a
+        self._members[a].update(self._members.pop(b))
+
+    # BFS parent pointers for every host reachable from source
+    def _bfs(self, source):
+        parents = {source: None}
+        queue   = deque((source,))
+
+        while queue:
+            host = queue.popleft()
+
+            for other in host.connections:
+                if other not in parents:
+                    parents[other] = host
+                    queue.append(other)
+
+        return parents
+
+    # every host reachable from start, as an insertion ordered set
+    def _walk(self, start):
+        return dict.fromkeys(self._bfs(start))
+
+    # hosts on the board which could possibly overlap or touch host
+    def neighbours(self, host):
+        return self._near(host.origin.x, host.origin.y, host.rotation, host)
+
+    # hosts on the board which could possibly overlap or touch a card at (x, y) turned rotation, bar skip
+    def _near(self, x, y, rotation, skip=None):
+        grid   = self._grid
+        nearby = {}
+        deltas = _HITBOX[rotation]
+
+        for cell in _cells((x + deltas[0], x + deltas[1], y + deltas[2], y + deltas[3])):
+            if cell in grid:
+                nearby.update(grid[cell])
+
+        nearby.pop(skip, None)
+        return nearby.keys()
+
+    # connectivity status of putting host on the board, see CONN. ERROR if it clashes with any host, otherwise
+    # CONNECTED if it connects to at least one, otherwise DISCONNECTED
+    def validate(self, host):
+        return self._validate(host.origin.x, host.origin.y, host.rotation, host.hostdef.ports, host)
+
+    # validate() for a card with ports at (x, y) turned rotation, without needing a Host for it. skip is left out, as
+    # neighbours() leaves out the host it's asked about. check_connectivity is inlined, it's most of the work
+    def _validate(self, x, y, rotation, ports, skip=None):
+        result = CONN.DISCONNECTED
+        row    = rotation << 2
+
+        for other in self._near(x, y, rotation, skip):
+            dx = other.origin.x - x + _REACH
+            dy = other.origin.y - y + _REACH
+
+            if not (0 <= dx < _SPAN and 0 <= dy < _SPAN):
+                continue
+
+            conn = _CONN_TABLE[((row | other.rotation) * _SPAN + dx) * _SPAN + dy][ports << 4 | other.hostdef.ports]
+
+            if conn == CONN.ERROR:
+                return CONN.ERROR
+
+            if conn == CONN.CONNECTED:
+                result = CONN.CONNECTED
+
+        return result
+
+    # put host on the board if it's a legal placement: anywhere on an empty board, otherwise it has to connect to
+    # something without clashing with anything
+    def place(self, host):
+        conn = self.validate(host)
+
+        if conn == CONN.ERROR or (conn == CONN.DISCONNECTED and self.hosts):
+            raise ValueError(f"illegal placement of {host.name} at {host.origin} rotation {host.rotation}: {CONN[conn]}")
+
+        self.add(host)
+
 """
 unit tests
 """
@@ -214,5 +631,138 @@ if __name__ == "__main__":
     print("\ntest 6: side adjacent, no ports touching")
     assert Host('', 0, 0, 15, rotation=0).check_connectivity(Host('', 9, 6, 15, rotation=1)) == CONN.ERROR
 
+    print("\ntest 7: connectivity table vs the long way, exhaustively")
+    for my_rotation in range(4):
+        for other_rotation in range(4):
+            for dx in range(-_REACH - 2, _REACH + 3):
+                for dy in range(-_REACH - 2, _REACH + 3):
+                    for my_ports in range(16):
+                        me = Host('', 0, 0, my_ports, rotation=my_rotation)
+
+                        for other_ports in range(16):
+                            other = Host('', dx, dy, other_ports, rotation=other_rotation)
+                            assert me.check_connectivity(other) == me._check_connectivity_scalar(other)
+
+    print("\ntest 8: network placement")
+    net = Network()
+    net.place(Host('', 0, 0, PORT.RIGHT, rotation=0))
+    assert net.validate(Host('', 6, 0, PORT.LEFT, rotation=0)) == CONN.CONNECTED
+    assert net.validate(Host('', 3, 0, PORT.LEFT, rotation=0)) == CONN.ERROR
+    assert net.validate(Host('', 6, 0, 0, rotation=0)) == CONN.ERROR
+    assert net.validate(Host('', 100, 100, 0, rotation=0)) == CONN.DISCONNECTED
+
+    net.place(Host('', 6, 0, PORT.LEFT, rotation=0))
+    assert len(net.hosts) == 2
+
+    try:
+        net.place(Host('', 100, 100, 0, rotation=0))
+        assert False
+    except ValueError:
+        pass
+
+    print("\ntest 9: network neighbours")
+    far = Host('', 60, 60, 0, rotation=0)
+    net.add(far)
+    assert far not in net.neighbours(Host('', 12, 0, 0, rotation=0))
+    assert net.hosts[1] in net.neighbours(Host('', 12, 0, 0, rotation=0))
+    net.remove(far)
+    assert not net.neighbours(far) and far not in net.hosts
+
+    print("\ntest 10: connection graph")
+    net = Network()
+    chain = [Host(str(_i), 6 * _i, 0, PORT.LEFT | PORT.RIGHT, rotation=0) for _i in range(5)]
+    for host in chain:
+        net.place(host)
+
+    assert chain[1].connections == [chain[0], chain[2]]
+    assert net.reachable(chain[0], chain[4])
+    assert net.shortest_path(chain[0], chain[3]) == chain[:4]
+    assert net.shortest_path(chain[4], chain[4]) == [chain[4]]
+
+    island = Host('island', 100, 100, PORT.LEFT, rotation=0)
+    net.add(island)
+    assert not net.reachable(chain[0], island) and net.shortest_path(chain[0], island) is None
+    assert list(net.component(island)) == [island]
+
+    print("\ntest 11: connection graph after removal")
+    net.remove(chain[2])
+    assert not net.reachable(chain[0], chain[4])
+    assert net.reachable(chain[3], chain[4]) and net.reachable(chain[0], chain[1])
+    assert set(net.component(chain[0])) == {chain[0], chain[1]}
+    assert chain[1].connections == [chain[0]] and chain[2].connections == []
+
+    net.place(chain[2])
+    assert net.shortest_path(chain[4], chain[0]) == chain[::-1]
+
+    print("\ntest 12: frontier")
+    net = Network()
+    first = Host('', 0, 0, PORT.LEFT | PORT.RIGHT, rotation=0)
+    net.place(first)
+    assert sorted(_p for _p, _, _ in net.frontier()) == [(0, -2), (6, -2)]
+
+    second = Host('', 6, 0, PORT.LEFT | PORT.TOP, rotation=0)
+    net.place(second)
+    assert sorted(_p for _p, _, _ in net.frontier()) == [(0, -2), (9, 0)]
+
+    net.remove(second)
+    assert sorted(_p for _p, _, _ in net.frontier()) == [(0, -2), (6, -2)]
+
+    print("\ntest 13: legal placements vs brute force")
+    import random
+    rng = random.Random(7)
+
+    for _ in range(5):
+        net = Network()
+        net.place(Host('', 0, 0, 15, rotation=0))
+
+        for _ in range(6):
+            mask = rng.randrange(1, 16)
+            options = list(net.legal_placements(mask))
+
+            brute = {
+                (_x, _y, _r) for _x in range(-50, 50) for _y in range(-50, 50) for _r in range(4)
+                if net.validate(Host('', _x, _y, mask, rotation=_r)) == CONN.CONNECTED
+            }
+            assert len(options) == len(set(options)) and set(options) == brute
+
+            if options:
+                x, y, r = rng.choice(options)
+                net.place(Host('', x, y, mask, rotation=r))
+
+    print("\ntest 14: host defs are shared, immutable, and agree with the transform tables")
+    card = hostdef('relay', PORT.LEFT | PORT.RIGHT)
+    assert hostdef('relay', PORT.LEFT | PORT.RIGHT) is card and hostdef('relay', PORT.TOP) is not card
+    assert Host('relay', 0, 0, PORT.LEFT | PORT.RIGHT).hostdef is card is Host.from_def(card, 6, 0, 1).hostdef
+
+    # a one-off name gets a def of its own, which isn't shared
+    oneoff = Host('one-off', 0, 0, PORT.TOP).hostdef
+    assert oneoff.ports == PORT.TOP and ('one-off', PORT.TOP) not in _defs and hostdef('one-off', PORT.TOP) is not oneoff
+
+    try:
+        card.ports = 15
+        assert False, "HostDef changed"
+    except AttributeError:
+        pass
+
+    for bad in (-1, 16, 'TB'):
+        try:
+            hostdef('bad', bad)
+            assert False, f"{bad!r} accepted"
+        except ValueError:
+            pass
+
+    for ports in range(16):
+        for rotation in range(4):
+            host = Host.from_def(hostdef('', ports), 5, -3, rotation)
+            assert host.get_portbox() == [
+                ((5 + _p.x, -3 + _p.y), bool(ports & (1 << _i))) for _i, _p in enumerate(_PORT_TRANSFORM[rotation])
+            ]
+            assert host.get_hitbox() == tuple(_d + (5 if _i < 2 else -3) for _i, _d in enumerate(_HITBOX_TRANSFORM[rotation]))
+            assert host.get_corners() == tuple((5 + _p.x, -3 + _p.y) for _p in _CORNER_TRANSFORM[rotation])
+
+    net = Network()
+    net.place(Host('', 0, 0, 15))
+    assert list(net.legal_placements(card)) == list(net.legal_placements(PORT.LEFT | PORT.RIGHT))
+
     print("\nall tests successful!")
 
@@ -0,0 +1,79 @@
+"""
+index over a lobby or game's players so that dispatch and state checks don't have to scan every connection
+
+players are keyed by the fd of the connection they own, grouped by state, and looked up by alias. anything which
+changes a player's state or alias has to go through here, or the indexes go stale
+"""
+
+class Registry():
+    def __init__(self):
+        self._by_fd    = {}
+        self._by_alias = {}
+
+        # state -> dict used as an insertion-ordered set, so iteration order stays the order players got there
+        self._by_state = {}
+
+    def __iter__(self):
+        return iter(self._by_fd.values())
+
+    def __len__(self):
+        return len(self._by_fd)
+
+    def __contains__(self, player):
+        return self._by_fd.get(player.fd) is player
+
+    # start tracking player. player must already carry its fd, state, and alias (if any)
+    def add(self, player):
+        if player.fd in self._by_fd:
+            raise ValueError(f"a player owning fd {player.fd} already exists")
+
+        self._by_fd[player.fd] = player
+        self._by_state.setdefault(player.state, {})[player] = None
+
+        if player.alias is not None:
+            self._by_alias[player.alias] = player
+
+    # stop tracking player entirely
+    def remove(self, player):
+        del self._by_fd[player.fd]
+        del self._by_state[player.state][player]
+
+        if player.alias is not None and self._by_alias.get(player.alias) is player:
+            del self._by_alias[player.alias]
+
+    # get player by file descriptor of the connection they own
+    def by_fd(self, fd):
+        try:
+            return self._by_fd[fd]
+        except KeyError:
+            raise ValueError(f"no player owning fd {fd} exists") from None
+
+    # get player using alias, or None if nobody has it
+    def by_alias(self, alias):
+        return self._by_alias.get(alias)
+
+    # every alias in use, in the order they were taken
+    def aliases(self):
+        return self._by_alias.keys()
+
+    # get players who are in particular state. this is a live view, copy it before changing states while iterating
+    def in_state(self, state):
+        return self._by_state.setdefault(state, {}).keys()
+
+    def count(self, state):
+        return len(self._by_state.get(state, ()))
+
+    def set_state(self, player, state):
+        del self._by_state[player.state][player]
+
+        player.state = state
+        self._by_state.setdefault(state, {})[player] = None
+
+    def set_alias(self, player, alias):
+        if player.alias is not None and self._by_alias.get(player.alias) is player:
+            del self._by_alias[player.alias]
+
+        player.alias = alias
+
+        if alias is not None:
+            self._by_alias[alias] = player
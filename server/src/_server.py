@@ -1,15 +1,51 @@
+import os
 import socket
 import sys
+import time
+import signal
+import secrets
+import msgpack
 
-from select import epoll, EPOLLIN, EPOLLERR
+from collections import deque
+
+from select import epoll, EPOLLIN, EPOLLOUT, EPOLLERR, EPOLLHUP, EPOLLET, EPOLLRDHUP
+
+from _api import Messenger, HIGH_WATER
+from _metrics import Metrics, Exporter, EXPORT_INTERVAL
+from _timers import TimerWheel
 
 import _lobby
+import _journal
+import _snapshot
+import _directory
 from _debug import *
 
 """
 process events recvd from clients and new connections
 """
 
+# default cap on the number of lobbies/games one process will host at once
+MAX_SESSIONS = 1024
+
+# seconds between stats reports when running as a worker under _supervisor
+STATS_INTERVAL = 5
+
+# most ops one connection can have waiting before we stop reading from it
+MAX_QUEUED = 64
+
+# most ops dispatched per call to process(), across every connection. whatever's left waits for the next one
+OPS_PER_TICK = 256
+
+# seconds a connection in the directory can go without sending anything before we hang up on it
+IDLE_TIMEOUT = 600
+
+# connections the kernel holds on to until we get around to accepting them. capped at net.core.somaxconn. the
+# default of 128 overflows in a reconnect storm, and every SYN dropped costs its client a second before retrying
+ACCEPT_BACKLOG = socket.SOMAXCONN
+
+# seconds to wait before accepting again when we're out of fds. edge triggered, nobody would tell us to otherwise
+ACCEPT_RETRY = 0.1
+
 """
 translate events from clients into serverside calls
 
@@ -26,56 +62,66 @@ class _Operation():
     def __call__(self, *args):
         return (self._handle)(*args)
 
-class Engine():
-    def __init__(self, lsock):
+"""
+one lobby, and later the game it turns into. owns its own context, op table, and state machine, so any number of
+them can share one engine. _lobby.init and _game.init set these up
+"""
+class Session():
+    def __init__(self, sid, engine):
+        self.id     = sid
+        self.engine = engine
+
         self.context    = None
         self.statecheck = None
-        self.catch      = None # bind a function here to deal with unexpected process() excepts. ret True if you fixed it.
-
-        self.ops   = []
-        self.queued = []
+        self.catch      = None # bind a function here to deal with unexpected dispatch() excepts. ret True if you fixed it.
 
-        self._lsock = lsock
+        self.ops = []
 
     # bind opcode and ret the ID used to proc that operation
     def register(self, name, handle):
         self.ops.append(_Operation(name, handle))
         return len(self.ops) - 1
 
-    # queue call to handle for op. supply op-agnostic info (anything that ALL ops receive) as
-    # *global_args and op-specific as op_args
-    #
-    # handles will be called in FIFO at next call to process()
-    def queue(self, opcode, op_args, *global_args):
-        self.queued.append((opcode, op_args, global_args))
-
-    # flush queue, calling handles for all queued operations
-    def process(self):
-        for opcode, op_args, global_args in self.queued:
-            # if handle fails for some reason, try to recover by passing the exception off to the
-            # registered handler, if one exists
-            try:
-                (self.ops[opcode])(self.context, *global_args, *op_args)
-
-            except Exception as e:
-                if self.catch is not None:
-                    eprint(f"received {type(e).__name__}, passing to handler {self.catch}")
-
-                    # re-raise exception if catch failed to successfully deal with it
-                    try:
-                        if not (self.catch)(e, self.context, *global_args, *op_args):
-                            eprint("failed to fix it, FATAL time")
-                            raise e
-
-                    except Exception as e:
-                        eprint(f"exception catch handler raised new {type(e).__name__}")
+    # name of the op bound to opcode, for debug output
+    def op_name(self, opcode):
+        return self.ops[opcode].name if 0 <= opcode < len(self.ops) else 'INVALID'
+
+    # call handle for op. global_args are anything that ALL ops receive, op_args are op-specific
+    def dispatch(self, opcode, op_args, *global_args):
+        # if handle fails for some reason, try to recover by passing the exception off to the
+        # registered handler, if one exists
+        try:
+            # negative opcodes would index from the end, and run an op nobody asked for
+            if not 0 <= opcode < len(self.ops):
+                raise IndexError(f"no op bound to opcode {opcode}")
+
+            (self.ops[opcode])(self.context, *global_args, *op_args)
+
+        except Exception as e:
+            if self.catch is not None:
+                eprint(f"received {type(e).__name__}, passing to handler {self.catch}")
+
+                # re-raise exception if catch failed to successfully deal with it
+                try:
+                    if not (self.catch)(e, self.context, *global_args, *op_args):
+                        eprint("failed to fix it, FATAL time")
                         raise e
 
-                else:
-                    eprint(f"received {type(e).__name__}. no catch configured, FATAL time")
+                except Exception as e:
+                    eprint(f"exception catch handler raised new {type(e).__name__}")
                     raise e
 
-        self.queued = []
+            else:
+                eprint(f"received {type(e).__name__}. no catch configured, FATAL time")
+                raise e
+
+    # call fn(*args) after delay seconds, and run state-based checks after. ret the timer, to cancel it with
+    def call_later(self, delay, fn, *args):
+        return self.engine.timers.call_later(delay, self._fire, fn, args)
+
+    def _fire(self, fn, args):
+        fn(*args)
+        self.engine._dirty.add(self)
 
     # if state-based checks exist, run them
     # supply self so that state-based checks can edit context and ops
@@ -83,49 +129,716 @@ class Engine():
         if self.statecheck is not None:
             (self.statecheck)(self)
 
-    # wrapper over context poll()
-    def poll(self):
-        return self.context.poll()
+# what handlers raise over a request that makes no sense: wrong number or type of args, values out of range, or
+# references to things that don't exist. anything else, AttributeError included, is a bug on our end
+CLIENT_ERRORS = (TypeError, ValueError, KeyError, IndexError)
+
+# a Session.catch for session, whose clients (the first of every op's global args) are told their request was bad
+# with error_op and code, rather than it taking the server down. any client whose connection went away mid request
+# is dropped
+def client_catch(session, error_op, code):
+    def catch(e, context, client, *args):
+        if isinstance(e, OSError):
+            dprint(lambda: f"fd {client.fd} went away mid request: {type(e).__name__}")
+            session.engine.drop(client.fd)
+            return True
+
+        if isinstance(e, CLIENT_ERRORS):
+            dprint(lambda: f"bad request from fd {client.fd}: {type(e).__name__}: {e}")
+            client.send(error_op, code)
+            return True
+
+        return False
+
+    return catch
+
+# ops waiting on one connection, and its token bucket if the engine is rate limiting
+class _Inbox():
+    def __init__(self, fd, tokens, now):
+        self.fd     = fd
+        self.ops    = deque()
+        self.tokens = tokens
+        self.stamp  = now
+        self.paused = False # reading from the connection is paused until we've worked through some of ops
+        self.closed = False
+
+        self.seen = self.stamp # last time it sent anything
+        self.idle = None # Timer which hangs up on it if it's quiet for too long
+
+"""
+routes every connection to the session it belongs to. new connections start out in the directory session, where
+they can list, create, and enter lobbies
+
+the engine never touches sockets itself: whoever runs the IO loop hands it messengers via attach(), calls pull()
+when one has input, and drop() when one hangs up or errors out. messengers need recv(limit), pause_reading(),
+resume_reading(), and an eof flag for that. messengers which close themselves (e.g. past the high water mark) are
+noticed through their on_close hook and detached at the next state_check()
+
+players who lose their connection mid game can come back to it: the game hands them a token, and parks itself in
+resumable under it while they're away. the directory's RESUME op calls resume() with it
+
+every connection gets its own bounded queue, and process() takes one op from each in turn, so a client sending
+as fast as it can only ever delays everyone else by one op per round. with a rate set, each connection also gets
+a token bucket of burst ops refilling at rate per second, and ops past it wait their turn instead of being dropped
+
+anything that has to happen later goes on timers, a TimerWheel which process() fires. IO loops should sleep no
+longer than timeout() says
+
+with a journal set (see _journal), everything handed to the engine from outside is recorded, which is enough to
+play it back through another engine and end up in the same place
+"""
+class Engine():
+    def __init__(self, max_sessions=MAX_SESSIONS, max_queued=MAX_QUEUED, ops_per_tick=OPS_PER_TICK, rate=None,
+                 burst=None, idle_timeout=IDLE_TIMEOUT, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.max_queued   = max_queued
+        self.ops_per_tick = ops_per_tick
+        self.rate         = rate
+        self.burst        = burst if burst is not None else rate
+        self.idle_timeout = idle_timeout # None to let connections sit forever
+
+        self.clock   = clock # monotonic seconds, faked for replays and tests
+        self.timers  = TimerWheel(clock=clock)
+        self.journal = None # _journal.Journal everything's recorded to, if anything
+
+        self.sessions  = {} # sid -> Session, not including the directory
+        self.conns     = {} # fd -> messenger
+        self.routes    = {} # fd -> Session that connection currently belongs to
+        self.resumable = {} # resume token -> Session holding a seat for whoever has it
+
+        self._closed = [] # (fd, messenger) of messengers which closed since the last state_check()
+
+        self.n_queued = 0
+        self._inboxes = {} # fd -> _Inbox
+        self._ready   = deque() # inboxes with ops waiting, in the order they'll get their next turn
+
+        # running totals, see stats()
+        self.n_attached   = 0
+        self.n_dispatched = 0
+
+        self.metrics = Metrics()
+
+        # sessions which have seen activity since the last state_check(). idle sessions cost nothing per tick
+        self._dirty = set()
+        self._next_sid = 0
+
+        self.directory = Session(None, self)
+        _directory.init(self.directory)
+
+    # spin up a new session and have init (e.g. _lobby.init) set it up. ret the session
+    def create_session(self, init, *args):
+        if len(self.sessions) >= self.max_sessions:
+            raise ValueError(f"session limit of {self.max_sessions} reached")
+
+        session = Session(self._next_sid, self)
+        self._next_sid += 1
+
+        init(*args, session)
+        self.sessions[session.id] = session
+
+        return session
+
+    # bring back session sid from a snapshot, having restore (e.g. _lobby.restore) set it up from *args. ret the
+    # session. unlike create_session(), this ignores max_sessions, since everything restored was running before
+    def restore_session(self, sid, restore, *args):
+        session = Session(sid, self)
+        restore(*args, session)
+
+        self.sessions[sid] = session
+        self._next_sid = max(self._next_sid, sid + 1)
+
+        return session
+
+    # a fresh resume token. the only thing handlers get that isn't down to what's been sent to them, so it goes
+    # through here to be journaled
+    def new_token(self):
+        token = secrets.token_urlsafe(16)
+
+        if self.journal is not None:
+            self.journal.token(token)
+
+        return token
+
+    # take ownership of a new connection and park it in the directory
+    def attach(self, messenger):
+        fd = messenger.fileno()
+
+        # fd was recycled by the kernel after its last owner was closed out from under us
+        if fd in self.conns:
+            self.detach(fd)
+
+        if self.journal is not None:
+            self.journal.attach(fd, messenger.peer)
+
+        self.conns[fd]    = messenger
+        self._inboxes[fd] = inbox = _Inbox(fd, self.burst, self.clock())
+
+        messenger.on_close = lambda: self._closed.append((fd, messenger))
+
+        if self.idle_timeout is not None:
+            inbox.idle = self.timers.call_later(self.idle_timeout, self._check_idle, inbox)
+
+        self.n_attached += 1
+        self.metrics.accepted += 1
+
+        self.route(fd, self.directory)
+
+    # forget a connection entirely, letting the session it belonged to clean up after it
+    def detach(self, fd):
+        if self.journal is not None:
+            self.journal.detach(fd)
+
+        session   = self.routes.pop(fd)
+        messenger = self.conns.pop(fd)
+
+        self.metrics.leave(session.id, fd, messenger)
+        self.metrics.retire(fd, messenger)
+
+        # anything it had waiting goes with it. process() skips it if it's still in line
+        inbox = self._inboxes.pop(fd)
+        inbox.closed = True
+        self.n_queued -= len(inbox.ops)
+
+        if inbox.idle is not None:
+            inbox.idle.cancel()
+
+        session.context.handle_disconnect(fd)
+        self._dirty.add(session)
+
+    # hang up on the connection owning fd, and forget it. call on EOF, EPOLLHUP, and EPOLLERR
+    def drop(self, fd):
+        messenger = self.conns[fd]
+
+        self.detach(fd)
+        messenger.close()
+
+    # the connection hasn't sent anything in a while. hang up, or if it has since, check back when it could next be
+    # idle for long enough. much cheaper than moving the timer every time an op comes in
+    #
+    # only connections in the directory are reaped. anyone in a lobby or a game may be waiting on everyone else,
+    # sending nothing for as long as that takes, and the server doesn't ping them. they're checked on again in case
+    # they come back to the directory, which starts their clock over
+    def _check_idle(self, inbox):
+        quiet = self.clock() - inbox.seen
+
+        if self.routes.get(inbox.fd) is not self.directory:
+            inbox.idle = self.timers.call_later(self.idle_timeout, self._check_idle, inbox)
+            return
+
+        if quiet < self.idle_timeout:
+            inbox.idle = self.timers.call_later(self.idle_timeout - quiet, self._check_idle, inbox)
+            return
+
+        iprint(lambda: f"fd {inbox.fd}: nothing for {quiet:.0f}s, disconnecting")
+
+        inbox.idle = None
+        self.drop(inbox.fd)
+
+    # hand the connection owning fd back to whichever session token was issued by. ret whether it was still good.
+    # the directory, which it's coming from, drops its own reference
+    def resume(self, fd, token):
+        if (session := self.resumable.pop(token, None)) is None:
+            return False
+
+        session.context.handle_resume(self.conns[fd], token)
+
+        self.metrics.leave(self.routes[fd].id, fd, self.conns[fd])
+        self.routes[fd] = session
+        self._dirty.add(session)
+
+        return True
+
+    # hand connection over to session. ret whether the session accepted it. whichever session gave it up is
+    # responsible for dropping its own reference
+    def route(self, fd, session):
+        if not session.context.handle_inbound(self.conns[fd]):
+            return False
+
+        if (left := self.routes.get(fd)) is not None:
+            self.metrics.leave(left.id, fd, self.conns[fd])
+
+        self.routes[fd] = session
+        self._dirty.add(session)
+
+        # however long it sat quiet elsewhere, it gets a full IDLE_TIMEOUT back in the directory
+        if session is self.directory:
+            self._inboxes[fd].seen = self.clock()
+
+        return True
+
+    # read as many ops from the connection owning fd as its queue has room for. call when it has input. once the
+    # peer has hung up or sent something that isn't a message, the connection is dropped, but only after everything
+    # it sent before that has been dealt with. a client may well shut down its end after pipelining requests, and
+    # still be waiting on the answers
+    def pull(self, fd):
+        if (inbox := self._inboxes.get(fd)) is None:
+            return
+
+        messenger = self.conns[fd]
+
+        for message in messenger.recv(max(0, self.max_queued - len(inbox.ops))):
+            if type(message) is not list or not message or type(message[0]) is not int:
+                dprint(lambda: f"fd {fd}: not a message: {message!r}")
+                messenger.eof = True
+                break
+
+            self.queue(fd, message[0], message[1:])
+
+        if not messenger.eof:
+            return
+
+        # nothing more's coming. stop hearing about it until process() has worked through the rest and comes back
+        if inbox.ops:
+            messenger.pause_reading()
+            return
+
+        dprint(lambda: f"fd {fd}: hung up")
+        self.drop(fd)
+
+    # queue op for the connection owning fd. a connection's ops are dispatched in FIFO by process(), to whichever
+    # session it belongs to at that point. once max_queued are waiting, reading from it is paused. this doesn't
+    # refuse ops past that, it's on whoever calls it to stop (pull() does)
+    def queue(self, fd, opcode, op_args):
+        if (inbox := self._inboxes.get(fd)) is None:
+            return
 
-    # wrapper over context handle_inbound()
-    def handle_inbound(self, *args):
-        (self.context.handle_inbound(*args))
+        if not inbox.ops:
+            self._ready.append(inbox)
 
-def run(players, password, sockaddr):
-    iiprint(f"starting server on {sockaddr}")
+        inbox.ops.append((opcode, op_args))
+        inbox.seen = self.clock()
+        self.n_queued += 1
+
+        if len(inbox.ops) >= self.max_queued and not inbox.paused:
+            inbox.paused = True
+            self.conns[fd].pause_reading()
+            self.metrics.paused += 1
+
+    # fire any timers that are due, then dispatch up to ops_per_tick queued ops, round robin across connections
+    def process(self):
+        now     = self.clock()
+        journal = self.journal
+
+        # a tick is only worth journaling if something happens on it
+        if journal is not None:
+            journal.tick(now)
+
+        if self.timers.poll(now) and journal is not None:
+            journal.fired()
+
+        metrics = self.metrics
+        metrics.queue.observe(self.n_queued)
+
+        budget = self.ops_per_tick
+        ready  = self._ready
+        held   = [] # out of tokens, they go to the back of the line
+
+        while budget and ready:
+            inbox = ready.popleft()
+
+            # connection went away since this was queued
+            if inbox.closed:
+                continue
+
+            if self.rate is not None and not self._take_token(inbox, now):
+                held.append(inbox)
+                continue
+
+            fd = inbox.fd
+            opcode, op_args = inbox.ops.popleft()
+
+            self.n_queued -= 1
+            budget -= 1
+
+            if inbox.ops:
+                ready.append(inbox)
+
+            if (session := self.routes.get(fd)) is not None:
+                self._dispatch(session, fd, opcode, op_args)
+
+            # the op may well have been what got the connection dropped
+            if inbox.closed:
+                continue
+
+            # worked through enough of the backlog, start listening again. only once the op's been dealt with, as
+            # pulling can find a hung up peer with nothing else queued, and hang up on it
+            if inbox.paused and len(inbox.ops) <= self.max_queued // 2:
+                inbox.paused = False
+                self.conns[fd].resume_reading()
+
+                # whatever the messenger already read and held back won't set off another read event
+                self.pull(fd)
+
+            # that was the last of what a peer which hung up had sent. pick up anything left, or hang up on it
+            if not inbox.ops and not inbox.closed and self.conns[fd].eof:
+                self.pull(fd)
+
+        ready.extend(held)
+
+    # hand an op from the connection owning fd to session, which it belongs to
+    def _dispatch(self, session, fd, opcode, op_args):
+        if self.journal is not None:
+            self.journal.op(fd, session.id, opcode, op_args)
+
+        player = session.context.get_player_by_fd(fd)
+        dprint(lambda: f"[{session.id}] {opcode} {session.op_name(opcode)}: {op_args}")
+
+        start = time.perf_counter()
+        session.dispatch(opcode, op_args, player)
+        self.metrics.observe_op(session.op_name(opcode), time.perf_counter() - start)
+
+        self._dirty.add(session)
+        self.n_dispatched += 1
+
+    # seconds until process() has work it's allowed to do, 0 if it has some now, or None if it's waiting on input
+    def timeout(self):
+        timeout = self.timers.timeout()
+
+        if not self._ready or timeout == 0:
+            return timeout
+
+        if self.rate is None:
+            return 0
+
+        now  = self.clock()
+        wait = max(0, min((1 - _i.tokens) / self.rate - (now - _i.stamp) for _i in self._ready))
+
+        return wait if timeout is None else min(wait, timeout)
+
+    # refill inbox's bucket for the time since it was last topped up, and take a token if there is one
+    def _take_token(self, inbox, now):
+        inbox.tokens = min(self.burst, inbox.tokens + (now - inbox.stamp) * self.rate)
+        inbox.stamp  = now
+
+        if inbox.tokens < 1:
+            return False
+
+        inbox.tokens -= 1
+        return True
+
+    # detach connections whose messengers closed on their own, then run state-based checks for every session that
+    # saw activity since last time
+    def state_check(self):
+        closed = self._closed
+        self._closed = []
+
+        for fd, messenger in closed:
+            # anything we dropped ourselves, or whose fd has since been reused, is already taken care of
+            if self.conns.get(fd) is messenger:
+                self.detach(fd)
+
+        dirty = self._dirty
+        self._dirty = set()
+
+        if dirty and self.journal is not None:
+            self.journal.check()
+
+        for session in dirty:
+            session.state_check()
+
+    # snapshot of what the engine is up to. every value is a number, so snapshots from many engines can be summed
+    def stats(self):
+        return {
+            'connections': len(self.conns),
+            'sessions':    len(self.sessions),
+            'attached':    self.n_attached,
+            'dispatched':  self.n_dispatched,
+        }
+
+    # prometheus text snapshot of self.metrics, see _metrics
+    def render_metrics(self):
+        return self.metrics.render(self.conns, self.routes, self.sessions)
+
+# SIGTERM handler for anything with cleaning up to do on the way out. the IO loops unwind through their finally,
+# so the journal's tail makes it to disk, rather than the process dying where it stands
+def _stop(signum, frame):
+    raise SystemExit(0)
+
+# ship a stats snapshot up the pipe to the supervisor. if it's not keeping up, this one just gets dropped
+def report_stats(stats_fd, stats):
+    try:
+        os.write(stats_fd, msgpack.packb(stats))
+    except BlockingIOError:
+        pass
+
+# bring back whatever was snapshotted to path (see _snapshot) if there's one, then open fresh lobbies until there are
+# `lobbies` open. path is None to not bother with snapshots
+def start_sessions(engine, players, password, lobbies, path):
+    if path is not None:
+        _snapshot.restore(engine, path)
+
+    n_open = sum(_s.context.is_open() for _s in engine.sessions.values())
+
+    for _ in range(lobbies - n_open):
+        engine.create_session(_lobby.init, players, password)
+
+# stats_fd is the write end of a pipe to report stats up every STATS_INTERVAL, and worker is our index, if we're a
+# _supervisor worker. metrics_file and admin_sock are paths to export _metrics snapshots to, see _metrics.Exporter.
+# snapshot is a path to snapshot every session to every SNAPSHOT_INTERVAL, and restore them from on startup, see
+# _snapshot. journal is a path to record everything to, see _journal. max_queued, ops_per_tick, rate, burst, and
+# idle_timeout are handed to the Engine
+#
+# with edge set, every socket is registered edge triggered, so each event has to be worked until EAGAIN: accept()
+# is drained in one go, which keeps up with a reconnect storm, and reads go on until the kernel's empty. otherwise
+# it's level triggered, one accept() per event, and epoll keeps reminding us about anything we left behind
+def run(players, password, sockaddr, high_water=HIGH_WATER, lobbies=1, max_sessions=MAX_SESSIONS, metrics_file=None,
+        admin_sock=None, max_queued=MAX_QUEUED, ops_per_tick=OPS_PER_TICK, rate=None, burst=None,
+        idle_timeout=IDLE_TIMEOUT, snapshot=None, journal=None, stats_fd=None, worker=None, edge=False):
+    iiprint(f"starting server on {sockaddr}{' (edge triggered)' if edge else ''}")
+
+    signal.signal(signal.SIGTERM, _stop)
+
+    mode = EPOLLET|EPOLLRDHUP if edge else 0
 
     # init engine. have lobby init its context, register its ops, etc
-    lsock = socket.create_server(sockaddr, reuse_port=True)
+    lsock = socket.create_server(sockaddr, backlog=ACCEPT_BACKLOG, reuse_port=True)
+    lsock.setblocking(False)
 
     ep = epoll()
-    ep.register(lsock.fileno(), EPOLLIN|EPOLLERR)
+    ep.register(lsock.fileno(), EPOLLIN|EPOLLERR|(EPOLLET if edge else 0))
+
+    if snapshot is not None:
+        snapshot = _snapshot.worker_path(snapshot, worker)
+
+    engine = Engine(max_sessions, max_queued, ops_per_tick, rate, burst, idle_timeout)
+    start_sessions(engine, players, password, lobbies, snapshot)
+
+    if journal is not None:
+        engine.journal = _journal.Journal(engine, _snapshot.worker_path(journal, worker))
+
+    exporter = Exporter(
+        engine.render_metrics,
+        _snapshot.worker_path(metrics_file, worker) if metrics_file is not None else None,
+        _snapshot.worker_path(admin_sock, worker) if admin_sock is not None else None,
+        lambda fd: ep.register(fd, EPOLLOUT),
+        ep.unregister,
+    )
+
+    admin_fd = exporter.fileno()
+    if admin_fd is not None:
+        ep.register(admin_fd, EPOLLIN)
+
+    # periodic reports go on the engine's timers like everything else
+    def report():
+        report_stats(stats_fd, engine.stats())
+        engine.timers.call_later(STATS_INTERVAL, report)
+
+    def export():
+        exporter.write()
+        engine.timers.call_later(EXPORT_INTERVAL, export)
+
+    def snap():
+        snapshotter.snapshot()
+        engine.timers.call_later(_snapshot.SNAPSHOT_INTERVAL, snap)
+
+    def flush():
+        engine.journal.flush()
+        engine.timers.call_later(_journal.FLUSH_INTERVAL, flush)
+
+    if stats_fd is not None:
+        os.set_blocking(stats_fd, False)
+        engine.timers.call_later(STATS_INTERVAL, report)
+
+    if metrics_file is not None:
+        engine.timers.call_later(EXPORT_INTERVAL, export)
+
+    if snapshot is not None:
+        snapshotter = _snapshot.Snapshotter(engine, snapshot)
+        engine.timers.call_later(_snapshot.SNAPSHOT_INTERVAL, snap)
 
-    engine = Engine(lsock)
-    _lobby.init(players, password, ep, engine)
+    if journal is not None:
+        engine.timers.call_later(_journal.FLUSH_INTERVAL, flush)
 
-    while True:
-        # deal with all waiting IO
-        for fd, event in engine.poll():
-            if   event == EPOLLIN:
+    # take up to limit new connections, or every one waiting. ret False if we had to stop short of EAGAIN
+    def accept(limit=None):
+        while limit is None or limit > 0:
+            try:
+                sock, addr = lsock.accept()
+            except BlockingIOError:
+                return True
+            except OSError as e:
+                # most likely out of fds. whoever's left waits in the backlog
+                eprint(f"accept failed with {type(e).__name__}: {e}")
+                return False
+
+            # we write whole frames, there's never anything worth waiting to coalesce
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            ep.register(sock.fileno(), EPOLLIN|EPOLLERR|mode)
+
+            engine.attach(Messenger(sock, ep, high_water, addr, edge))
+
+            if limit is not None:
+                limit -= 1
+
+        return True
+
+    accepting = False # edge triggered, and connections were left waiting in the backlog
+    behind    = set() # edge triggered, fds which still had input in the kernel when we stopped reading them
+
+    # whatever the journal has buffered goes out with us, exceptions and SIGTERM included. that's when it matters most
+    try:
+        while True:
+            # sleep until there's IO, or until the next timer or held back op is due
+            timeout = 0 if behind else engine.timeout()
+
+            if accepting:
+                timeout = ACCEPT_RETRY if timeout is None else min(timeout, ACCEPT_RETRY)
+
+            events = ep.poll(-1 if timeout is None else timeout)
+            start  = time.perf_counter()
+
+            if accepting:
+                accepting = not accept()
+
+            # pick up reading where we left off. nothing else is going to tell us to
+            for fd in behind:
+                engine.pull(fd)
+
+            behind = {_fd for _fd in behind if (_m := engine.conns.get(_fd)) is not None and not _m.drained}
+
+            # deal with all waiting IO
+            for fd, event in events:
                 # handle inbound connections
                 if fd == lsock.fileno():
-                    engine.handle_inbound(ep, lsock.accept()[0])
+                    if event & EPOLLIN:
+                        accepting = not accept(None if edge else 1) and edge
+                    continue
+
+                if fd == admin_fd:
+                    exporter.serve()
+                    continue
+
+                # an admin client with room for more of its snapshot
+                if fd in exporter.clients:
+                    exporter.send(fd)
                     continue
 
-                # handle inbound messages
-                player = engine.context.get_player_by_fd(fd)
+                # dropped earlier this iteration
+                if (messenger := engine.conns.get(fd)) is None:
+                    continue
+
+                # push out whatever the client's kernel buffer has room for now
+                if event & EPOLLOUT:
+                    messenger.flush()
+
+                if event & EPOLLRDHUP:
+                    messenger.rdhup = True
+
+                if event & (EPOLLIN|EPOLLRDHUP):
+                    # handle inbound messages
+                    # a single read can carry any number of pipelined messages, queue as many as there's room for.
+                    # this also picks up a clean hangup, as EOF. edge triggered, the peer shutting down its end shows
+                    # up as EPOLLRDHUP, and may come with more than this read has room for. that's still owed an
+                    # answer, so it's read like any other input, up to the EOF: whatever's left in the kernel waits
+                    # in behind, or for the engine to resume reading, and the engine only hangs up once it's dealt
+                    # with all of it
+                    engine.pull(fd)
+
+                # reset, or otherwise gone for good
+                if event & (EPOLLHUP|EPOLLERR) and engine.conns.get(fd) is messenger:
+                    dprint(lambda: f"fd {fd}: {'EPOLLERR' if event & EPOLLERR else 'EPOLLHUP'}")
+                    engine.drop(fd)
+                    continue
+
+                if edge and not messenger.drained and engine.conns.get(fd) is messenger:
+                    behind.add(fd)
+
+            # then, fire due timers and process all waiting operations
+            engine.process()
+
+            # finally, run state-based checks
+            engine.state_check()
+
+            engine.metrics.loop.observe(time.perf_counter() - start)
+    finally:
+        if engine.journal is not None:
+            engine.journal.close()
+
+"""
+unit tests
+"""
+if __name__ == "__main__":
+    import _debug
+
+    from _api import OPS
+
+    _debug.set_level(_debug.LEVEL.ERROR)
+
+    D_OP = OPS.DIRECTORY.SERVER
+
+    # a peer which pipelined messages and shut down its end. everything's read off the socket, EOF included, on the
+    # first recv(), and handed back as many at a time as there's room for
+    class _FakeMessenger():
+        def __init__(self, fd, messages):
+            self.fd      = fd
+            self.peer    = ('127.0.0.1', 0)
+            self.inbound = deque(messages)
+            self.sent    = []
+            self.eof     = False
+            self.closed  = False
+
+            self.bytes_in = self.bytes_out = self.frames_in = self.frames_out = 0
+
+        def fileno(self):
+            return self.fd
+
+        def recv(self, limit):
+            self.eof = True
+            return [self.inbound.popleft() for _ in range(min(limit, len(self.inbound)))]
+
+        def send(self, opcode, *args):
+            self.sent.append(opcode)
+
+        def send_frame(self, frame):
+            self.sent.append(frame)
+
+        def pending(self):
+            return 0
+
+        def pause_reading(self):
+            pass
+
+        def resume_reading(self):
+            pass
+
+        def close(self):
+            self.closed = True
+
+    print("test 1: a peer which hung up gets answers to everything it sent first, however little can be queued")
+    for max_queued in (1, 2, 3, MAX_QUEUED):
+        engine    = Engine(max_queued=max_queued)
+        messenger = _FakeMessenger(10, [[D_OP.LIST]] * 3)
+
+        engine.attach(messenger)
+        engine.pull(10)
+
+        for _ in range(10):
+            engine.process()
+            engine.state_check()
+
+        assert len(messenger.sent) == 3 and messenger.closed and not engine.conns, (max_queued, messenger.sent)
 
-                if None is not (message := player.messenger.recv()):
-                    dprint(f"[{player.messenger.sock.getpeername()[0]}] {message[0]} {'INVALID' if message[0] >= len(engine.ops) else engine.ops[message[0]].name}: {message[1:]}")
+    print("\ntest 2: bad requests get an error back, bugs of ours stay fatal")
+    engine    = Engine()
+    messenger = _FakeMessenger(10, [])
+    engine.attach(messenger)
 
-                    engine.queue(message[0], message[1:], player)
+    session = Session(None, engine)
+    session.context = engine.directory.context
+    session.catch   = client_catch(session, 7, 3)
+    session.register('BAD', lambda context, client, arg: int(arg))
+    session.register('BUG', lambda context, client: client.no_such_thing)
 
-            elif event == EPOLLERR:
-                pass # TODO
+    client = engine.directory.context.get_player_by_fd(10)
+    for opcode, args in ((0, ('x',)), (0, ()), (2, ()), (-1, ())):
+        session.dispatch(opcode, args, client)
 
-        # then, process all waiting operations
-        engine.process()
+    assert messenger.sent == [7] * 4
 
-        # finally, run state-based checks
-        engine.state_check()
+    try:
+        session.dispatch(1, (), client)
+        assert False, "AttributeError swallowed"
+    except AttributeError:
+        pass
 
+    print("\nall tests successful!")
@@ -0,0 +1,266 @@
+"""
+crash recovery: every lobby and game, written out every SNAPSHOT_INTERVAL and read back in on startup
+
+writing happens in a forked child, which gets a copy-on-write view of the whole process as of the fork, and can
+take its time serializing it while the parent gets on with the IO loop. the only pause the loop sees is fork()
+itself. the file is written alongside the old one and renamed over it, so a crash mid-write leaves the last good
+one in place
+
+connections don't survive a restart. lobbies come back empty, and games come back with every player away,
+holding their seat until they RESUME with the token they were given at START (see _game)
+
+format, integers big endian:
+    header :: magic, u16 format version, u32 session count, u32 next session id
+    index :: per session, u32 session id, u64 offset of its record, u32 length of its record
+    records :: per session, what its context's dump() returned, msgpack'd
+
+restoring maps the file and unpacks each record straight out of the mapping, nothing is read up front. games'
+boards aren't rebuilt until something needs them, see _state.GameState.load
+"""
+import os
+import sys
+import mmap
+import struct
+import traceback
+import msgpack
+
+import _lobby
+from _debug import *
+
+# seconds between snapshots
+SNAPSHOT_INTERVAL = 5
+
+MAGIC   = b'SHSN'
+VERSION = 1
+
+HEADER = struct.Struct('!4sHII')
+ENTRY  = struct.Struct('!IQI')
+
+# path for the worker with index worker to keep a file of its own at (snapshots, journals, metrics files and admin
+# sockets all go through here), or path itself outside of _supervisor. by index rather than pid, so a worker
+# replacing a dead one picks up where it left off, rather than leaving a stale file behind
+def worker_path(path, worker):
+    if worker is None:
+        return path
+
+    root, ext = os.path.splitext(path)
+    return f"{root}.{worker}{ext}"
+
+# every session in engine, encoded
+def dump(engine):
+    records = [(_sid, msgpack.packb(_s.context.dump())) for _sid, _s in engine.sessions.items()]
+
+    out    = bytearray(HEADER.pack(MAGIC, VERSION, len(records), engine._next_sid))
+    offset = HEADER.size + ENTRY.size * len(records)
+
+    for sid, record in records:
+        out += ENTRY.pack(sid, offset, len(record))
+        offset += len(record)
+
+    for _, record in records:
+        out += record
+
+    return out
+
+# snapshot engine to path, replacing whatever was there only once the new one is safely on disk
+def write(engine, path):
+    tmp = f"{path}.tmp"
+
+    with open(tmp, 'wb') as f:
+        f.write(dump(engine))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp, path)
+
+# (next session id, [(session id, dump), ...]) from a snapshot in buf, anything supporting the buffer protocol
+def parse(buf):
+    magic, version, count, next_sid = HEADER.unpack_from(buf)
+
+    if magic != MAGIC:
+        raise ValueError("not a snapshot")
+
+    if version != VERSION:
+        raise ValueError(f"version {version} snapshot, we only read version {VERSION}")
+
+    with memoryview(buf) as view:
+        sessions = []
+
+        for i in range(count):
+            sid, offset, length = ENTRY.unpack_from(buf, HEADER.size + i * ENTRY.size)
+            sessions.append((sid, msgpack.unpackb(view[offset:offset + length], raw=False, use_list=True)))
+
+    return next_sid, sessions
+
+# bring back every session in the snapshot in buf. ret how many
+def load(engine, buf):
+    next_sid, sessions = parse(buf)
+
+    for sid, data in sessions:
+        engine.restore_session(sid, _lobby.restore, data)
+
+    engine._next_sid = max(engine._next_sid, next_sid)
+
+    return len(sessions)
+
+# bring back every session snapshotted to path, if there's anything there. ret how many
+def restore(engine, path):
+    if not os.path.exists(path):
+        return 0
+
+    # records are unpacked straight out of the mapping, nothing is read up front
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        try:
+            count = load(engine, m)
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from e
+
+    iiprint(f"restored {count} sessions from {path}")
+    return count
+
+"""
+writes snapshots from a forked child. the IO loop calls snapshot() every SNAPSHOT_INTERVAL
+"""
+class Snapshotter():
+    def __init__(self, engine, path):
+        self.engine = engine
+        self.path   = path
+
+        self._child = None # pid of the child writing the last snapshot, until it's reaped
+
+    # fork off a child to write a snapshot, unless the last one's still at it
+    def snapshot(self):
+        if not self.reap():
+            eprint(f"last snapshot to {self.path} is still being written, skipping this one")
+            return
+
+        if (pid := os.fork()) == 0:
+            code = 0
+
+            try:
+                write(self.engine, self.path)
+            except BaseException:
+                traceback.print_exc(file=sys.stderr)
+                code = 1
+
+            # straight out, without running anything the parent registered to happen at exit
+            os._exit(code)
+
+        self._child = pid
+
+    # collect the last child, if it's done. ret whether there's none left running
+    def reap(self):
+        if self._child is None:
+            return True
+
+        pid, status = os.waitpid(self._child, os.WNOHANG)
+        if pid == 0:
+            return False
+
+        if os.waitstatus_to_exitcode(status) != 0:
+            eprint(f"writing snapshot to {self.path} failed, exit status {os.waitstatus_to_exitcode(status)}")
+
+        self._child = None
+        return True
+
+"""
+unit tests
+"""
+if __name__ == "__main__":
+    import time
+    import tempfile
+
+    import _game
+    import _debug
+
+    from _server import Engine
+    from _network import Host, PORT
+
+    _debug.set_level(_debug.LEVEL.ERROR)
+
+    class _FakeMessenger():
+        def __init__(self, fd):
+            self.fd   = fd
+            self.peer = ('127.0.0.1', 0)
+            self.sent = []
+
+            self.bytes_in = self.bytes_out = self.frames_in = self.frames_out = 0
+
+        def fileno(self):
+            return self.fd
+
+        def send(self, opcode, *args):
+            self.sent.append((opcode, *args))
+
+        def send_frame(self, frame):
+            self.sent.append(msgpack.unpackb(frame[4:]))
+
+        def pause_reading(self):
+            pass
+
+    # a game of two with a couple of hosts on the board, plus a lobby waiting for players
+    def setup(engine):
+        lobby = engine.create_session(_lobby.init, 2, None)
+        game  = engine.create_session(_lobby.init, 2, "hunter2")
+
+        for fd, alias in ((10, 'a'), (11, 'b')):
+            engine.attach(_FakeMessenger(fd))
+            engine.route(fd, game)
+            game.dispatch(_lobby.S_OP.JOIN, (alias, "hunter2"), game.context.get_player_by_fd(fd))
+
+        game.state_check()
+
+        for fd in (10, 11):
+            game.dispatch(_lobby.S_OP.ACK, (), game.context.get_player_by_fd(fd))
+
+        game.state_check()
+        game.context.state.place(Host('x', 0, 0, PORT.RIGHT))
+        game.context.state.place(Host('y', 6, 0, PORT.LEFT))
+
+        return lobby, game
+
+    print("test 1: sessions survive a round trip through a snapshot")
+    engine = Engine()
+    lobby, game = setup(engine)
+    assert isinstance(game.context, _game._GameContext)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'snap')
+        write(engine, path)
+
+        restored = Engine()
+        assert restore(restored, path) == 2
+
+    again = restored.sessions[game.id].context
+    assert restored.sessions[lobby.id].context.n_players == 2 and restored.sessions[lobby.id].context.is_open()
+    # everything as it was, except that everyone's away now
+    hosts, players = again.state.snapshot()
+    assert hosts == game.context.state.snapshot()[0] and again.state.version == game.context.state.version + 2
+    # the board's only built once it's needed
+    assert '_unbuilt' in vars(again.state) and 'network' not in vars(again.state)
+    assert players == {'a': {'seat': 0, 'away': True}, 'b': {'seat': 1, 'away': True}}
+    assert len(again.state.network.hosts[0].connections) == 1
+    assert restored.create_session(_lobby.init, 2, None).id == engine._next_sid
+
+    print("\ntest 2: restored players are away until they resume with their token")
+    token = game.context.tokens[game.context.get_player_by_fd(10)]
+    assert len(again.players) == 0 and set(restored.resumable) == set(game.context.tokens.values())
+
+    restored.attach(_FakeMessenger(20))
+    assert restored.resume(20, token)
+    assert again.get_player_by_fd(20).alias == 'a' and token not in restored.resumable
+    assert not again.state.players['a']['away'] and again.state.players['b']['away']
+
+    print("\ntest 3: snapshots written from a forked child, without holding up the parent")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'snap')
+        snapshotter = Snapshotter(engine, path)
+        snapshotter.snapshot()
+
+        while not snapshotter.reap():
+            time.sleep(0.01)
+
+        with open(path, 'rb') as f:
+            assert f.read() == dump(engine)
+
+    print("\nall tests successful!")
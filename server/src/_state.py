@@ -0,0 +1,339 @@
+"""
+versioned game state, and the diffs clients keep their copy in sync with
+
+every change to the board or to a player's fields goes through GameState, which bumps the version and logs the
+change. a client acks the versions it has applied, and gets sent everything since its last ack, folded down so
+each host or field shows up at most once however many turns it's been. a client so far behind that the log no
+longer reaches back to its ack, or that the diff would come out bigger than the whole thing, gets a snapshot
+
+every change is absolute (put this host here, set this field to that), so applying a diff to any version between
+its base and its target lands on the target. clients can keep acking lazily, and a diff that crosses an ack on
+the wire does no harm
+
+on the wire, changes are flat lists led by their CHANGE:
+    [HOST, hid, name, x, y, ports, rotation] :: host hid is on the board, as given
+    [ROTATE, hid, rotation] :: host hid, already on the board, has turned
+    [REMOVE, hid] :: host hid is off the board
+    [PLAYER, alias, field, value] :: one of a player's fields has changed
+
+and snapshots are ([[hid, name, x, y, ports, rotation], ...], {alias: {field: value}})
+"""
+from collections import deque
+
+from _enum import Enum
+from _network import Network, Host, CONN
+
+from _debug import *
+
+# versions of changes kept around to diff from. clients acking older than this get a snapshot instead
+LOG_SIZE = 256
+
+CHANGE = Enum(
+    'HOST',
+    'ROTATE',
+    'REMOVE',
+    'PLAYER',
+)
+
+class GameState():
+    def __init__(self):
+        self.version = 0
+        self.network = Network()
+        self.players = {} # alias -> {field: value}
+
+        self.hosts = {} # hid -> Host on the board
+        self._hids = {} # Host -> hid
+        self._next_hid = 0
+
+        # (version, change) for the last LOG_SIZE versions, oldest first
+        self._log = deque(maxlen=LOG_SIZE)
+
+    # the state as of now, for _snapshot. unlike snapshot(), this is enough to pick up exactly where we left off,
+    # version and hids included. the log isn't kept, so everyone gets a snapshot next time they sync
+    def dump(self):
+        return (self.version, self._next_hid, self.snapshot()[0], self.players)
+
+    # a GameState from what dump() returned. the board is only built once something needs it (see __getattr__), so
+    # bringing back thousands of games doesn't wait on thousands of boards nobody's looked at yet
+    @classmethod
+    def load(cls, dump):
+        state = cls.__new__(cls)
+        state.version, state._next_hid, state._unbuilt, state.players = dump
+        state._log = deque(maxlen=LOG_SIZE)
+
+        return state
+
+    # the board of a loaded state, the first time anything asks for it
+    def __getattr__(self, attr):
+        if attr not in ('network', 'hosts', '_hids') or '_unbuilt' not in self.__dict__:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {attr!r}")
+
+        hosts = self.__dict__.pop('_unbuilt')
+
+        self.network = Network()
+        self.hosts   = {}
+        self._hids   = {}
+
+        # it was all legal when it was dumped, no need to check it again
+        for hid, name, x, y, ports, rotation in hosts:
+            host = Host(name, x, y, ports, rotation)
+            self.network.add(host)
+
+            self.hosts[hid]  = host
+            self._hids[host] = hid
+
+        return getattr(self, attr)
+
+    # the hid of host, which must be on the board
+    def hid(self, host):
+        return self._hids[host]
+
+    # put host on the board, if it's a legal placement (see Network.place, which raises ValueError if not). ret its hid
+    def place(self, host):
+        self.network.place(host)
+
+        hid = self._next_hid
+        self._next_hid += 1
+
+        self.hosts[hid]  = host
+        self._hids[host] = hid
+
+        self._record((CHANGE.HOST, hid, host.name, host.origin.x, host.origin.y, host.ports, host.rotation))
+        return hid
+
+    # take host hid off the board
+    def remove(self, hid):
+        host = self.hosts.pop(hid)
+        del self._hids[host]
+
+        self.network.remove(host)
+        self._record((CHANGE.REMOVE, hid))
+
+    # turn host hid in place, if it's still legal that way round. raises ValueError, and leaves it be, if not
+    def rotate(self, hid, rotation):
+        if not 0 <= rotation < 4:
+            raise ValueError(f"bad rotation {rotation}")
+
+        host = self.hosts[hid]
+        old  = host.rotation
+
+        self.network.remove(host)
+        host.rotation = rotation
+
+        conn = self.network.validate(host)
+        if conn == CONN.ERROR or (conn == CONN.DISCONNECTED and self.network.hosts):
+            host.rotation = old
+            self.network.add(host)
+
+            raise ValueError(f"illegal rotation of {host.name} to {rotation}: {CONN[conn]}")
+
+        self.network.add(host)
+        self._record((CHANGE.ROTATE, hid, rotation))
+
+    def add_player(self, alias, **fields):
+        self.players[alias] = {}
+
+        for field, value in fields.items():
+            self.set_player(alias, field, value)
+
+    def set_player(self, alias, field, value):
+        fields = self.players[alias]
+
+        if field in fields and fields[field] == value:
+            return
+
+        fields[field] = value
+        self._record((CHANGE.PLAYER, alias, field, value))
+
+    def _record(self, change):
+        self.version += 1
+        self._log.append((self.version, change))
+
+    # the whole thing, see the top of the file. a loaded board nobody's needed yet is already in that shape
+    def snapshot(self):
+        if (hosts := self.__dict__.get('_unbuilt')) is None:
+            hosts = [[_hid, _h.name, _h.origin.x, _h.origin.y, _h.ports, _h.rotation] for _hid, _h in self.hosts.items()]
+
+        return (hosts, self.players)
+
+    # changes taking a client from version base to the current one, folded so each host and field comes up once. ret
+    # None if the log doesn't reach back that far, or if a snapshot would be smaller
+    def diff(self, base):
+        log = self._log
+
+        if not 0 <= base <= self.version:
+            raise ValueError(f"no version {base}, we're on {self.version}")
+
+        if base == self.version:
+            return []
+
+        # the log starts right after whichever version was evicted last
+        if not log or base < log[0][0] - 1:
+            return None
+
+        changes = {} # key the change applies to -> change, in the order each key was first touched
+        added   = set() # hids placed since base, which the client's never heard of
+
+        # versions are consecutive, so everything after base is the tail of the log
+        for i in range(len(log) - (self.version - base), len(log)):
+            change = log[i][1]
+            kind   = change[0]
+
+            if kind == CHANGE.PLAYER:
+                changes[(kind, change[1], change[2])] = change
+                continue
+
+            key = (CHANGE.HOST, change[1])
+
+            if kind == CHANGE.HOST:
+                added.add(change[1])
+                changes[key] = change
+
+            elif kind == CHANGE.ROTATE:
+                # fold a turn into the placement the client hasn't seen yet
+                if change[1] in added:
+                    changes[key] = changes[key][:-1] + (change[2],)
+                else:
+                    changes[key] = change
+
+            # placed and removed again since base. the client may have heard about it from a diff it hasn't acked
+            # yet, so it still has to hear that it's gone
+            else:
+                added.discard(change[1])
+                changes[key] = change
+
+        if len(changes) > len(self.hosts) + sum(len(_f) for _f in self.players.values()):
+            return None
+
+        return list(changes.values())
+
+"""
+unit tests, checked by bringing a client side copy up to date with diffs and comparing it to the real thing
+"""
+if __name__ == "__main__":
+    import copy
+    import random
+
+    from _network import Host, PORT
+
+    # what a client keeps: hid -> [name, x, y, ports, rotation], and alias -> {field: value}
+    class _Replica():
+        def __init__(self, snapshot):
+            hosts, players = snapshot
+
+            self.hosts   = {_h[0]: list(_h[1:]) for _h in hosts}
+            self.players = {_a: dict(_f) for _a, _f in players.items()}
+
+        def apply(self, changes):
+            for change in changes:
+                kind = change[0]
+
+                if kind == CHANGE.HOST:
+                    self.hosts[change[1]] = list(change[2:])
+                elif kind == CHANGE.ROTATE:
+                    self.hosts[change[1]][4] = change[2]
+                elif kind == CHANGE.REMOVE:
+                    self.hosts.pop(change[1], None)
+                else:
+                    self.players.setdefault(change[1], {})[change[2]] = change[3]
+
+        def matches(self, state):
+            return self.__dict__ == _Replica(state.snapshot()).__dict__
+
+    # a random turn: place, turn, or take away a host, or change a player's score
+    def turn(state, rng):
+        roll = rng.random()
+
+        if roll < 0.6 or len(state.hosts) < 2:
+            if not state.hosts:
+                state.place(Host('h0', 0, 0, 15))
+                return
+
+            mask = rng.randrange(1, 16)
+            for x, y, r in state.network.legal_placements(mask):
+                state.place(Host(f'h{state.version}', x, y, mask, rotation=r))
+                return
+
+        elif roll < 0.75:
+            try:
+                state.rotate(rng.choice(list(state.hosts)), rng.randrange(4))
+            except ValueError:
+                pass
+
+        elif roll < 0.85:
+            state.remove(rng.choice(list(state.hosts)))
+
+        else:
+            state.set_player(rng.choice(list(state.players)), 'score', rng.randrange(10))
+
+    rng = random.Random(20)
+
+    print("test 1: a diff from any version in the log brings a client at that version up to date")
+    state = GameState()
+    state.add_player('a', seat=0, score=0)
+    state.add_player('b', seat=1, score=0)
+
+    snapshots = {state.version: _Replica(state.snapshot())}
+    # not every turn goes through, so go by version
+    while state.version < LOG_SIZE + 100:
+        turn(state, rng)
+        snapshots[state.version] = _Replica(state.snapshot())
+
+    diffed = 0
+    for base, replica in snapshots.items():
+        if (changes := state.diff(base)) is None:
+            continue
+
+        replica = copy.deepcopy(replica)
+        replica.apply(changes)
+        assert replica.matches(state), f"diff from {base} is off"
+        diffed += 1
+
+    assert state.diff(0) is None and diffed > LOG_SIZE // 2
+
+    print("\ntest 2: diffs apply cleanly over versions newer than their base, and more than once")
+    base    = state.version - 30
+    changes = state.diff(base)
+
+    for version in (base, base + 10, state.version):
+        replica = copy.deepcopy(snapshots[version])
+        replica.apply(changes)
+        replica.apply(changes)
+        assert replica.matches(state)
+
+    print("\ntest 3: turns fold into placements, and hosts placed and removed since base only show up as removed")
+    state = GameState()
+    first = state.place(Host('a', 0, 0, 15))
+
+    state.rotate(first, 1)
+    assert state.diff(0) == [(CHANGE.HOST, first, 'a', 0, 0, 15, 1)]
+
+    state.rotate(first, 0)
+    base = state.version
+
+    gone = state.place(Host('b', 6, 0, PORT.LEFT))
+    state.remove(gone)
+    assert state.diff(base) == [(CHANGE.REMOVE, gone)]
+
+    hid = state.place(Host('c', 6, 0, PORT.LEFT))
+    assert state.diff(base) == [(CHANGE.REMOVE, gone), (CHANGE.HOST, hid, 'c', 6, 0, PORT.LEFT, 0)]
+
+    print("\ntest 4: clients past the end of the log, or owed more than a snapshot's worth, get a snapshot")
+    state = GameState()
+    state.add_player('a', score=0)
+    for i in range(LOG_SIZE + 10):
+        state.set_player('a', 'score', i + 1)
+
+    assert state.diff(0) is None
+    assert state.diff(state.version - 5) == [(CHANGE.PLAYER, 'a', 'score', LOG_SIZE + 10)]
+
+    state = GameState()
+    chain = [state.place(Host(str(_i), 6 * _i, 0, PORT.LEFT | PORT.RIGHT)) for _i in range(5)]
+    base  = state.version
+
+    for hid in reversed(chain[1:]):
+        state.remove(hid)
+
+    assert state.diff(base) is None
+
+    print("\nall tests successful!")
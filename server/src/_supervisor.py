@@ -0,0 +1,171 @@
+"""
+pre-forked multi-process mode
+
+the supervisor forks N workers. each runs its own epoll loop and engine on its own SO_REUSEPORT listening socket,
+so the kernel spreads incoming connections across them. a connection, and so every session it touches, lives and
+dies in the worker that accepted it. workers report stats up a pipe, the supervisor sums them up, and any worker
+that dies gets replaced
+"""
+import os
+import sys
+import time
+import signal
+import select
+import traceback
+import msgpack
+
+import _server
+from _debug import *
+
+# a worker which dies this soon after starting will likely do it again, so wait this long before replacing it
+MIN_UPTIME = 1
+
+# how often, in seconds, the supervisor wakes to reap and restart workers even if nothing was reported
+_TICK = 0.5
+
+class _Worker():
+    def __init__(self, index):
+        self.index = index
+
+        self.pid      = None
+        self.pipe     = None # read end of the worker's stats pipe
+        self.unpacker = None
+        self.started  = 0
+
+        self.stats      = {} # latest snapshot reported
+        self.restarts   = 0
+        self.respawn_at = None # set while dead and waiting to be replaced
+
+# fork a worker which runs serve(*args) until it dies
+def _spawn(worker, serve, args):
+    r, w = os.pipe()
+
+    if (pid := os.fork()) == 0:
+        os.close(r)
+
+        # the supervisor's handlers are no good to us. serve() sets up its own SIGTERM handler, to see it out cleanly
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        code = 0
+        try:
+            serve(*args, stats_fd=w, worker=worker.index)
+        except SystemExit:
+            pass
+        except BrokenPipeError:
+            eprint(f"worker {worker.index}: supervisor went away, exiting")
+        except BaseException:
+            traceback.print_exc(file=sys.stderr)
+            code = 1
+
+        os._exit(code)
+
+    os.close(w)
+    os.set_blocking(r, False)
+
+    worker.pid        = pid
+    worker.pipe       = r
+    worker.unpacker   = msgpack.Unpacker(raw=False)
+    worker.started    = time.monotonic()
+    worker.stats      = {}
+    worker.respawn_at = None
+
+    iprint(f"worker {worker.index} started as pid {pid}")
+
+# pull in whatever stats the worker has sent since last time
+def _read_stats(worker):
+    try:
+        data = os.read(worker.pipe, 1 << 16)
+    except BlockingIOError:
+        return
+
+    # worker's gone, waitpid will tell us how
+    if not data:
+        os.close(worker.pipe)
+        worker.pipe = None
+        return
+
+    worker.unpacker.feed(data)
+    for stats in worker.unpacker:
+        worker.stats = stats
+
+# collect every dead worker and schedule its replacement
+def _reap(workers):
+    by_pid = {_w.pid: _w for _w in workers}
+
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+
+        if pid == 0:
+            return
+
+        if (worker := by_pid.get(pid)) is None:
+            continue
+
+        now = time.monotonic()
+        eprint(f"worker {worker.index} (pid {pid}) died with status {os.waitstatus_to_exitcode(status)}")
+
+        if worker.pipe is not None:
+            os.close(worker.pipe)
+            worker.pipe = None
+
+        worker.pid        = None
+        worker.stats      = {}
+        worker.respawn_at = now if now - worker.started >= MIN_UPTIME else now + MIN_UPTIME
+
+# sum of the latest stats from every live worker
+def aggregate(workers):
+    total = {}
+    for worker in workers:
+        for key, value in worker.stats.items():
+            total[key] = total.get(key, 0) + value
+
+    total['workers']  = sum(_w.pid is not None for _w in workers)
+    total['restarts'] = sum(_w.restarts for _w in workers)
+
+    return total
+
+# run n_workers copies of serve(*args), restarting them as they die, until we're told to stop. serve is the run()
+# of a server backend, e.g. _server.run, and must take stats_fd and worker keywords
+def run(n_workers, serve, *args):
+    iiprint(f"starting supervisor with {n_workers} workers")
+
+    signal.signal(signal.SIGTERM, _server._stop)
+
+    workers = [_Worker(_i) for _i in range(n_workers)]
+
+    try:
+        for worker in workers:
+            _spawn(worker, serve, args)
+
+        report_due = time.monotonic() + _server.STATS_INTERVAL
+
+        while True:
+            pipes = {_w.pipe: _w for _w in workers if _w.pipe is not None}
+
+            for fd in select.select(list(pipes), [], [], _TICK)[0]:
+                _read_stats(pipes[fd])
+
+            _reap(workers)
+
+            now = time.monotonic()
+            for worker in workers:
+                if worker.respawn_at is not None and now >= worker.respawn_at:
+                    worker.restarts += 1
+                    _spawn(worker, serve, args)
+
+            if now >= report_due:
+                iprint(' '.join(f"{_k}={_v}" for _k, _v in aggregate(workers).items()))
+                report_due = now + _server.STATS_INTERVAL
+
+    finally:
+        for worker in workers:
+            if worker.pid is not None:
+                os.kill(worker.pid, signal.SIGTERM)
+
+        for worker in workers:
+            if worker.pid is not None:
+                os.waitpid(worker.pid, 0)
@@ -0,0 +1,260 @@
+"""
+hierarchical timer wheel, for everything the engine needs to happen later: ACK timeouts, idle reaping, periodic
+reports, and whatever the game grows
+
+time is counted in ticks of RESOLUTION seconds. there are LEVELS wheels of 64 slots each, where a slot on level n
+covers 64**n ticks. a timer goes in the lowest level whose slot still tells it apart from now, so level 0 holds
+what's due within the next 64 ticks, level 1 within 4096, and so on. as time catches up to a slot on a higher
+level, its timers cascade down to lower ones, until they're due for real.
+
+scheduling and cancelling are O(1) (each slot is a dict used as an ordered set), and finding the next deadline is
+a bit scan over one 64 bit occupancy mask per level, cheap enough to run every time the IO loop goes to sleep
+"""
+import time
+
+from math import ceil
+
+from _debug import *
+
+# seconds per tick
+RESOLUTION = 0.001
+
+_BITS   = 6
+_SLOTS  = 1 << _BITS
+_MASK   = _SLOTS - 1
+_LEVELS = 7 # 64**7 ms is a little over 139 years
+
+# furthest ahead a timer can go, in ticks. anything later is clamped to it
+_MAX_TICKS = (1 << (_BITS * _LEVELS)) - 1
+
+class Timer():
+    __slots__ = ('when', 'fn', 'args', 'cancelled', '_wheel', '_level', '_index')
+
+    def __init__(self, wheel, when, fn, args):
+        self.when = when # tick it's due on
+        self.fn   = fn
+        self.args = args
+
+        self.cancelled = False
+
+        self._wheel = wheel
+        self._level = None
+        self._index = None
+
+    # make sure it never fires. fine to call on a timer which already has
+    def cancel(self):
+        if self.cancelled:
+            return
+
+        self.cancelled = True
+        self._wheel._n -= 1
+
+        # otherwise it's in the middle of being processed, and poll() will skip it
+        if self._level is not None:
+            self._wheel._remove(self)
+
+class TimerWheel():
+    def __init__(self, resolution=RESOLUTION, clock=time.monotonic):
+        self.resolution = resolution
+        self.clock      = clock
+
+        self._start   = clock()
+        self._elapsed = 0 # ticks since _start we've processed up to
+
+        self._slots    = [[{} for _ in range(_SLOTS)] for _ in range(_LEVELS)]
+        self._occupied = [0] * _LEVELS # bit n set when slot n on that level holds any timers
+
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    # call fn(*args) once at least delay seconds have passed. ret the Timer, to cancel it with
+    def call_later(self, delay, fn, *args):
+        when = ceil((self.clock() + delay - self._start) / self.resolution)
+
+        # never on the tick we've already processed, or it'd sit there until the wheel comes back around
+        when = min(max(when, self._elapsed + 1), self._elapsed + _MAX_TICKS)
+
+        timer = Timer(self, when, fn, args)
+        self._insert(timer)
+        self._n += 1
+
+        return timer
+
+    # seconds until the next timer might be due, 0 if one is, or None if there aren't any
+    def timeout(self):
+        if (expiration := self._next_expiration()) is None:
+            return None
+
+        return max(0, self._start + expiration[2] * self.resolution - self.clock())
+
+    # fire every timer that's due as of now, by clock, or as of clock() if it's not given. ret how many fired
+    def poll(self, now=None):
+        now   = int(((self.clock() if now is None else now) - self._start) / self.resolution)
+        fired = 0
+
+        while (expiration := self._next_expiration()) is not None and expiration[2] <= now:
+            level, index, deadline = expiration
+
+            timers = self._slots[level][index]
+            self._slots[level][index] = {}
+            self._occupied[level] &= ~(1 << index)
+
+            self._elapsed = deadline
+
+            for timer in timers:
+                timer._level = None
+
+            for timer in timers:
+                # an earlier one in this slot cancelled it
+                if timer.cancelled:
+                    continue
+
+                # not due yet, just closer. move it down a level
+                if timer.when > deadline:
+                    self._insert(timer)
+                    continue
+
+                self._n -= 1
+                timer.cancelled = True
+                fired += 1
+
+                timer.fn(*timer.args)
+
+        self._elapsed = max(self._elapsed, now)
+
+        return fired
+
+    def _insert(self, timer):
+        # the most significant 6 bit digit where when and now differ picks the level
+        level = min(((self._elapsed ^ timer.when) | _MASK).bit_length() - 1, _BITS * _LEVELS - 1) // _BITS
+        index = (timer.when >> (level * _BITS)) & _MASK
+
+        self._slots[level][index][timer] = None
+        self._occupied[level] |= 1 << index
+
+        timer._level = level
+        timer._index = index
+
+    def _remove(self, timer):
+        slot = self._slots[timer._level][timer._index]
+        del slot[timer]
+
+        if not slot:
+            self._occupied[timer._level] &= ~(1 << timer._index)
+
+        timer._level = None
+
+    # (level, slot index, tick the slot starts on) of the next slot to process, or None if they're all empty. a slot
+    # on a lower level always comes before any slot on a higher one
+    def _next_expiration(self):
+        for level, occupied in enumerate(self._occupied):
+            if not occupied:
+                continue
+
+            shift = level * _BITS
+            now   = (self._elapsed >> shift) & _MASK
+
+            # rotate so bit 0 is the current slot, then find the first occupied one from there
+            rotated = ((occupied >> now) | (occupied << (_SLOTS - now))) & ((1 << _SLOTS) - 1)
+            index   = (now + (rotated & -rotated).bit_length() - 1) & _MASK
+
+            level_range = 1 << (shift + _BITS)
+            deadline    = (self._elapsed & ~(level_range - 1)) + (index << shift)
+
+            # slot comes around again in the next lap of this level
+            if deadline < self._elapsed and index != now:
+                deadline += level_range
+
+            return level, index, max(deadline, self._elapsed)
+
+        return None
+
+"""
+unit tests, driven by a fake clock and checked against a plain sort
+"""
+if __name__ == "__main__":
+    import random
+
+    class _Clock():
+        def __init__(self):
+            self.now = 1000.0
+
+        def __call__(self):
+            return self.now
+
+    rng = random.Random(1337)
+
+    print("test 1: timers fire in deadline order, never early, and exactly once")
+    clock = _Clock()
+    wheel = TimerWheel(clock=clock)
+    fired = []
+
+    delays = [rng.choice((rng.uniform(0, 0.1), rng.uniform(0, 10), rng.uniform(0, 5000))) for _ in range(5000)]
+    for i, delay in enumerate(delays):
+        wheel.call_later(delay, lambda _i=i, _d=delay: fired.append((_i, clock.now - 1000.0, _d)))
+
+    assert len(wheel) == len(delays)
+
+    while len(wheel):
+        clock.now = min(clock.now + wheel.timeout() + rng.uniform(0, 0.01), clock.now + rng.uniform(0, 100))
+        wheel.poll()
+
+    assert sorted(_f[0] for _f in fired) == list(range(len(delays)))
+    assert all(at >= delay for _, at, delay in fired)
+
+    order = [_f[0] for _f in fired]
+    ticks = [ceil(delays[_i] / RESOLUTION) for _i in order]
+    assert ticks == sorted(ticks), "fired out of order"
+
+    print("\ntest 2: cancelled timers don't fire, including ones cancelled by a timer in the same slot")
+    clock = _Clock()
+    wheel = TimerWheel(clock=clock)
+    fired = []
+
+    timers = [wheel.call_later(rng.uniform(0, 60), fired.append, _i) for _i in range(2000)]
+    for timer in timers[::2]:
+        timer.cancel()
+        timer.cancel()
+
+    # same delay on the same clock lands on the same tick, and a slot fires in the order it was filled
+    later = []
+    first = wheel.call_later(30, lambda: later[0].cancel())
+    later.append(wheel.call_later(30, fired.append, 'late'))
+    assert first.when == later[0].when
+
+    clock.now += 61
+    wheel.poll()
+
+    assert 'late' not in fired
+    assert sorted(fired) == list(range(1, 2000, 2))
+    assert len(wheel) == 0
+
+    print("\ntest 3: timeout() tracks the next deadline, and idle wheels report None")
+    clock = _Clock()
+    wheel = TimerWheel(clock=clock)
+    assert wheel.timeout() is None
+
+    wheel.call_later(5, lambda: None)
+    wheel.call_later(1000, lambda: None)
+    assert 0 < wheel.timeout() <= 5
+
+    clock.now += 5
+    assert wheel.timeout() == 0 and wheel.poll() == 1
+    assert 0 < wheel.timeout() <= 995
+
+    print("\ntest 4: tens of thousands of timers, scheduled and cancelled")
+    clock = _Clock()
+    wheel = TimerWheel(clock=clock)
+
+    start  = time.perf_counter()
+    timers = [wheel.call_later(rng.uniform(0, 600), lambda: None) for _ in range(50000)]
+    for timer in timers:
+        timer.cancel()
+    elapsed = time.perf_counter() - start
+
+    assert len(wheel) == 0 and wheel.timeout() is None
+    print(f"    {elapsed / len(timers) * 1e6:.2f} usec per schedule + cancel")
+
+    print("\nall tests successful!")
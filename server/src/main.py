@@ -4,11 +4,40 @@ import sys
 import getopt
 import traceback
 
-import _server
+from functools import partial
 
-DEFAULT_PORT     = 1337
-DEFAULT_PLAYERS  = 4
-DEFAULT_PASSWORD = None
+import _server
+import _aioserver
+import _supervisor
+import _api
+import _debug
+import _metrics
+import _snapshot
+
+DEFAULT_PORT        = 1337
+DEFAULT_PLAYERS     = 4
+DEFAULT_PASSWORD    = None
+DEFAULT_HIGH_WATER  = _api.HIGH_WATER
+DEFAULT_LOBBIES     = 1
+DEFAULT_MAX_LOBBIES = _server.MAX_SESSIONS
+DEFAULT_WORKERS     = 0
+DEFAULT_BACKEND     = 'epoll'
+DEFAULT_LOG_LEVEL   = 'debug'
+DEFAULT_METRICS     = None
+DEFAULT_ADMIN_SOCK  = None
+DEFAULT_MAX_QUEUED  = _server.MAX_QUEUED
+DEFAULT_TICK_OPS    = _server.OPS_PER_TICK
+DEFAULT_RATE        = 0
+DEFAULT_BURST       = None
+DEFAULT_IDLE        = _server.IDLE_TIMEOUT
+DEFAULT_SNAPSHOT    = None
+DEFAULT_JOURNAL     = None
+
+BACKENDS = {
+    'epoll':    _server.run,
+    'epoll-et': partial(_server.run, edge=True),
+    'asyncio':  _aioserver.run,
+}
 
 LADDR = '0.0.0.0'
 
@@ -22,15 +51,47 @@ usage = (
     f"    -p  --port PORT :: specify port to listen on (default {DEFAULT_PORT})\n"
     f"    -n  --players PLAYERS :: number of players in game (default {DEFAULT_PLAYERS})\n"
     f"    -P  --password PASSWORD :: lobby password (default {DEFAULT_PASSWORD})\n"
+    f"    -H  --high-water BYTES :: disconnect clients with more than this much unsent output (default {DEFAULT_HIGH_WATER})\n"
+    f"    -l  --lobbies LOBBIES :: number of lobbies to open at startup (default {DEFAULT_LOBBIES})\n"
+    f"    -m  --max-lobbies LOBBIES :: most lobbies and games this process will host at once (default {DEFAULT_MAX_LOBBIES})\n"
+    f"    -w  --workers WORKERS :: fork this many worker processes sharing the port, 0 to serve from this one (default {DEFAULT_WORKERS})\n"
+    f"    -b  --backend BACKEND :: server loop to run, one of {', '.join(BACKENDS)} (default {DEFAULT_BACKEND})\n"
+    f"    -L  --log-level LEVEL :: least important output to print, one of {', '.join(_k.lower() for _k in _debug.LEVEL._keys)} (default {DEFAULT_LOG_LEVEL})\n"
+    "        --log-buffered :: write output from a background thread instead of inline\n"
+    f"    -M  --metrics-file PATH :: write prometheus metrics here every {_metrics.EXPORT_INTERVAL}s (default {DEFAULT_METRICS})\n"
+    f"    -A  --admin-socket PATH :: serve prometheus metrics to anyone connecting to this unix socket (default {DEFAULT_ADMIN_SOCK})\n"
+    f"    -q  --max-queued OPS :: stop reading from a client with this many ops waiting (default {DEFAULT_MAX_QUEUED})\n"
+    f"    -t  --tick-ops OPS :: most ops to dispatch per loop iteration, across all clients (default {DEFAULT_TICK_OPS})\n"
+    f"    -r  --rate OPS :: ops per second each client may send, 0 for no limit (default {DEFAULT_RATE})\n"
+    f"        --burst OPS :: ops each client may send at once before the rate limit kicks in (default the same as the rate)\n"
+    f"    -i  --idle-timeout SECS :: disconnect clients which send nothing for this long, 0 to never (default {DEFAULT_IDLE})\n"
+    f"    -S  --snapshot PATH :: snapshot every lobby and game here every {_snapshot.SNAPSHOT_INTERVAL}s, and pick them back up from it at startup (default {DEFAULT_SNAPSHOT})\n"
+    f"    -J  --journal PATH :: record everything clients do here, to play back with replay.py (default {DEFAULT_JOURNAL})\n"
 )
 
 def main():
-    lport    = DEFAULT_PORT
-    players  = DEFAULT_PLAYERS
-    password = DEFAULT_PASSWORD
+    lport       = DEFAULT_PORT
+    players     = DEFAULT_PLAYERS
+    password    = DEFAULT_PASSWORD
+    high_water  = DEFAULT_HIGH_WATER
+    lobbies     = DEFAULT_LOBBIES
+    max_lobbies = DEFAULT_MAX_LOBBIES
+    workers     = DEFAULT_WORKERS
+    backend     = DEFAULT_BACKEND
+    log_level   = DEFAULT_LOG_LEVEL
+    buffered    = False
+    metrics     = DEFAULT_METRICS
+    admin_sock  = DEFAULT_ADMIN_SOCK
+    max_queued  = DEFAULT_MAX_QUEUED
+    tick_ops    = DEFAULT_TICK_OPS
+    rate        = DEFAULT_RATE
+    burst       = DEFAULT_BURST
+    idle        = DEFAULT_IDLE
+    snapshot    = DEFAULT_SNAPSHOT
+    journal     = DEFAULT_JOURNAL
 
     try:
-        optarg, argv = getopt.getopt(sys.argv[1:], 'hp:n:P:', ("help", "port=", "players=", "password="))
+        optarg, argv = getopt.getopt(sys.argv[1:], 'hp:n:P:H:l:m:w:b:L:M:A:q:t:r:i:S:J:', ("help", "port=", "players=", "password=", "high-water=", "lobbies=", "max-lobbies=", "workers=", "backend=", "log-level=", "log-buffered", "metrics-file=", "admin-socket=", "max-queued=", "tick-ops=", "rate=", "burst=", "idle-timeout=", "snapshot=", "journal="))
     except getopt.GetoptError as e:
         eprint(f'{e}\n{usage}')
         return 1
@@ -49,18 +110,83 @@ def main():
                 lport = int(arg)
 
             elif opt in ('-n', '--players'):
-                playern = int(arg)
+                players = int(arg)
 
             elif opt in ('-P', '--password'):
                 password = arg
 
+            elif opt in ('-H', '--high-water'):
+                high_water = int(arg)
+
+            elif opt in ('-l', '--lobbies'):
+                lobbies = int(arg)
+
+            elif opt in ('-m', '--max-lobbies'):
+                max_lobbies = int(arg)
+
+            elif opt in ('-w', '--workers'):
+                workers = int(arg)
+
+            elif opt in ('-b', '--backend'):
+                if arg not in BACKENDS:
+                    raise ValueError(f"unknown backend {arg}")
+
+                backend = arg
+
+            elif opt in ('-L', '--log-level'):
+                if arg.upper() not in _debug.LEVEL._keys:
+                    raise ValueError(f"unknown log level {arg}")
+
+                log_level = arg
+
+            elif opt == '--log-buffered':
+                buffered = True
+
+            elif opt in ('-M', '--metrics-file'):
+                metrics = arg
+
+            elif opt in ('-A', '--admin-socket'):
+                admin_sock = arg
+
+            elif opt in ('-q', '--max-queued'):
+                max_queued = int(arg)
+
+            elif opt in ('-t', '--tick-ops'):
+                tick_ops = int(arg)
+
+            elif opt in ('-r', '--rate'):
+                rate = float(arg)
+
+            elif opt == '--burst':
+                burst = int(arg)
+
+            elif opt in ('-i', '--idle-timeout'):
+                idle = float(arg)
+
+            elif opt in ('-S', '--snapshot'):
+                snapshot = arg
+
+            elif opt in ('-J', '--journal'):
+                journal = arg
+
     except Exception as e:
         eprint(e)
         return 1
 
+    if max_queued < 1 or tick_ops < 1 or rate < 0 or (burst is not None and burst < 1) or idle < 0:
+        eprint("queue sizes, tick ops, and burst must be at least 1, and rate and idle timeout can't be negative")
+        return 1
+
+    _debug.set_level(getattr(_debug.LEVEL, log_level.upper()))
+    if buffered:
+        _debug.set_sink(buffered=True)
+
     # start game server and run until completion
     try:
-        _server.run(players, password, (LADDR, lport))
+        if workers > 0:
+            _supervisor.run(workers, BACKENDS[backend], players, password, (LADDR, lport), high_water, lobbies, max_lobbies, metrics, admin_sock, max_queued, tick_ops, rate or None, burst, idle or None, snapshot, journal)
+        else:
+            BACKENDS[backend](players, password, (LADDR, lport), high_water, lobbies, max_lobbies, metrics, admin_sock, max_queued, tick_ops, rate or None, burst, idle or None, snapshot, journal)
     except Exception as e:
         eprint(f"\n[!!!] Fatal unexpected {type(e).__name__}")
         traceback.print_exc(file=sys.stderr)
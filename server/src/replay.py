@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import sys
+import getopt
+import traceback
+
+import _debug
+import _journal
+
+DEFAULT_LOG_LEVEL = 'error'
+DEFAULT_TOP       = 20
+
+def eprint(*argv):
+    print(*argv, file=sys.stderr)
+
+usage = (
+    "usage: replay [options] JOURNAL\n"
+    "\n"
+    "play a journal recorded with server -J back through the engine as fast as it goes, and report how long the\n"
+    "handlers took over it\n"
+    "\n"
+    "    -h  --help :: this\n"
+    f"    -L  --log-level LEVEL :: least important output to print, one of {', '.join(_k.lower() for _k in _debug.LEVEL._keys)} (default {DEFAULT_LOG_LEVEL})\n"
+    "    -p  --profile :: run under cProfile, and print where the time went\n"
+    f"    -n  --top N :: how many ops, or functions with --profile, to list (default {DEFAULT_TOP})\n"
+)
+
+# the slowest ops by total time spent in their handlers, from the engine's metrics
+def print_ops(engine, top):
+    ops = sorted(engine.metrics.ops.items(), key=lambda _o: _o[1].sum, reverse=True)
+
+    print(f"\n{'op':24} {'count':>10} {'total ms':>10} {'mean us':>10}")
+    for name, histogram in ops[:top]:
+        count = histogram.count()
+        print(f"{name:24} {count:>10} {histogram.sum * 1e3:>10.1f} {histogram.sum / count * 1e6:>10.2f}")
+
+def main():
+    log_level = DEFAULT_LOG_LEVEL
+    profile   = False
+    top       = DEFAULT_TOP
+
+    try:
+        optarg, argv = getopt.getopt(sys.argv[1:], 'hL:pn:', ("help", "log-level=", "profile", "top="))
+    except getopt.GetoptError as e:
+        eprint(f'{e}\n{usage}')
+        return 1
+
+    if len(argv) != 1:
+        eprint(usage)
+        return 1
+
+    try:
+        for opt, arg in optarg:
+            if opt in ('-h', '--help'):
+                print(usage)
+                return 0
+
+            elif opt in ('-L', '--log-level'):
+                log_level = arg
+
+            elif opt in ('-p', '--profile'):
+                profile = True
+
+            elif opt in ('-n', '--top'):
+                top = int(arg)
+
+    except Exception as e:
+        eprint(e)
+        return 1
+
+    _debug.set_level(getattr(_debug.LEVEL, log_level.upper()))
+
+    try:
+        if profile:
+            import cProfile
+            import pstats
+
+            profiler = cProfile.Profile()
+            engine, stats = profiler.runcall(_journal.replay, argv[0])
+        else:
+            engine, stats = _journal.replay(argv[0])
+
+    except Exception as e:
+        eprint(f"\n[!!!] {type(e).__name__} while replaying")
+        traceback.print_exc(file=sys.stderr)
+        return 1
+
+    print(
+        f"{stats['records']} records, {stats['ops']} ops in {stats['seconds']:.3f}s, "
+        f"{stats['ops'] / max(stats['seconds'], 1e-9):.0f} ops/s"
+    )
+    print(f"{len(engine.sessions)} sessions and {len(engine.conns)} connections at the end")
+
+    if stats['diverged']:
+        eprint(f"[!] {stats['diverged']} records didn't go the way they did when recorded")
+
+    print_ops(engine, top)
+
+    if profile:
+        print()
+        pstats.Stats(profiler).sort_stats('tottime').print_stats(top)
+
+    return 1 if stats['diverged'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())